@@ -0,0 +1,847 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks, run from a source checkout: they import the package modules
+and the stub servers of the tests from their directories.
+
+Usage: python bench.py [name ...] [--latency SEC] [--save FILE]
+                       [--compare FILE [--threshold FRACTION]]
+Without names runs all benchmarks. --latency sets the response delay of the
+stub providers. --save writes the results to a JSON baseline, --compare
+reports the results worse than the baseline by more than the threshold
+(default 10%) and exits with 1 if there is any.
+"""
+
+import asyncio
+import concurrent.futures as cf
+import contextlib
+import io
+import ipaddress
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+BENCHMARKS = {}
+
+ANONYMIZE_ADDRESSES = 200000
+ANONYMIZE_DISTINCT = 20000
+ANONYMIZE_KEY = bytes(range(32))
+ANONYMIZE_MB = 16
+COLLECTOR_AGENTS = 4
+COLLECTOR_REPORTS = 500000
+COLLECTOR_PER_DATAGRAM = 30
+COLLECTOR_UDP_RATE = 150000  # reports per second, all agents
+FLEET_HOSTS = 200
+FLEET_RATE = 100
+FLEET_BURST = 10
+FLEET_WINDOW = 2.0
+GUI_ROWS = 5000
+GUI_CHANGES = 50
+HISTORY_RECORDS = 1000000
+IFSTATS_INTERFACES = 500
+IPAM_PREFIXES = 1000000
+IPAM_QUERIES = 10000
+IFSTATS_ACTIVE = 50
+PRIVATE_IP_CALLS = 1000
+PROXY_CALLS = 100
+PROXY_LATENCY = 0.01  # of the CONNECT, to a remote proxy
+PUBLIC_IP_CALLS = 200
+QUORUM_CALLS = 50
+# Provider latencies, the quorum of shared.QUORUM waits for the second
+QUORUM_LATENCIES = [0.01, 0.02, 0.04, 0.08, 0.3]
+RESOLVE_NAMES = 20000
+RESOLVE_THREADS = 64
+RESOLVE_LATENCY = 0.02  # round trip to a recursive resolver
+HISTORY_QUERIES = 1000
+NAT_LATENCY = 0.02
+PEER_SOCKETS = 1000000
+ROUTES = 100000
+ROUTE_LOOKUPS = 100000
+SCAN_MB = 64
+SNAPSHOT_ROUTES = 100000
+SNAPSHOT_CHANGES = 1000
+STARTUP_RUNS = 5
+STUB_LATENCY = 0.0
+THRESHOLD = 0.1
+# Result keys where higher is better, lower is better for the others
+HIGHER_IS_BETTER = ('_per_s', '_mb_s', '_received')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The package modules, imported by their names like in the package, and
+# the stub servers of the tests
+PACKAGE_DIR = os.path.join(ROOT, 'ipaddresses')
+TEST_DIR = os.path.join(ROOT, 'test')
+sys.path[:0] = [PACKAGE_DIR, TEST_DIR]
+
+
+def benchmark(func):
+    """Register a benchmark function."""
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+
+def best_of(func, *args, repeat=3):
+    """Return the best wall time of repeat calls to func."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_ip(rnd):
+    """Return a random IPv4 or IPv6 address."""
+    if rnd.random() < 0.8:
+        return '.'.join(str(rnd.randrange(256)) for _ in range(4))
+    return '2001:db8::' + format(rnd.randrange(0x10000), 'x')
+
+
+def write_log(f_out, size_mb, seed=0):
+    """Write a synthetic access log of about size_mb MB."""
+    rnd = random.Random(seed)
+    addresses = [random_ip(rnd) for _ in range(10000)]
+    lines = [f'2015-05-14 12:00:{i % 60:02d} {rnd.choice(addresses)} '
+             f'GET /index.html 200 {rnd.randrange(10000)} '
+             f'via {rnd.choice(addresses)}\n'.encode('ascii')
+             for i in range(10000)]
+    block = b''.join(lines)
+    for _ in range(size_mb * 1024 * 1024 // len(block) + 1):
+        f_out.write(block)
+
+
+def read_all(path):
+    """Read a file sequentially, to compare with disk bandwidth."""
+    buf = bytearray(1024 * 1024)
+    with open(path, 'rb', buffering=0) as f_in:
+        while f_in.readinto(buf):
+            pass
+
+
+@benchmark
+def bench_scan():
+    """Scan throughput compared to a plain sequential read."""
+    import scan
+    with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f_out:
+        write_log(f_out, SCAN_MB)
+    try:
+        size_mb = os.path.getsize(f_out.name) / 1024 / 1024
+        read_time = best_of(read_all, f_out.name)
+        scan_time = best_of(scan.scan_files, [f_out.name])
+    finally:
+        os.remove(f_out.name)
+    return {'read_mb_s': size_mb / read_time,
+            'scan_mb_s': size_mb / scan_time,
+            'scan_seconds': scan_time}
+
+
+@benchmark
+def bench_anonymize():
+    """Anonymized addresses per second, cold and memoized, and stream MB/s."""
+    import anonymize
+    rnd = random.Random(0)
+    distinct = [ipaddress.ip_address(random_ip(rnd)).packed
+                for _ in range(ANONYMIZE_DISTINCT)]
+    packed = [rnd.choice(distinct) for _ in range(ANONYMIZE_ADDRESSES)]
+    anonymizer = anonymize.Anonymizer(ANONYMIZE_KEY)
+
+    def run(addresses):
+        for address in addresses:
+            anonymizer.anonymize_packed(address)
+
+    cold_time = best_of(run, distinct, repeat=1)
+    warm_time = best_of(run, packed)
+
+    data = io.BytesIO()
+    write_log(data, ANONYMIZE_MB)
+    size_mb = len(data.getvalue()) / 1024 / 1024
+
+    def stream():
+        data.seek(0)
+        anonymize.anonymize_stream(ANONYMIZE_KEY, data, io.BytesIO())
+
+    stream_time = best_of(stream)
+    return {'cold_per_s': len(distinct) / cold_time,
+            'memoized_per_s': len(packed) / warm_time,
+            'stream_mb_s': size_mb / stream_time}
+
+
+@benchmark
+def bench_history():
+    """Point in time queries on a million record history."""
+    import history
+    rnd = random.Random(0)
+    with tempfile.NamedTemporaryFile(suffix='.log', delete=False) as f_out:
+        for i in range(HISTORY_RECORDS):
+            f_out.write(history.RECORD.pack(
+                i * 60 * 1000000, *history.pack_ip(random_ip(rnd)),
+                *history.pack_ip(random_ip(rnd))))
+    try:
+        start = time.perf_counter()
+        with history.History(f_out.name) as log:
+            open_time = time.perf_counter() - start
+            times = [rnd.randrange(HISTORY_RECORDS * 60)
+                     for _ in range(HISTORY_QUERIES)]
+
+            def run():
+                for timestamp in times:
+                    log.at(timestamp)
+
+            query_time = best_of(run)
+    finally:
+        os.remove(f_out.name)
+        os.remove(f_out.name + history.INDEX_SUFFIX)
+    return {'index_seconds': open_time,
+            'query_ms': query_time / len(times) * 1000}
+
+
+@benchmark
+def bench_ipam():
+    """Index of a million allocated prefixes in 10/8, next free /24 and
+    next 100 free /29 queries."""
+    import ipam
+    rnd = random.Random(0)
+    prefixes = [f'{ipaddress.IPv4Address(0x0a000000 + rnd.getrandbits(24))}'
+                f'/{rnd.randrange(26, 33)}' for _ in range(IPAM_PREFIXES)]
+    start = time.perf_counter()
+    indexes = ipam.build(prefixes)
+    build_time = time.perf_counter() - start
+    within = ['10.0.0.0/8']
+    ipam.find_free(indexes, 29, within)  # running totals, once per size
+    start = time.perf_counter()
+    for _ in range(IPAM_QUERIES):
+        ipam.find_free(indexes, 24, within)
+    query_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(IPAM_QUERIES // 100):
+        ipam.find_free(indexes, 29, within, 100)
+    blocks_time = time.perf_counter() - start
+    return {'build_seconds': build_time,
+            'queries_per_s': IPAM_QUERIES / query_time,
+            'blocks_per_s': IPAM_QUERIES / blocks_time}
+
+
+def write_proc_tcp(f_out, sockets, seed=0):
+    """Write a synthetic /proc/net/tcp file."""
+    rnd = random.Random(seed)
+    remotes = [f'{rnd.getrandbits(32):08X}' for _ in range(10000)]
+    f_out.write(b'  sl  local_address rem_address   st tx_queue rx_queue tr '
+                b'tm->when retrnsmt   uid  timeout inode\n')
+    for i in range(sockets):
+        f_out.write(f'{i:>4}: 0200C0C0:01BB {rnd.choice(remotes)}:'
+                    f'{rnd.randrange(65536):04X} 01 00000000:00000000 '
+                    f'00:00000000 00000000     0        0 {i} 1 '
+                    f'0000000000000000 20 4 30 10 -1\n'.encode('ascii'))
+
+
+def write_net_dev(path, step, interfaces=IFSTATS_INTERFACES,
+                  active=IFSTATS_ACTIVE):
+    """Write a /proc/net/dev of interfaces, the first active ones moving
+    traffic, at a sampling step."""
+    lines = ['Inter-|   Receive                                         '
+             '       |  Transmit\n',
+             ' face |bytes    packets errs drop fifo frame compressed '
+             'multicast|bytes    packets errs drop fifo colls carrier '
+             'compressed\n']
+    for i in range(interfaces):
+        rx_bytes = 123456789 + (step * 1500 * (i + 1) if i < active else 0)
+        tx_bytes = 98765432 + (step * 900 * (i + 1) if i < active else 0)
+        lines.append(f'{"veth" + str(i):>6}: {rx_bytes:>7} 2035276    0    0'
+                     f'    0     0          0         0 {tx_bytes:>8} '
+                     f'2035276    0    0    0     0       0          0\n')
+    with open(path, 'w', encoding='ascii') as f_out:
+        f_out.writelines(lines)
+
+
+@benchmark
+def bench_ifstats():
+    """CPU time of the interface sampler at its default rate, sampling and
+    reporting once a second."""
+    import ifstats
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dev')
+        write_net_dev(path, 0)
+        sampler = ifstats.Sampler(path=path)
+        steps = int(ifstats.RATE * ifstats.WINDOW) * 2
+        sample_time = 0.0
+        for step in range(steps):
+            write_net_dev(path, step)
+            start = time.process_time()
+            sampler.sample(step / ifstats.RATE)
+            sample_time += time.process_time() - start
+        start = time.process_time()
+        for _ in range(10):
+            sampler.report()
+        report_time = (time.process_time() - start) / 10
+        sampler.close()
+    sample_time /= steps
+    return {'sample_ms': sample_time * 1000,
+            'report_ms': report_time * 1000,
+            'cpu_percent': (sample_time * ifstats.RATE +
+                            report_time / ifstats.REPORT_INTERVAL) * 100}
+
+
+@benchmark
+def bench_gui():
+    """Interface table update of a few changed rows out of thousands, and
+    its frame times if there is a display."""
+    # Imported here, tkinter may be missing
+    import gui_tk_func
+    # The first changes rows with another prefix length
+    rows, changed = [gui_tk_func.interface_rows({
+        f'veth{i}': [ipaddress.ip_interface(
+            (0x0a000000 + i * 256 + 1, 16 if i < changes else 24))]
+        for i in range(GUI_ROWS)}) for changes in [0, GUI_CHANGES]]
+    model = gui_tk_func.TableModel()
+    model.update(rows)
+    start = time.perf_counter()
+    for i in range(10):
+        edits = model.update(changed if i % 2 == 0 else rows)
+    result = {'update_ms': (time.perf_counter() - start) / 10 * 1000,
+              'update_edits': len(edits)}
+    try:
+        root = gui_tk_func.tk.Tk()
+    except gui_tk_func.tk.TclError:  # no display
+        return result
+    status = gui_tk_func.tk.StringVar(root)
+    table = gui_tk_func.InterfaceTable(root, status)
+    table.update(rows)
+    for i in range(10):
+        table.update(changed if i % 2 == 0 else rows)
+    while table.pending:
+        root.update()
+    root.destroy()
+    times = sorted(table.frame_times)
+    result['frame_p95_ms'] = times[int(len(times) * 0.95)] * 1000
+    result['frame_max_ms'] = times[-1] * 1000
+    return result
+
+
+@benchmark
+def bench_nat():
+    """Seconds of the NAT diagnostic against a stub STUN server answering
+    after NAT_LATENCY, behind an open and a symmetric emulated NAT."""
+    import nat
+    import stubs
+    results = {}
+    for name, behaviour in [('open', nat.ENDPOINT_INDEPENDENT),
+                            ('symmetric', nat.ADDRESS_PORT_DEPENDENT)]:
+        with stubs.StunServer(nat=(behaviour, behaviour, 60),
+                              latency=NAT_LATENCY) as server:
+            start = time.perf_counter()
+            result = asyncio.run(nat.diagnose(*server.address))
+            results[f'{name}_seconds'] = time.perf_counter() - start
+        if result['mapping'] != behaviour or \
+                result['filtering'] != behaviour:
+            raise RuntimeError(f'{name}: wrong diagnostic {result}')
+    return results
+
+
+@benchmark
+def bench_peers():
+    """Seconds and peak memory to read a million sockets."""
+    import peers
+    with tempfile.NamedTemporaryFile(suffix='.tcp', delete=False) as f_out:
+        write_proc_tcp(f_out, PEER_SOCKETS)
+    try:
+        reader = peers.PeerReader([f_out.name])
+        cold_time = best_of(reader.read, repeat=1)
+        warm_time = best_of(reader.read)
+        tracemalloc.start()
+        reader.read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        os.remove(f_out.name)
+    return {'cold_seconds': cold_time,
+            'warm_seconds': warm_time,
+            'peak_mb': peak / 1024 / 1024}
+
+
+@benchmark
+def bench_routes():
+    """Source address lookups per second on a large routing table."""
+    import routes
+    rnd = random.Random(0)
+    table = [routes.Route(ipaddress.ip_network('0.0.0.0/0'),
+                          ipaddress.ip_address('192.0.2.1'), 'eth0', 0)]
+    for i in range(ROUTES):
+        prefixlen = rnd.randrange(8, 33)
+        network = ipaddress.ip_network((rnd.getrandbits(32), prefixlen),
+                                       strict=False)
+        table.append(routes.Route(network, None, f'eth{i % 100}', 0))
+    interface_ips = {f'eth{i}': [ipaddress.ip_interface(f'192.0.{i}.2/24')]
+                     for i in range(100)}
+
+    start = time.perf_counter()
+    snapshot = routes.RoutingSnapshot(table, interface_ips)
+    load_time = time.perf_counter() - start
+
+    destinations = [random_ip(rnd) for _ in range(ROUTE_LOOKUPS)]
+    lookup_time = best_of(snapshot.sources, destinations)
+    return {'load_seconds': load_time,
+            'lookups_per_s': len(destinations) / lookup_time}
+
+
+def write_proc_route(path, count, changes=0, seed=0):
+    """Write a /proc/net/route of count random routes, the first changes
+    ones through another gateway."""
+    rnd = random.Random(seed)
+    lines = ['Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\t'
+             'Mask\t\tMTU\tWindow\tIRTT\n']
+    for i in range(count):
+        prefixlen = rnd.randrange(8, 33)
+        mask = (0xffffffff << (32 - prefixlen)) & 0xffffffff
+        network = rnd.getrandbits(32) & mask
+        # Little endian hex, as the kernel writes them
+        destination = network.to_bytes(4, 'little').hex().upper()
+        gateway = rnd.getrandbits(32) ^ (i < changes)
+        gateway = gateway.to_bytes(4, 'little').hex().upper()
+        mask = mask.to_bytes(4, 'little').hex().upper()
+        lines.append(f'eth{i % 100}\t{destination}\t{gateway}\t0003\t0\t0\t'
+                     f'0\t{mask}\t0\t0\t0\n')
+    with open(path, 'w', encoding='ascii') as f_out:
+        f_out.writelines(lines)
+
+
+@benchmark
+def bench_snapshot():
+    """Capture, size, load and diff of snapshots of a large routing table
+    with a few changed routes."""
+    import snapshot
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ['old', 'new']]
+        write_proc_route(paths[0], SNAPSHOT_ROUTES)
+        write_proc_route(paths[1], SNAPSHOT_ROUTES, SNAPSHOT_CHANGES)
+        missing = os.path.join(directory, 'missing')
+        old, new = [snapshot.capture(False, path, missing, missing)
+                    for path in paths]
+        capture_time = best_of(snapshot.capture, False, paths[0], missing,
+                               missing)
+    data = snapshot.dumps(new)
+    load_time = best_of(snapshot.loads, data)
+    diff_time = best_of(snapshot.diff, old, new)
+    return {'capture_seconds': capture_time,
+            'size_bytes': len(data),
+            'load_lines_per_s': len(new) / load_time,
+            'diff_seconds': diff_time}
+
+
+@benchmark
+def bench_fleet():
+    """A fleet fetching at the same time from a rate limited provider,
+    without and with start offsets."""
+    import stubs
+    results = {}
+    for name, window in [('burst', 0.0), ('splay', FLEET_WINDOW)]:
+        with stubs.StubProvider(FLEET_RATE, FLEET_BURST) as server:
+            failures, seconds = stubs.run_fleet(server.url, FLEET_HOSTS,
+                                                window)
+        results[f'{name}_throttled'] = server.stats['throttled']
+        results[f'{name}_failed'] = len(failures)
+        results[f'{name}_seconds'] = seconds
+    return results
+
+
+def send_reports(port, count, seed, tcp):
+    """Simulated agent (or reflector) of 10000 hosts, 1% of the reports
+    change a public IP: send count binary reports to a collector.
+
+    Return the time the sending started.
+    """
+    import collector
+    rnd = random.Random(seed)
+    publics = [f'203.0.{seed}.{i % 256}' for i in range(10000)]
+    records = []
+    for i in range(count):
+        if rnd.random() < 0.01:
+            publics[i % 10000] = f'198.51.100.{rnd.randrange(256)}'
+        records.append(collector.encode_binary(
+            f'host{seed}-{i % 10000}', f'10.{seed}.{i % 250}.{i % 200 + 1}',
+            publics[i % 10000]))
+    start = time.time()
+    if tcp:
+        with socket.create_connection(('127.0.0.1', port)) as sock:
+            sock.sendall(b''.join(records))
+        return start
+    # UDP has no flow control, pace the datagrams
+    rate = COLLECTOR_UDP_RATE / COLLECTOR_AGENTS
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for i in range(0, count, COLLECTOR_PER_DATAGRAM):
+            sock.sendto(b''.join(records[i:i + COLLECTOR_PER_DATAGRAM]),
+                        ('127.0.0.1', port))
+            delay = start + i / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+    return start
+
+
+@benchmark
+def bench_collector():
+    """Reports per second received from agent processes and stored."""
+    import collector
+    results = {}
+    for name, tcp in [('tcp', True), ('udp', False)]:
+        path = tempfile.mktemp(suffix='.db')
+        server = collector.Collector(collector.Store(path))
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(server.serve('127.0.0.1', 0))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        server.ready.wait()
+        per_agent = COLLECTOR_REPORTS // COLLECTOR_AGENTS
+        with cf.ProcessPoolExecutor(COLLECTOR_AGENTS) as executor:
+            starts = list(executor.map(
+                send_reports, [server.port] * COLLECTOR_AGENTS,
+                [per_agent] * COLLECTOR_AGENTS, range(COLLECTOR_AGENTS),
+                [tcp] * COLLECTOR_AGENTS))
+        sent = per_agent * COLLECTOR_AGENTS
+        # Lost datagrams are not waited for
+        received = -1
+        while received < server.stats['reports'] < sent:
+            received = server.stats['reports']
+            time.sleep(0.1)
+        loop.call_soon_threadsafe(task.cancel)
+        server.close()
+        seconds = time.time() - min(starts)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        results[f'{name}_reports_per_s'] = server.stats['reports'] / seconds
+        results[f'{name}_received'] = server.stats['reports'] / sent
+        results[f'{name}_stored'] = server.stats['changes']
+    return results
+
+
+def percentiles(times):
+    """Return the median and 99th percentile of times in milliseconds."""
+    times = sorted(times)
+    return (times[len(times) // 2] * 1000,
+            times[min(len(times) - 1, int(len(times) * 0.99))] * 1000)
+
+
+@benchmark
+def bench_private_ip():
+    """get_private_ip and get_interface_ips calls per second."""
+    import shared
+
+    def run(func):
+        for _ in range(PRIVATE_IP_CALLS):
+            func()
+
+    return {'private_ip_per_s': PRIVATE_IP_CALLS / best_of(
+                run, shared.get_private_ip),
+            'interface_ips_per_s': PRIVATE_IP_CALLS / best_of(
+                run, shared.get_interface_ips)}
+
+
+@benchmark
+def bench_public_ip():
+    """get_public_ip latency against local HTTP and HTTPS providers."""
+    import ratelimit
+    import shared
+    import stubs
+    results = {}
+    # Not rate limited
+    bucket = ratelimit.TokenBucket(1e9, 1e9)
+    old_cert_file = os.environ.get('SSL_CERT_FILE')
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = stubs.make_certificate(directory)
+        # Trusted by the default context of urllib
+        os.environ['SSL_CERT_FILE'] = certfile
+        try:
+            for name, cert in [('http', None), ('https', certfile)]:
+                times = []
+                with stubs.StubProvider(latency=STUB_LATENCY,
+                                        certfile=cert) as server:
+                    for _ in range(PUBLIC_IP_CALLS):
+                        start = time.perf_counter()
+                        shared.get_public_ip(server.url, bucket=bucket)
+                        times.append(time.perf_counter() - start)
+                median, p99 = percentiles(times)
+                results[f'{name}_median_ms'] = median
+                results[f'{name}_p99_ms'] = p99
+        finally:
+            if old_cert_file is None:
+                del os.environ['SSL_CERT_FILE']
+            else:
+                os.environ['SSL_CERT_FILE'] = old_cert_file
+    return results
+
+
+@benchmark
+def bench_proxy():
+    """Public IP fetch latency through a local proxy, over pooled
+    connections or a new one per call, to HTTP (absolute URI) and HTTPS
+    (CONNECT tunnel) providers."""
+    import proxy
+    import shared
+    import stubs
+    results = {}
+    old_cert_file = os.environ.get('SSL_CERT_FILE')
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = stubs.make_certificate(directory)
+        os.environ['SSL_CERT_FILE'] = certfile
+        try:
+            for name, cert in [('http', None), ('https', certfile)]:
+                with stubs.StubProvider(latency=STUB_LATENCY,
+                                        certfile=cert) as server, \
+                        stubs.StubProxy(latency=PROXY_LATENCY) as stub_proxy:
+                    for pool_name, size in [('pooled', proxy.POOL_SIZE),
+                                            ('new', 0)]:
+                        pool = proxy.TunnelPool(size)
+                        times = []
+                        for _ in range(PROXY_CALLS):
+                            start = time.perf_counter()
+                            with proxy.urlopen(server.url, stub_proxy.url,
+                                               shared.PUBLIC_IP_TIMEOUT,
+                                               pool) as response:
+                                shared.read_address(
+                                    response,
+                                    start + shared.PUBLIC_IP_TIMEOUT)
+                            times.append(time.perf_counter() - start)
+                        pool.close()
+                        median, p99 = percentiles(times)
+                        results[f'{name}_{pool_name}_median_ms'] = median
+                        results[f'{name}_{pool_name}_p99_ms'] = p99
+        finally:
+            if old_cert_file is None:
+                del os.environ['SSL_CERT_FILE']
+            else:
+                os.environ['SSL_CERT_FILE'] = old_cert_file
+    return results
+
+
+@benchmark
+def bench_quorum():
+    """Public IP latency with a quorum of m providers, next to the latency
+    of the m-th fastest provider alone and of waiting for every
+    provider."""
+    import ratelimit
+    import shared
+    import stubs
+    bucket = ratelimit.TokenBucket(1e9, 1e9)
+
+    def fetch(url):
+        return shared.get_public_ip(url, bucket=bucket)
+
+    results = {}
+    with contextlib.ExitStack() as stack:
+        urls = [stack.enter_context(
+            stubs.StubProvider(latency=latency)).url
+                for latency in QUORUM_LATENCIES]
+        for name, func in [
+                ('quorum', lambda: shared.get_public_ip_quorum(
+                    urls, shared.QUORUM, fetch=fetch)),
+                ('mth_fastest', lambda: fetch(
+                    urls[shared.QUORUM - 1])),
+                ('every_provider', lambda: shared.get_public_ip_quorum(
+                    urls, len(urls), fetch=fetch))]:
+            times = []
+            for _ in range(QUORUM_CALLS):
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+            results[f'{name}_median_ms'], results[f'{name}_p99_ms'] = \
+                percentiles(times)
+    return results
+
+
+def blocking_resolve(port, name):
+    """Resolve name (A then AAAA) with blocking queries, as getaddrinfo
+    does in a thread pool."""
+    import resolver
+    addresses = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(resolver.TIMEOUT)
+        sock.connect(('127.0.0.1', port))
+        for qtype in [resolver.ddns.TYPE_A, resolver.ddns.TYPE_AAAA]:
+            sock.send(resolver.build_query(random.getrandbits(16), name,
+                                           qtype))
+            records = resolver.parse_response(sock.recv(512))[2]
+            addresses += [value for _, _, value in records]
+    return addresses
+
+
+@benchmark
+def bench_resolve():
+    """Names per second resolved from a stub resolver process answering
+    after RESOLVE_LATENCY, by a thread pool of blocking queries and by the
+    asyncio resolver, then cached, and PTR lookups per second."""
+    import resolver
+    import stubs
+    names = [f'host{i}.example.com' for i in range(RESOLVE_NAMES)]
+    receiver, sender = multiprocessing.Pipe()
+    stub = multiprocessing.Process(target=stubs.serve_dns,
+                                   args=(0, sender, RESOLVE_LATENCY),
+                                   daemon=True)
+    stub.start()
+    port = receiver.recv()
+    results = {}
+    try:
+        start = time.perf_counter()
+        with cf.ThreadPoolExecutor(RESOLVE_THREADS) as executor:
+            list(executor.map(blocking_resolve, [port] * len(names),
+                              [f'pool.{name}' for name in names]))
+        results['threads_names_per_s'] = \
+            len(names) / (time.perf_counter() - start)
+
+        async def resolve_all(res):
+            start = time.perf_counter()
+            await res.resolve_stream(names, lambda *args: None)
+            return len(names) / (time.perf_counter() - start)
+
+        async def run():
+            async with resolver.Resolver(['127.0.0.1'], port) as res:
+                results['asyncio_names_per_s'] = await resolve_all(res)
+                results['cached_names_per_s'] = await resolve_all(res)
+                results['asyncio_timeouts'] = res.stats['timeouts']
+
+        asyncio.run(run())
+        lookup = resolver.ReverseLookup(['127.0.0.1'], port)
+        start = time.perf_counter()
+        lookup.submit([f'198.51.{i // 256 % 256}.{i % 256}'
+                       for i in range(RESOLVE_NAMES)])
+        lookup.wait(resolver.REVERSE_TIMEOUT * RESOLVE_NAMES)
+        results['reverse_per_s'] = \
+            RESOLVE_NAMES / (time.perf_counter() - start)
+        lookup.close()
+    finally:
+        stub.terminate()
+    return results
+
+
+def run_python(code):
+    """Run code in a new interpreter from the package directory."""
+    subprocess.run([sys.executable, '-c', code], cwd=PACKAGE_DIR, check=True,
+                   capture_output=True)
+
+
+@benchmark
+def bench_startup():
+    """Import time of the CLI and of the messages, end-to-end run with a
+    local provider and its peak memory."""
+    import shared
+    import stubs
+    import resource  # Unix only
+    interpreter = best_of(run_python, 'pass', repeat=STARTUP_RUNS)
+    import_time = best_of(run_python, 'import cli',
+                          repeat=STARTUP_RUNS) - interpreter
+    localization_time = best_of(
+        run_python, 'import localization; localization.PRIVATE_IP',
+        repeat=STARTUP_RUNS) - interpreter
+    # Children's peak, of the largest one, 'import cli'
+    rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    import cli
+    old_url = shared.PUBLIC_IP_URL
+    with stubs.StubProvider(latency=STUB_LATENCY) as server:
+        shared.PUBLIC_IP_URL = server.url
+
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    cli.start([])
+                except SystemExit:
+                    pass
+
+        try:
+            run_time = best_of(run)
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        finally:
+            shared.PUBLIC_IP_URL = old_url
+    return {'import_seconds': import_time,
+            'localization_seconds': localization_time,
+            'import_rss_mb': rss_mb,
+            'run_seconds': run_time,
+            'run_peak_mb': peak / 1024 / 1024}
+
+
+def compare(baseline, results, threshold=THRESHOLD):
+    """Return [(key, old, new, change)] of results worse than baseline by
+    more than threshold (a fraction)."""
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        change = (new - old) / abs(old)
+        if key.endswith(HIGHER_IS_BETTER):
+            change = -change
+        if change > threshold:
+            regressions.append((key, old, new, change))
+    return regressions
+
+
+def main(args):
+    """Run benchmarks, print results, save or compare them."""
+    global STUB_LATENCY
+    options = {}
+    names = []
+    args = iter(args)
+    for arg in args:
+        if arg in ['--latency', '--save', '--compare', '--threshold']:
+            options[arg] = next(args, None)
+        else:
+            names.append(arg)
+    STUB_LATENCY = float(options.get('--latency', STUB_LATENCY))
+
+    results = {}
+    for name in names or BENCHMARKS:
+        try:
+            result = BENCHMARKS[name]()
+        except Exception as e:  # report and run the others
+            print(f'{name}: {type(e).__name__}: {e}')
+            continue
+        for key, value in result.items():
+            print(f'{name}.{key}: {value:.4f}')
+            results[f'{name}.{key}'] = value
+
+    if options.get('--save'):
+        with open(options['--save'], 'w', encoding='utf-8') as f_out:
+            json.dump({'python': sys.version, 'results': results}, f_out,
+                      indent=1, sort_keys=True)
+    if options.get('--compare'):
+        with open(options['--compare'], encoding='utf-8') as f_in:
+            baseline = json.load(f_in)['results']
+        regressions = compare(baseline, results, float(
+            options.get('--threshold', THRESHOLD)))
+        for key, old, new, change in regressions:
+            print(f'REGRESSION {key}: {old:.4f} -> {new:.4f} '
+                  f'({change:+.1%} worse)')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Public IP provider fault simulator.
+
+Runs local fake providers that answer each request with a fault drawn from
+their profile, after a log-normal latency, then runs every fetch strategy
+many times against them and reports correctness and latency percentiles.
+
+Usage: python simulate.py [strategy ...] [--runs N] [--timeout SEC]
+"""
+
+import concurrent.futures as cf
+import os
+import random
+import socket
+import socketserver
+import ssl
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import bench  # first, it finds the package modules
+import ratelimit as rl
+import shared as shrd
+import stubs
+
+TRUTH = '198.51.100.7'
+WRONG = '203.0.113.66'
+RUNS = 200
+TIMEOUT = 1.0
+WORKERS = 8
+DRIP = 0.5  # fraction of the timeout between slowloris bytes
+
+# (name, {fault: weight}, (median latency, sigma), TLS), the faults are
+# the FaultyHandler send_* methods and stall
+
+PROVIDERS = [
+    ('good', {'ok': 1}, (0.02, 0.5), False),
+    ('good_tls', {'ok': 1}, (0.03, 0.5), True),
+    ('slow_tail', {'ok': 1}, (0.05, 1.5), False),
+    ('flaky', {'ok': 6, 'reset': 1, 'http_error': 1, 'truncated': 1},
+     (0.02, 0.5), False),
+    ('liar', {'ok': 3, 'wrong': 1, 'garbage': 1}, (0.02, 0.5), False),
+    ('stalling_tls', {'ok': 3, 'stall': 1, 'slowloris': 1}, (0.02, 0.5),
+     True),
+]
+
+STRATEGIES = {}
+
+
+def strategy(func):
+    """Register a fetch strategy: func(urls) returns an address."""
+    STRATEGIES[func.__name__[len('fetch_'):]] = func
+    return func
+
+
+class FaultyProvider(socketserver.ThreadingTCPServer):
+    """Fake provider answering with faults drawn from weights."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, weights, latency, certfile=None, seed=0):
+        self.faults = list(weights)
+        self.weights = list(weights.values())
+        self.median, self.sigma = latency
+        self.context = None
+        if certfile:
+            self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.context.load_cert_chain(certfile)
+        self.rnd = random.Random(seed)
+        self.stop = threading.Event()
+        super().__init__(('127.0.0.1', 0), FaultyHandler)
+
+    @property
+    def url(self):
+        """Return the provider URL."""
+        scheme = 'https' if self.context else 'http'
+        return f'{scheme}://127.0.0.1:{self.server_address[1]}/'
+
+    def draw(self):
+        """Return (fault, latency) of a request."""
+        return (self.rnd.choices(self.faults, self.weights)[0],
+                self.median * self.rnd.lognormvariate(0, self.sigma))
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop.set()
+        self.shutdown()
+        self.server_close()
+
+
+class FaultyHandler(socketserver.BaseRequestHandler):
+    """Answers one request with a fault."""
+
+    def handle(self):
+        """Inject the fault drawn for this request."""
+        fault, latency = self.server.draw()
+        sock = self.request
+        if fault == 'stall':
+            # Before the TLS handshake for https, hold the connection
+            self.server.stop.wait(shrd.PUBLIC_IP_TIMEOUT * 4)
+            return
+        if self.server.context:
+            try:
+                sock = self.server.context.wrap_socket(sock,
+                                                       server_side=True)
+            except (OSError, ssl.SSLError):
+                return
+        try:
+            self.read_request(sock)
+            time.sleep(latency)
+            getattr(self, 'send_' + fault)(sock)
+        except OSError:  # client gave up
+            pass
+
+    @staticmethod
+    def read_request(sock):
+        """Read up to the end of the request headers."""
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionResetError
+            data += chunk
+
+    @staticmethod
+    def response(body, status='200 OK', length=None):
+        """Return an HTTP response."""
+        length = len(body) if length is None else length
+        return (f'HTTP/1.1 {status}\r\nContent-Length: {length}\r\n'
+                f'Connection: close\r\n\r\n').encode('ascii') + body
+
+    def send_ok(self, sock):
+        """Send the right address."""
+        sock.sendall(self.response(TRUTH.encode('ascii')))
+
+    def send_wrong(self, sock):
+        """Send a valid but wrong address."""
+        sock.sendall(self.response(WRONG.encode('ascii')))
+
+    def send_garbage(self, sock):
+        """Send an error page with status 200."""
+        sock.sendall(self.response(b'<html>Try again later</html>'))
+
+    def send_truncated(self, sock):
+        """Send part of the address, then close."""
+        sock.sendall(self.response(TRUTH[:6].encode('ascii'),
+                                   length=len(TRUTH)))
+
+    def send_reset(self, sock):
+        """Close with a TCP reset."""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                        struct.pack('ii', 1, 0))
+        sock.close()
+
+    def send_http_error(self, sock):
+        """Send 503."""
+        sock.sendall(self.response(b'', '503 Service Unavailable'))
+
+    def send_slowloris(self, sock):
+        """Send the address a byte at a time, each within the timeout."""
+        response = self.response(TRUTH.encode('ascii'))
+        head, body = response[:-len(TRUTH)], response[-len(TRUTH):]
+        sock.sendall(head)
+        for byte in body:
+            if self.server.stop.wait(shrd.PUBLIC_IP_TIMEOUT * DRIP):
+                return
+            sock.sendall(bytes([byte]))
+
+
+# Not rate limited
+UNLIMITED = rl.TokenBucket(1e9, 1e9)
+
+
+def fetch(url):
+    """Fetch once from url."""
+    return shrd.get_public_ip(url, attempts=1, bucket=UNLIMITED)
+
+
+@strategy
+def fetch_single(urls):
+    """The first provider only."""
+    return fetch(urls[0])
+
+
+@strategy
+def fetch_failover(urls):
+    """Each provider in turn until one answers."""
+    for url in urls[:-1]:
+        try:
+            return fetch(url)
+        except RuntimeError:
+            pass
+    return fetch(urls[-1])
+
+
+@strategy
+def fetch_race(urls):
+    """All providers at once, the first answer wins."""
+    executor = cf.ThreadPoolExecutor(len(urls))
+    futures = [executor.submit(fetch, url) for url in urls]
+    executor.shutdown(wait=False)
+    error = None
+    for future in cf.as_completed(futures):
+        try:
+            return future.result()
+        except RuntimeError as e:
+            error = e
+    raise error
+
+
+@strategy
+def fetch_quorum(urls):
+    """All providers at once, the first address QUORUM of them agree on
+    wins."""
+    return shrd.get_public_ip_quorum(urls, shrd.QUORUM, fetch=fetch)
+
+
+def run_strategy(func, urls, runs, rnd):
+    """Return the stats of runs fetches with shuffled provider orders."""
+    orders = []
+    for _ in range(runs):
+        order = list(urls)
+        rnd.shuffle(order)
+        orders.append(order)
+
+    def run(order):
+        start = time.perf_counter()
+        try:
+            result = func(order)
+        except RuntimeError:
+            result = None
+        return result, time.perf_counter() - start
+
+    with cf.ThreadPoolExecutor(WORKERS) as executor:
+        results = list(executor.map(run, orders))
+    times = [seconds for _, seconds in results]
+    median, p99 = bench.percentiles(times)
+    return {'correct': sum(result == TRUTH for result, _ in results) / runs,
+            'wrong': sum(result not in (TRUTH, None)
+                         for result, _ in results) / runs,
+            'error': sum(result is None for result, _ in results) / runs,
+            'p50_ms': median, 'p99_ms': p99, 'max_ms': max(times) * 1000}
+
+
+def simulate(names=None, runs=RUNS, timeout=TIMEOUT, seed=0):
+    """Return {strategy: stats} against the PROVIDERS."""
+    old_timeout = shrd.PUBLIC_IP_TIMEOUT
+    old_cert_file = os.environ.get('SSL_CERT_FILE')
+    shrd.PUBLIC_IP_TIMEOUT = timeout
+    rnd = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = stubs.make_certificate(directory)
+        os.environ['SSL_CERT_FILE'] = certfile
+        providers = [FaultyProvider(weights, latency,
+                                    certfile if tls else None, seed + i)
+                     for i, (_, weights, latency, tls) in enumerate(PROVIDERS)]
+        try:
+            for provider in providers:
+                provider.__enter__()
+            urls = [provider.url for provider in providers]
+            return {name: run_strategy(STRATEGIES[name], urls, runs, rnd)
+                    for name in names or STRATEGIES}
+        finally:
+            for provider in providers:
+                provider.__exit__()
+            shrd.PUBLIC_IP_TIMEOUT = old_timeout
+            if old_cert_file is None:
+                del os.environ['SSL_CERT_FILE']
+            else:
+                os.environ['SSL_CERT_FILE'] = old_cert_file
+
+
+def main(args):
+    """Run the strategies and print a table."""
+    options = {}
+    names = []
+    args = iter(args)
+    for arg in args:
+        if arg in ['--runs', '--timeout']:
+            options[arg] = next(args, None)
+        else:
+            names.append(arg)
+    results = simulate(names, int(options.get('--runs', RUNS)),
+                       float(options.get('--timeout', TIMEOUT)))
+    columns = ['correct', 'wrong', 'error', 'p50_ms', 'p99_ms', 'max_ms']
+    print(f'{"strategy":<10}' + ''.join(f'{name:>10}' for name in columns))
+    for name, stats in results.items():
+        print(f'{name:<10}' + ''.join(f'{stats[column]:>10.3f}'
+                                      for column in columns))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
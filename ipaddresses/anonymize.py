@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Prefix-preserving IP address anonymization (Crypto-PAn style).
+
+Each output bit is the input bit XOR a pseudorandom function of the input
+bits before it, so two addresses sharing an n bit prefix are mapped to two
+addresses sharing an n bit prefix. Keyed BLAKE2b is used as the pseudorandom
+function: one digest of a byte aligned prefix gives the 255 flip bits of the
+binary tree below it, which is memoized as a 256 entry substitution table.
+
+Bits leading into a RESERVED_NETWORKS prefix are never flipped, so private
+addresses stay inside their network and public addresses stay public.
+"""
+
+import concurrent.futures as cf
+import functools
+import hashlib
+import ipaddress
+import os
+import re
+
+import scan
+
+BATCH_SIZE = 1024 * 1024
+CACHE_SIZE = 1 << 16
+TABLE_BYTES = 2  # leading bytes with memoized tables, shared by many prefixes
+
+# Like scan.TOKEN_RE but only tokens with a separator, to save callbacks
+TOKEN_RE = re.compile(rb'[0-9A-Fa-f]*[:.][0-9A-Fa-f:.]+')
+
+RESERVED_NETWORKS = [ipaddress.ip_network(net) for net in [
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8',
+    '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24', '192.0.2.0/24',
+    '192.168.0.0/16', '198.18.0.0/15', '198.51.100.0/24', '203.0.113.0/24',
+    '240.0.0.0/4',
+    '::/128', '::1/128', '::ffff:0:0/96', '100::/64', '2001::/23',
+    '2001:db8::/32', 'fc00::/7', 'fe80::/10']]
+
+
+def reserved_paths(size):
+    """Return {bit: prefixes leading into a reserved network}."""
+    paths = {}
+    bits = size * 8
+    for net in RESERVED_NETWORKS:
+        if net.max_prefixlen != bits:
+            continue
+        value = int(net.network_address)
+        for i in range(net.prefixlen):
+            paths.setdefault(i, set()).add(value >> (bits - i))
+    return paths
+
+
+PATHS = {4: reserved_paths(4), 16: reserved_paths(16)}
+
+
+# Gather indexes: byte b at tree depth d sits below node (1 << d) | b >> 8 - d
+DEPTH_INDEXES = [bytes(b >> (8 - depth) for b in range(256))
+                 for depth in range(8)]
+DEPTH_VALUES = [bytes.maketrans(b'01', bytes([0, 1 << (7 - depth)]))
+                for depth in range(8)]
+IDENTITY = int.from_bytes(bytes(range(256)), 'big')
+BITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+class Anonymizer:
+    """Prefix-preserving anonymizer with bounded memoization."""
+
+    def __init__(self, key, cache_size=CACHE_SIZE):
+        if len(key) > hashlib.blake2b.MAX_KEY_SIZE:
+            key = hashlib.blake2b(key).digest()
+        self.key = key
+        self.flips = functools.lru_cache(maxsize=cache_size)(self._flips)
+        self.table = functools.lru_cache(maxsize=cache_size)(self._table)
+        self.anonymize_packed = functools.lru_cache(maxsize=cache_size)(
+            self._anonymize_packed)
+        self.anonymize_token = functools.lru_cache(maxsize=cache_size)(
+            self._anonymize_token)
+
+    def _flips(self, size, prefix):
+        """Return the flip bit of each node of the tree below prefix."""
+        digest = hashlib.blake2b(bytes([size, len(prefix)]) + prefix,
+                                 key=self.key, digest_size=32).digest()
+        flips = format(int.from_bytes(digest, 'big'), '0256b').encode()
+        paths = PATHS[size]
+        bit = len(prefix) * 8
+        value = int.from_bytes(prefix, 'big')
+        if value in paths.get(bit, ()):
+            flips = bytearray(flips)
+            for depth in range(8):
+                for path in range(1 << depth):
+                    if (value << depth) | path in paths.get(bit + depth, ()):
+                        flips[(1 << depth) | path] = ord('0')
+            flips = bytes(flips)
+        return flips
+
+    def _table(self, size, prefix):
+        """Return the substitution table for the byte following prefix."""
+        flips = self.flips(size, prefix)
+        mask = 0
+        for depth in range(8):
+            values = flips[1 << depth:2 << depth].translate(
+                DEPTH_VALUES[depth])
+            mask |= int.from_bytes(DEPTH_INDEXES[depth].translate(
+                values.ljust(256, b'\x00')), 'big')
+        return (IDENTITY ^ mask).to_bytes(256, 'big')
+
+    def substitute(self, size, prefix, byte):
+        """Return the substitute of the byte following prefix."""
+        flips = self.flips(size, prefix).translate(BITS)
+        node = 1
+        output = 0
+        for depth in range(7, -1, -1):
+            bit = (byte >> depth) & 1
+            output = (output << 1) | (bit ^ flips[node])
+            node = (node << 1) | bit
+        return output
+
+    def _anonymize_packed(self, packed):
+        """Anonymize a packed (4 or 16 bytes) address."""
+        size = len(packed)
+        return bytes([self.table(size, packed[:i])[packed[i]]
+                      for i in range(TABLE_BYTES)] +
+                     [self.substitute(size, packed[:i], packed[i])
+                      for i in range(TABLE_BYTES, size)])
+
+    def anonymize(self, address):
+        """Anonymize an ipaddress address."""
+        return ipaddress.ip_address(self.anonymize_packed(address.packed))
+
+    def _anonymize_token(self, token):
+        """Anonymize the address inside a candidate token, if any."""
+        text = token.decode('ascii')
+        span = scan.token_span(text)
+        if span is None:
+            return token
+        start, end = span
+        try:
+            address = ipaddress.ip_address(text[start:end])
+        except ValueError:
+            return token
+        return (text[:start] + str(self.anonymize(address)) +
+                text[end:]).encode('ascii')
+
+    def anonymize_bytes(self, data):
+        """Anonymize every address found in data."""
+        return TOKEN_RE.sub(
+            lambda match: self.anonymize_token(match.group()), data)
+
+
+ANONYMIZER = None
+
+
+def init_worker(key):
+    """Create the anonymizer of a pool worker."""
+    global ANONYMIZER
+    ANONYMIZER = Anonymizer(key)
+
+
+def anonymize_batch(data):
+    """Anonymize a batch of lines in a pool worker."""
+    return ANONYMIZER.anonymize_bytes(data)
+
+
+def batches(f_in, batch_size=BATCH_SIZE):
+    """Yield batches of whole lines of about batch_size bytes."""
+    while True:
+        lines = f_in.readlines(batch_size)
+        if not lines:
+            return
+        yield b''.join(lines)
+
+
+def anonymize_stream(key, f_in, f_out, workers=None, batch_size=BATCH_SIZE):
+    """Anonymize binary stream f_in into f_out, keeping the line order."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 2:
+        anonymizer = Anonymizer(key)
+        for batch in batches(f_in, batch_size):
+            f_out.write(anonymizer.anonymize_bytes(batch))
+        return
+
+    with cf.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(key,)) as executor:
+        pending = []
+        for batch in batches(f_in, batch_size):
+            pending.append(executor.submit(anonymize_batch, batch))
+            # Bound memory to a few batches per worker
+            if len(pending) >= 2 * workers:
+                f_out.write(pending.pop(0).result())
+        for future in pending:
+            f_out.write(future.result())
+
+
+if __name__ == '__main__':
+    pass
@@ -15,44 +15,739 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Processes command line arguments."""
+"""
+Processes command line arguments.
 
+The modules of the commands are imported by their functions, so startup
+only loads what the command runs.
+"""
+
+import itertools
+import os
 import sys
+import time
 import colorama as ansi
 
 import common
 import localization as lcl
+import proxy as prx
+import ratelimit as rl
 import shared as shrd
 
+# Commands whose output is data, without banner
+QUIET_COMMANDS = ['anonymize', 'resolve']
 
-def print_ips():
-    """Print private and public IP."""
-    print(lcl.PRIVATE_IP + shrd.get_private_ip())
-    print(lcl.PUBLIC_IP + shrd.get_public_ip())
+WATCH_INTERVAL = 2.0
+# Longest wait for host names (--names) before printing without them
+NAMES_WAIT = 2.0
 
 
-def start(argv):
-    """Print banner and process args."""
-    ansi.init()
+def with_name(address, lookup):
+    """Return address followed by its host name if known."""
+    name = lookup.name(address) if lookup else None
+    return f'{address} {name}' if name else address
+
+
+def start_lookup(names):
+    """Return a ReverseLookup if host names are asked for, else None."""
+    import resolver as rsv
+    return rsv.ReverseLookup() if names else None
+
+
+def print_ips(lookup=None, direct=False):
+    """Print private and public IP, with host names if lookup; behind a
+    proxy, also the direct public IP if direct."""
+    private = shrd.get_private_ip()
+    if lookup:  # while the public IP is fetched
+        lookup.submit([private])
+    # Through the proxy, if there is one
+    paths = shrd.get_public_ip_paths(direct=direct)
+    if lookup:
+        lookup.submit(list(paths.values()))
+        lookup.wait(NAMES_WAIT)
+    print(lcl.PRIVATE_IP + with_name(private, lookup))
+    if 'direct' in paths:
+        print(lcl.PUBLIC_IP + with_name(paths['direct'], lookup))
+    if 'proxy' in paths:
+        print(lcl.PROXY_PUBLIC_IP + with_name(paths['proxy'], lookup))
+
+
+def parse_options(args, names, multiple=()):
+    """Return ({option: value}, positional args) for options with a value.
+
+    Options in multiple may be repeated and get a list of values.
+    """
+    options = {}
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg in multiple:
+            options.setdefault(arg, []).append(next(args, None))
+        elif arg in names:
+            options[arg] = next(args, None)
+        else:
+            positional.append(arg)
+    return options, positional
+
+
+def positive_number(text):
+    """Return text as a positive finite float, None if it is not one."""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):  # None if the option has no value
+        return None
+    return value if 0 < value < float('inf') else None
+
+
+def port_number(text):
+    """Return text as a TCP/UDP port number, None if it is not one."""
+    port = positive_number(text)
+    return None if port is None or port % 1 or port > 65535 else int(port)
+
+
+def print_usage_error(message):
+    """Print error message followed by usage."""
+    print(ansi.Fore.RED + message + '\n')
+    print(ansi.Fore.RESET + common.usage())
+
+
+def print_counts(result, lookup=None):
+    """Print {PRIVATE: Counter, PUBLIC: Counter}, most frequent first,
+    with the host names found within NAMES_WAIT if lookup."""
+    if lookup:
+        lookup.submit([address for counter in result.values()
+                       for address in counter])
+        lookup.wait(NAMES_WAIT)
+    for title, kind in [(lcl.PRIVATE_IPS, shrd.PRIVATE),
+                        (lcl.PUBLIC_IPS, shrd.PUBLIC)]:
+        print(title)
+        for address, count in result[kind].most_common():
+            print(f'{count:>10} {with_name(address, lookup)}')
+
+
+def print_scan(paths, lookup=None):
+    """Print addresses found in files, most frequent first."""
+    import scan
+    try:
+        result = scan.scan_files(paths)
+    except OSError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    print_counts(result, lookup)
+
+
+def print_inventory():
+    """Print the addresses of every network namespace."""
+    import netns
+    for namespace in netns.inventory():
+        print(f"net:[{namespace['inode']}]", *namespace['names'])
+        if namespace['error']:
+            print(ansi.Fore.RED + '    ' + namespace['error'] +
+                  ansi.Fore.RESET)
+        for iface, ips in namespace['interfaces'].items():
+            print(f'    {iface}:', *ips)
+
+
+def print_peers(args, lookup=None):
+    """Print remote peers of sockets, then their changes with --watch.
+
+    Changes are printed at once, with the host names already known.
+    """
+    import peers
+    watching = args[:1] == ['--watch']
+    interval = positive_number(args[1]) if args[1:] else WATCH_INTERVAL
+    if watching and interval is None:
+        print_usage_error(lcl.WRONG_ARG + args[1])
+        return
+    reader = peers.PeerReader()
+    counter = reader.read()
+    print_counts(peers.classify(counter), lookup)
+    if not watching:
+        return
+
+    kinds = {shrd.PRIVATE: lcl.PRIVATE, shrd.PUBLIC: lcl.PUBLIC}
+    try:
+        while True:
+            time.sleep(interval)
+            new_counter = reader.read()
+            changes = peers.diff(counter, new_counter)
+            if lookup:
+                lookup.submit([address for address, _, _ in changes])
+            for address, old, new in changes:
+                sign = '+' if new > old else '-'
+                kind = kinds[shrd.classify_ip(address)]
+                line = f'{sign}{new:>9} {address} {kind}'
+                name = lookup.name(address) if lookup else None
+                print(f'{line} {name}' if name else line, flush=True)
+            counter = new_counter
+    except KeyboardInterrupt:
+        pass
+
+
+def anonymize_files(key_file, paths):
+    """Write files (or stdin) to stdout with anonymized addresses."""
+    import anonymize
+    try:
+        with open(key_file, 'rb') as f_in:
+            key = f_in.read()
+        if not paths:
+            anonymize.anonymize_stream(key, sys.stdin.buffer,
+                                       sys.stdout.buffer)
+        for path in paths:
+            with open(path, 'rb') as f_in:
+                anonymize.anonymize_stream(key, f_in, sys.stdout.buffer)
+    except OSError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET, file=sys.stderr)
+
+
+def print_sources(destinations):
+    """Print source address and interface used for each destination."""
+    import routes
+    snapshot = routes.RoutingSnapshot.load()
+    for destination in destinations or (line.strip() for line in sys.stdin):
+        try:
+            answer = snapshot.source(destination)
+        except ValueError:
+            print(ansi.Fore.RED + lcl.WRONG_ARG + destination +
+                  ansi.Fore.RESET)
+            continue
+        source, iface = answer if answer else ('-', '-')
+        print(destination, source or '-', iface)
+
+
+def fetch_ips(metrics=None):
+    """Return {PRIVATE: ip, PUBLIC: ip}, printing and counting errors."""
+    ips = {}
+    for kind, provider, fetch in [
+            (shrd.PRIVATE, 'hostname', shrd.get_private_ip),
+            (shrd.PUBLIC, shrd.PUBLIC_IP_URL, shrd.get_public_ip)]:
+        timings = {}
+        try:
+            ips[kind] = fetch(timings=timings)
+        except (OSError, RuntimeError) as e:
+            print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+            if metrics:
+                metrics.error(provider, e)
+            continue
+        if metrics:
+            for phase, seconds in timings.items():
+                metrics.observe(provider, phase, seconds)
+            metrics.set_address(kind, ips[kind])
+    return ips
+
+
+def watch(args):
+    """Print private and public IP whenever they change."""
+    import history as hst
+    import hooks
+    import metrics as mtr
+    options, positional = parse_options(
+        args, ['--metrics-port', '--metrics-file', '--history',
+               '--hook-concurrency', '--hook-timeout'],
+        ['--hook', '--webhook'])
+    interval = positive_number(positional[0]) if positional else \
+        WATCH_INTERVAL
+    if interval is None:
+        print_usage_error(lcl.WRONG_ARG + positional[0])
+        return
+    metrics_port = None
+    if options.get('--metrics-port'):
+        metrics_port = port_number(options['--metrics-port'])
+        if metrics_port is None:
+            print_usage_error(lcl.WRONG_ARG + '--metrics-port')
+            return
+    hook_timeout = positive_number(options.get('--hook-timeout',
+                                               hooks.TIMEOUT))
+    if hook_timeout is None:
+        print_usage_error(lcl.WRONG_ARG + '--hook-timeout')
+        return
+    concurrency = positive_number(options.get('--hook-concurrency',
+                                              hooks.CONCURRENCY))
+    if concurrency is None or concurrency % 1:
+        print_usage_error(lcl.WRONG_ARG + '--hook-concurrency')
+        return
+    metrics = None
+    if options.get('--metrics-port') or options.get('--metrics-file'):
+        metrics = mtr.Metrics()
+    if metrics_port:
+        metrics.serve(metrics_port)
+
+    history = None
+    if options.get('--history'):
+        history = hst.History(options['--history'])
+
+    dispatcher = None
+    hook_list = ([hooks.ScriptHook(command, timeout=hook_timeout)
+                  for command in options.get('--hook', [])] +
+                 [hooks.WebHook(url, timeout=hook_timeout)
+                  for url in options.get('--webhook', [])])
+    if hook_list:
+        dispatcher = hooks.Dispatcher(hook_list,
+                                      concurrency=int(concurrency))
+
+    labels = {shrd.PRIVATE: lcl.PRIVATE_IP, shrd.PUBLIC: lcl.PUBLIC_IP}
+    previous = {}
+    try:
+        while True:
+            ips = fetch_ips(metrics)
+            changed = False
+            for kind, ip in ips.items():
+                if previous.get(kind) != ip:
+                    print(time.strftime('%Y-%m-%d %H:%M:%S'),
+                          labels[kind] + ip, flush=True)
+                    changed = True
+            previous.update(ips)
+            if changed and history:
+                history.append(previous)
+            if changed and dispatcher:
+                dispatcher.submit(previous)
+            if options.get('--metrics-file'):
+                metrics.write_textfile(options['--metrics-file'])
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if history:
+            history.close()
+        if dispatcher:
+            dispatcher.close()
+
+
+def publish_dns(args):
+    """Publish the public IP of names with RFC 2136 DNS updates."""
+    import ddns
+    options, positional = parse_options(
+        args, ['--key', '--port', '--ttl', '--cache', '--watch'])
+    if len(positional) < 3 or not options.get('--key'):
+        print_usage_error(lcl.MISSING_ARG + 'ddns')
+        return
+    server, zone, names = positional[0], positional[1], positional[2:]
+    ttl = positive_number(options.get('--ttl', ddns.TTL))
+    # A 32-bit field, of which RFC 2181 allows the positive half
+    if ttl is None or ttl % 1 or ttl >= 2 ** 31:
+        print_usage_error(lcl.WRONG_ARG + '--ttl')
+        return
+    port = port_number(options.get('--port', ddns.PORT))
+    if port is None:
+        print_usage_error(lcl.WRONG_ARG + '--port')
+        return
+    interval = None
+    if options.get('--watch'):
+        interval = positive_number(options['--watch'])
+        if interval is None:
+            print_usage_error(lcl.WRONG_ARG + '--watch')
+            return
+    try:
+        key = ddns.TsigKey.parse(options['--key'])
+    except ValueError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    updater = ddns.Updater(
+        server, zone, key,
+        cache_file=options.get('--cache', ddns.CACHE_FILE),
+        ttl=int(ttl), port=port)
+    try:
+        while True:
+            try:
+                address = shrd.get_public_ip()
+                for name in updater.update(dict.fromkeys(names, address)):
+                    print(time.strftime('%Y-%m-%d %H:%M:%S'), name, address,
+                          flush=True)
+            except (OSError, RuntimeError) as e:
+                print(ansi.Fore.RED + str(e) + ansi.Fore.RESET, flush=True)
+            if not interval:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        updater.close()
 
-    print(common.banner())
+
+def collect(args):
+    """Collect reports of agents, or query a collector with --query."""
+    import asyncio
+    import collector as clt
+    options, _ = parse_options(args, ['--port', '--store', '--query',
+                                      '--server'])
+    port = port_number(options.get('--port', clt.PORT))
+    if port is None:
+        print_usage_error(lcl.WRONG_ARG + '--port')
+        return
+    if options.get('--query'):
+        try:
+            hosts = clt.query(options.get('--server', 'localhost'),
+                              options['--query'], port)
+        except (OSError, ValueError) as e:
+            print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+            return
+        for host in hosts:
+            print(host['host'], host['private'] or '-', time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(host['time'])))
+        return
+
+    server = clt.Collector(clt.Store(options.get('--store', clt.STORE_FILE)))
+    try:
+        asyncio.run(server.serve(port=port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def send_report(args):
+    """Send this host's IP addresses to a collector."""
+    import collector as clt
+    options, positional = parse_options(args, ['--port'])
+    if not positional:
+        print_usage_error(lcl.MISSING_ARG + 'report')
+        return
+    port = port_number(options.get('--port', clt.PORT))
+    if port is None:
+        print_usage_error(lcl.WRONG_ARG + '--port')
+        return
+    server, flags = positional[0], positional[1:]
+    try:
+        clt.send_report(server, port, tcp='--tcp' in flags,
+                        binary='--json' not in flags)
+    except OSError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+
+
+def read_names(paths):
+    """Yield the lines of files, or of stdin without files."""
+    if not paths:
+        yield from sys.stdin
+    for path in paths:
+        with open(path, encoding=lcl.UTF_ENC, errors='replace') as f_in:
+            yield from f_in
+
+
+def resolve_names(args):
+    """Print the addresses of the names in files (or stdin) as resolved."""
+    import asyncio
+    import resolver as rsv
+    options, paths = parse_options(args, ['--port'], ['--server'])
+    kinds = {shrd.PRIVATE: lcl.PRIVATE, shrd.PUBLIC: lcl.PUBLIC}
+
+    def emit(name, addresses, error):
+        if error is not None:
+            print(ansi.Fore.RED + str(error) + ansi.Fore.RESET, flush=True)
+        if not addresses:
+            print(name, '-')
+        for address in addresses:
+            print(name, address, kinds[shrd.classify_ip(address)])
+
+    async def run():
+        async with rsv.Resolver(options.get('--server'),
+                                int(options.get('--port', rsv.PORT))) as res:
+            await res.resolve_stream(read_names(paths), emit)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def print_nat(args):
+    """Print the NAT mapping and filtering behaviour (RFC 5780)."""
+    import asyncio
+    import nat
+    options, positional = parse_options(args, ['--lifetime'])
+    server = positional[0] if positional else nat.SERVER
+    host, port = server, nat.PORT
+    if server.count(':') == 1:  # not an IPv6 address
+        host, port = server.split(':')
+        port = port_number(port)
+        if port is None:
+            print_usage_error(lcl.WRONG_ARG + server)
+            return
+    lifetime = None
+    if options.get('--lifetime'):
+        lifetime = positive_number(options['--lifetime'])
+        if lifetime is None:
+            print_usage_error(lcl.WRONG_ARG + '--lifetime')
+            return
+    try:
+        result = asyncio.run(nat.diagnose(host, port, lifetime))
+    except (OSError, nat.NatError) as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    print(lcl.MAPPED_ADDRESS + '{}:{}'.format(*result['mapped']))
+    print(lcl.NAT_MAPPING + result['mapping'])
+    print(lcl.NAT_FILTERING + result['filtering'])
+    if result['lifetime']:
+        outlived, expired = result['lifetime']
+        print(lcl.BINDING_LIFETIME + (f'{outlived:g}-{expired:g} s' if expired
+                                      else f'>= {outlived:g} s'))
+
+
+def print_quorum(args):
+    """Print the public IP once quorum providers agree on it, and the
+    providers that disagreed or failed meanwhile."""
+    quorum = positive_number(args[0]) if args else shrd.QUORUM
+    # Whole, and reachable with the providers there are
+    if (quorum is None or quorum % 1 or
+            quorum > len(shrd.PUBLIC_IP_URLS)):
+        print_usage_error(lcl.WRONG_ARG + args[0])
+        return
+    disagreements = {}
+    try:
+        address = shrd.get_public_ip_quorum(quorum=int(quorum),
+                                            disagreements=disagreements)
+    except RuntimeError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    print(lcl.PUBLIC_IP + address)
+    for url, answer in disagreements.items():
+        print(ansi.Fore.RED + lcl.DISAGREEMENT + f'{url} {answer}' +
+              ansi.Fore.RESET)
+
+
+def print_stats(args):
+    """Print the rx/tx rates of every interface next to its addresses,
+    every second, sampling at a rate (Hz)."""
+    import ifstats as ifs
+    options, positional = parse_options(args, ['--window'])
+    rate = positive_number(positional[0]) if positional else ifs.RATE
+    if rate is None:
+        print_usage_error(lcl.WRONG_ARG + positional[0])
+        return
+    window = positive_number(options.get('--window', ifs.WINDOW))
+    if window is None:
+        print_usage_error(lcl.WRONG_ARG + '--window')
+        return
+    sampler = ifs.Sampler(rate, window)
+    # Addresses change seldom, refreshed every window
+    addresses = {'time': float('-inf')}
+
+    def report(stats):
+        if time.monotonic() - addresses['time'] >= window:
+            addresses['ips'] = shrd.get_interface_ips()
+            addresses['time'] = time.monotonic()
+        print(time.strftime('%Y-%m-%d %H:%M:%S') + ''.join(
+            f' {title:>10}' for title in ['rx', 'rx p95', 'tx', 'tx p95']))
+        for iface, rates in stats.items():
+            ips = ' '.join(str(ip.ip) for ip in addresses['ips'].get(
+                iface, []))
+            print(f'  {iface:<17}' + ''.join(
+                f' {ifs.format_rate(rates[key]):>10}'
+                for key in ['rx', 'rx_p95', 'tx', 'tx_p95']) +
+                  (f'  {ips}' if ips else ''))
+        print(flush=True)
+
+    try:
+        sampler.run(report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.close()
+
+
+def save_snapshot(args):
+    """Save a snapshot of the network state, print its file name."""
+    import snapshot as snp
+    path = next((arg for arg in args if arg != '--no-public'), None)
+    try:
+        print(snp.save(path, public='--no-public' not in args))
+    except OSError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+
+
+def print_diff(old_path, new_path):
+    """Print the changes from one snapshot to another."""
+    import snapshot as snp
+    try:
+        old = snp.load(old_path)
+        new = snp.load(new_path)
+    except (OSError, snp.SnapshotError) as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    for sign, section, key, old_value, new_value in snp.diff(old[2],
+                                                             new[2]):
+        if sign == '~':
+            print(sign, section, key, old_value, '->', new_value)
+        else:
+            value = new_value if sign == '+' else old_value
+            print(sign, section, key, *[value] if value else [])
+
+
+def print_free(args):
+    """Print free blocks of a size inside ranges (default RFC 1918), among
+    the prefixes in files, of the interfaces and, with --inventory, of
+    every network namespace."""
+    import ipam
+    import netns
+    options, paths = parse_options(args, ['--size', '--count'],
+                                   ['--within'])
+    inventory = '--inventory' in paths
+    paths = [path for path in paths if path != '--inventory']
+    interfaces = [shrd.get_interface_ips()]
+    if inventory:
+        interfaces += [namespace['interfaces']
+                       for namespace in netns.inventory()]
+    allocated = [str(ip) for interface_ips in interfaces
+                 for ips in interface_ips.values() for ip in ips]
+    try:
+        indexes = ipam.build(itertools.chain(
+            allocated, *map(ipam.read_prefixes, paths)))
+        blocks = ipam.find_free(
+            indexes, int(options.get('--size', str(ipam.SIZE)).lstrip('/')),
+            options.get('--within', ipam.PRIVATE_RANGES),
+            int(options.get('--count', ipam.COUNT)))
+    except (OSError, ValueError) as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    for block in blocks:
+        print(block)
+
+
+def print_history(args):
+    """Print address changes, the state at a time or compact the history."""
+    import datetime as dt
+    import history as hst
+    options, positional = parse_options(args, ['--compact'])
+    if not positional:
+        print_usage_error(lcl.MISSING_ARG + 'history')
+        return
+    path = positional[0]
+    if not os.path.isfile(path):
+        print_usage_error(lcl.WRONG_ARG + path)
+        return
+    if options.get('--compact'):
+        days = positive_number(options['--compact'])
+        if days is None:
+            print_usage_error(lcl.WRONG_ARG + options['--compact'])
+            return
+        hst.compact(path, days * 86400)
+        return
+
+    times = []
+    for arg in positional[1:3]:
+        try:
+            times.append(dt.datetime.fromisoformat(arg).timestamp())
+        except ValueError:
+            print_usage_error(lcl.WRONG_ARG + arg)
+            return
+    try:
+        with hst.History(path, readonly=True) as history:
+            if len(times) == 1:
+                record = history.at(times[0])
+                records = [record] if record else []
+            else:
+                records = history.query(*times)
+    except OSError as e:
+        print(ansi.Fore.RED + str(e) + ansi.Fore.RESET)
+        return
+    for timestamp, private, public in records:
+        print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
+              lcl.PRIVATE_IP + (private or '-'),
+              lcl.PUBLIC_IP + (public or '-'))
+
+
+def run_command(argv, lookup=None, direct=False):
+    """Print banner and run the command of argv."""
+    if not argv or argv[0] not in QUIET_COMMANDS:
+        print(common.banner())
 
     if not argv:
-        print_ips()
+        print_ips(lookup, direct)
     else:
         arg0 = argv[0]
         if arg0 in ['-h', '--help']:
             print(common.usage())
         elif arg0 in ['-l', '--license']:
             print(common.license_())
+        elif arg0 == '--nat':
+            print_nat(argv[1:])
+        elif arg0 == '--quorum':
+            print_quorum(argv[1:])
+        elif arg0 == '--stats':
+            print_stats(argv[1:])
         elif arg0 in ['-p', '--pause']:
-            print_ips()
+            print_ips(lookup, direct)
             input(lcl.PRESS_ANY_KEY)
         elif arg0 in ['-V', '--version']:
             print(lcl.VERSION, common.version())
+        elif arg0 == 'scan':
+            if argv[1:]:
+                print_scan(argv[1:], lookup)
+            else:
+                print_usage_error(lcl.MISSING_ARG + arg0)
+        elif arg0 == 'collector':
+            collect(argv[1:])
+        elif arg0 == 'report':
+            if argv[1:]:
+                send_report(argv[1:])
+            else:
+                print_usage_error(lcl.MISSING_ARG + arg0)
+        elif arg0 == 'ddns':
+            publish_dns(argv[1:])
+        elif arg0 == 'diff':
+            if argv[2:]:
+                print_diff(argv[1], argv[2])
+            else:
+                print_usage_error(lcl.MISSING_ARG + arg0)
+        elif arg0 == 'free':
+            print_free(argv[1:])
+        elif arg0 == 'history':
+            if argv[1:]:
+                print_history(argv[1:])
+            else:
+                print_usage_error(lcl.MISSING_ARG + arg0)
+        elif arg0 == 'inventory':
+            print_inventory()
+        elif arg0 == 'peers':
+            print_peers(argv[1:], lookup)
+        elif arg0 == 'resolve':
+            resolve_names(argv[1:])
+        elif arg0 == 'route':
+            print_sources(argv[1:])
+        elif arg0 == 'snapshot':
+            save_snapshot(argv[1:])
+        elif arg0 == 'watch':
+            watch(argv[1:])
+        elif arg0 == 'anonymize':
+            if argv[1:]:
+                anonymize_files(argv[1], argv[2:])
+            else:
+                print_usage_error(lcl.MISSING_ARG + arg0)
         else:
-            print(ansi.Fore.RED + lcl.WRONG_ARG + arg0 + '\n')
-            print(ansi.Fore.RESET + common.usage())
+            print_usage_error(lcl.WRONG_ARG + arg0)
+
+
+def start(argv):
+    """Print banner and process args."""
+    ansi.init()
+
+    if argv[:1] == ['--splay']:
+        window = positive_number(argv[1]) if argv[1:] else None
+        if window is None:
+            print_usage_error(lcl.WRONG_ARG + ' '.join(argv[:2]))
+            sys.exit(0)
+        # Spread the scheduled runs of a fleet, same delay every run
+        time.sleep(rl.start_offset(window))
+        argv = argv[2:]
+
+    # Proxy of the public IP providers, wherever given
+    if '--proxy' in argv[:-1]:
+        index = argv.index('--proxy')
+        prx.PROXY = argv[index + 1]
+        argv = argv[:index] + argv[index + 2:]
+
+    # Direct public IP too, behind a proxy, wherever given
+    direct = '--direct' in argv
+    argv = [arg for arg in argv if arg != '--direct']
+
+    # Host names of the printed addresses, wherever given
+    lookup = start_lookup('--names' in argv)
+    argv = [arg for arg in argv if arg != '--names']
+
+    try:
+        run_command(argv, lookup, direct)
+    finally:
+        if lookup:
+            lookup.close()
 
     sys.exit(0)  # ToDo: other return codes
 
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Collector of the address reports of a fleet of hosts.
+
+Agents (or reflectors aggregating them) send reports over UDP or TCP on the
+same port, as NDJSON lines or binary records, any number per datagram or
+connection. A line starting with '?' is a query for the hosts behind a
+public IP, answered with one JSON line from the latest state per host, kept
+in memory, or with an 'error' if the address is invalid. Reports that
+change the addresses of a host are also written, in batches from a writer
+thread, to an SQLite store indexed by host and by public IP, so repeated
+reports of the same state cost no disk writes.
+"""
+
+import asyncio
+import collections
+import concurrent.futures as cf
+import ipaddress
+import json
+import socket
+import sqlite3
+import struct
+import threading
+import time
+
+import shared as shrd
+
+PORT = 9053
+STORE_FILE = 'ipaddresses_reports.db'
+BATCH_SIZE = 10000
+FLUSH_INTERVAL = 1.0
+READ_SIZE = 65536
+MAX_RECORD = 65536
+UDP_BUFFER = 4 * 1024 * 1024
+QUERY_TIMEOUT = 5.0
+
+# Version, time, private and public (version, packed address), host length
+BINARY = struct.Struct('!BdB16sB16sB')
+BINARY_VERSION = 1
+FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+SIZES = {4: 4, 6: 16}
+
+
+def ntop(version, packed):
+    """Return the address text of (version, packed) or None."""
+    if version in FAMILIES:
+        return socket.inet_ntop(FAMILIES[version], packed[:SIZES[version]])
+    return None
+
+
+def normalize(address):
+    """Return the canonical text of address or None."""
+    return None if address is None else str(ipaddress.ip_address(address))
+
+
+def pton(address):
+    """Return (version, 16 bytes) of address or (0, zeros) for None."""
+    if address is None:
+        return 0, bytes(16)
+    try:
+        return 4, socket.inet_pton(socket.AF_INET, address)
+    except OSError:
+        return 6, socket.inet_pton(socket.AF_INET6, address)
+
+
+def encode_binary(host, private, public, timestamp=None):
+    """Return the binary record of a report."""
+    host = host.encode('utf-8')[:255]
+    return BINARY.pack(BINARY_VERSION,
+                       time.time() if timestamp is None else timestamp,
+                       *pton(private), *pton(public), len(host)) + host
+
+
+def encode_json(host, private, public, timestamp=None):
+    """Return the NDJSON line of a report."""
+    return (json.dumps({'host': host, 'private': private, 'public': public,
+                        'time': time.time() if timestamp is None
+                        else timestamp}) + '\n').encode('utf-8')
+
+
+def parse(data, offset=0):
+    """Parse reports and queries from data.
+
+    Return ([(time, host, private, public)], [public IP queried, None
+    for an invalid one], offset of the first incomplete record, number of
+    invalid records).
+    """
+    reports = []
+    queries = []
+    invalid = 0
+    size = len(data)
+    while offset < size:
+        if data[offset] == BINARY_VERSION:
+            end = offset + BINARY.size
+            if end > size:
+                break
+            (_, timestamp, private_version, private, public_version, public,
+             length) = BINARY.unpack_from(data, offset)
+            if end + length > size:
+                break
+            reports.append((timestamp,
+                            data[end:end + length].decode('utf-8', 'replace'),
+                            ntop(private_version, private),
+                            ntop(public_version, public)))
+            offset = end + length
+            continue
+
+        end = data.find(b'\n', offset)
+        if end < 0:
+            break
+        line = data[offset:end].strip()
+        offset = end + 1
+        try:
+            if line[:1] == b'?':
+                try:
+                    public = normalize(line[1:].strip().decode('ascii'))
+                except ValueError:
+                    public = None  # answered with an error
+                    invalid += 1
+                queries.append(public)
+            elif line:
+                item = json.loads(line)
+                reports.append((float(item.get('time') or time.time()),
+                                str(item['host']),
+                                normalize(item.get('private')),
+                                normalize(item.get('public'))))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            invalid += 1
+    return reports, queries, offset, invalid
+
+
+class Store:
+    """SQLite store of address changes, indexed by host and by public IP."""
+
+    def __init__(self, path):
+        # Used by the writer thread only, after the schema is created
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS reports (time REAL, '
+                            'host TEXT, private TEXT, public TEXT)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS reports_host '
+                            'ON reports (host, time)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS reports_public '
+                            'ON reports (public, time)')
+
+    def close(self):
+        """Close the database."""
+        self.db.close()
+
+    def write(self, reports):
+        """Insert reports in one transaction."""
+        with self.db:
+            self.db.executemany('INSERT INTO reports VALUES (?, ?, ?, ?)',
+                                reports)
+
+    def latest(self):
+        """Return the latest change of every host."""
+        # SQLite takes the other columns from the row of MAX(time)
+        return self.db.execute('SELECT MAX(time), host, private, public '
+                               'FROM reports GROUP BY host').fetchall()
+
+    def hosts_behind(self, public, start=None, end=None):
+        """Return the hosts that changed to public between start and end."""
+        return [host for (host,) in self.db.execute(
+            'SELECT DISTINCT host FROM reports WHERE public = ? '
+            'AND time >= ? AND time <= ? ORDER BY host',
+            (public, start or 0, time.time() if end is None else end))]
+
+
+class Collector:
+    """Latest state per host and batched writes to the store."""
+
+    def __init__(self, store, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.latest = {}
+        self.behind = collections.defaultdict(set)
+        self.pending = []
+        self.stats = collections.Counter()
+        self.writer = cf.ThreadPoolExecutor(max_workers=1)
+        self.port = None
+        self.ready = threading.Event()
+        for report in store.latest():
+            self.update(report)
+
+    def update(self, report):
+        """Make report the state of its host unless it is older, return
+        True if the addresses changed."""
+        timestamp, host, private, public = report
+        old = self.latest.get(host)
+        if old is not None:
+            if old[0] > timestamp:
+                return False
+            self.latest[host] = (timestamp, private, public)
+            if old[1] == private and old[2] == public:
+                return False
+            if old[2] != public:
+                hosts = self.behind[old[2]]
+                hosts.discard(host)
+                if not hosts:
+                    del self.behind[old[2]]
+        self.latest[host] = (timestamp, private, public)
+        self.behind[public].add(host)
+        return True
+
+    def add(self, reports, invalid=0):
+        """Update the state with reports, queue the changes for the store."""
+        changes = [report for report in reports if self.update(report)]
+        self.pending += changes
+        self.stats['reports'] += len(reports)
+        self.stats['changes'] += len(changes)
+        self.stats['invalid'] += invalid
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the pending reports to the writer thread."""
+        if self.pending:
+            self.writer.submit(self.store.write, self.pending)
+            self.pending = []
+
+    def hosts_behind(self, public):
+        """Return [(host, time, private)] whose latest public IP is public."""
+        return sorted((host, *self.latest[host][:2])
+                      for host in self.behind.get(public, ()))
+
+    def answer(self, public):
+        """Return the JSON line answering a query (public is None for an
+        invalid one)."""
+        if public is None:
+            result = {'public': None, 'hosts': [],
+                      'error': 'invalid IP address'}
+        else:
+            result = {'public': public, 'hosts': [
+                {'host': host, 'time': timestamp, 'private': private}
+                for host, timestamp, private in self.hosts_behind(public)]}
+        return (json.dumps(result) + '\n').encode('utf-8')
+
+    def close(self):
+        """Write the pending reports and close the store."""
+        self.flush()
+        self.writer.shutdown(wait=True)
+        self.store.close()
+
+    async def handle_stream(self, reader, writer):
+        """Read reports and queries from a TCP connection."""
+        buffer = b''
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                buffer += data
+                reports, queries, offset, invalid = parse(buffer)
+                buffer = buffer[offset:]
+                self.add(reports, invalid)
+                if queries:
+                    writer.write(b''.join(self.answer(public)
+                                          for public in queries))
+                    await writer.drain()
+                if len(buffer) > MAX_RECORD:
+                    self.stats['invalid'] += 1
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='', port=PORT):
+        """Serve TCP and UDP on port until cancelled."""
+        loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_stream, host or None,
+                                            port)
+        # Same port for UDP, port 0 picks a free TCP one
+        self.port = server.sockets[0].getsockname()[1]
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: DatagramProtocol(self),
+            local_addr=(host or '0.0.0.0', self.port))
+        # Absorb bursts of datagrams (capped by net.core.rmem_max)
+        transport.get_extra_info('socket').setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_BUFFER)
+        self.ready.set()
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                self.flush()
+        finally:
+            transport.close()
+            server.close()
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    """Reads reports and queries from UDP datagrams."""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        reports, queries, offset, invalid = parse(data)
+        if offset < len(data):
+            # The last line may lack its '\n', else the record is truncated
+            rest = data[offset:] + b'\n'
+            more_reports, more_queries, offset, more_invalid = parse(rest)
+            reports += more_reports
+            queries += more_queries
+            invalid += more_invalid + (offset < len(rest))
+        self.collector.add(reports, invalid)
+        for public in queries:
+            self.transport.sendto(self.collector.answer(public), addr)
+
+
+def send_report(server, port=PORT, tcp=False, binary=True, ips=None):
+    """Send this host's {PRIVATE: ip, PUBLIC: ip} to a collector."""
+    if ips is None:
+        ips = {shrd.PRIVATE: shrd.get_private_ip(),
+               shrd.PUBLIC: shrd.get_public_ip()}
+    encode = encode_binary if binary else encode_json
+    data = encode(socket.gethostname(), ips.get(shrd.PRIVATE),
+                  ips.get(shrd.PUBLIC))
+    if tcp:
+        with socket.create_connection((server, port)) as sock:
+            sock.sendall(data)
+    else:
+        # IPv4 or IPv6, whichever the server resolves to first
+        family, _, _, _, address = socket.getaddrinfo(
+            server, port, type=socket.SOCK_DGRAM)[0]
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.sendto(data, address)
+
+
+def query(server, public, port=PORT, timeout=QUERY_TIMEOUT):
+    """Return [{'host', 'time', 'private'}] behind public (collector).
+
+    ValueError if the collector finds public invalid, OSError if it does
+    not answer within timeout.
+    """
+    with socket.create_connection((server, port), timeout) as sock, \
+            sock.makefile('rb') as f_in:
+        sock.sendall(f'?{public}\n'.encode('utf-8'))
+        line = f_in.readline()
+    if not line:
+        raise ConnectionError(f'no answer from collector {server}:{port}')
+    answer = json.loads(line)
+    if 'error' in answer:
+        raise ValueError(f'{answer["error"]} {public!r}')
+    return answer['hosts']
+
+
+if __name__ == '__main__':
+    pass
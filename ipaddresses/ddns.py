@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Dynamic DNS updates (RFC 2136) signed with TSIG (RFC 8945).
+
+Records are compared with a local cache of what was last published and
+only the changed ones are sent, all of them in one UPDATE message per call,
+over one TCP connection that is kept open between calls.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import socket
+import struct
+import time
+
+TYPE_A = 1
+TYPE_SOA = 6
+TYPE_AAAA = 28
+TYPE_TSIG = 250
+CLASS_IN = 1
+CLASS_ANY = 255
+OPCODE_UPDATE = 5
+RCODES = ['NOERROR', 'FORMERR', 'SERVFAIL', 'NXDOMAIN', 'NOTIMP', 'REFUSED',
+          'YXDOMAIN', 'YXRRSET', 'NXRRSET', 'NOTAUTH', 'NOTZONE']
+
+ALGORITHMS = {'hmac-sha1': hashlib.sha1, 'hmac-sha256': hashlib.sha256,
+              'hmac-sha512': hashlib.sha512}
+DEFAULT_ALGORITHM = 'hmac-sha256'
+FUDGE = 300
+PORT = 53
+TIMEOUT = 5.0
+TTL = 300
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.ipaddresses_ddns.json')
+
+HEADER = struct.Struct('>HHHHHH')
+RR = struct.Struct('>HHIH')
+
+
+class UpdateError(RuntimeError):
+    """The server refused the update or its answer is invalid."""
+
+
+def encode_name(name):
+    """Return the wire format of a domain name (lower case)."""
+    labels = [label for label in name.lower().split('.') if label]
+    return b''.join(bytes([len(label)]) + label.encode('ascii')
+                    for label in labels) + b'\x00'
+
+
+def decode_name(data):
+    """Return the text of an uncompressed wire format name."""
+    labels = []
+    offset = 0
+    while data[offset]:
+        labels.append(data[offset + 1:offset + 1 + data[offset]])
+        offset += 1 + data[offset]
+    return b'.'.join(labels).decode('ascii')
+
+
+def skip_name(message, offset):
+    """Return the offset after the (possibly compressed) name at offset."""
+    while True:
+        length = message[offset]
+        if length >= 0xc0:  # pointer
+            return offset + 2
+        offset += 1 + length
+        if not length:
+            return offset
+
+
+class TsigKey:
+    """TSIG key: name, algorithm and secret."""
+
+    def __init__(self, name, secret, algorithm=DEFAULT_ALGORITHM):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'unknown TSIG algorithm {algorithm}')
+        self.name = name
+        self.secret = secret
+        self.algorithm = algorithm
+
+    @classmethod
+    def parse(cls, text):
+        """Parse nsupdate style [algorithm:]name:base64 secret, raise
+        ValueError if malformed."""
+        parts = text.split(':')
+        if len(parts) not in (2, 3) or not all(parts):
+            raise ValueError('TSIG key not in [algorithm:]name:secret form')
+        algorithm = parts.pop(0) if len(parts) == 3 else DEFAULT_ALGORITHM
+        try:
+            secret = base64.b64decode(parts[1], validate=True)
+        except binascii.Error:
+            raise ValueError('TSIG key secret not in base64') from None
+        return cls(parts[0], secret, algorithm)
+
+    def mac(self, data):
+        """Return the HMAC of data."""
+        return hmac.new(self.secret, data, ALGORITHMS[self.algorithm]).digest()
+
+    def variables(self, time_signed, fudge, error=0, other=b''):
+        """Return the TSIG variables that are signed after the message."""
+        return (encode_name(self.name) + struct.pack('>HI', CLASS_ANY, 0) +
+                encode_name(self.algorithm) +
+                struct.pack('>Q', time_signed)[2:] +
+                struct.pack('>HHH', fudge, error, len(other)) + other)
+
+    def signed_data(self, message, request_mac, variables):
+        """Return the data covered by the MAC (request MAC of responses)."""
+        if request_mac:
+            message = (struct.pack('>H', len(request_mac)) + request_mac +
+                       message)
+        return message + variables
+
+    def sign(self, message, request_mac=b'', time_signed=None):
+        """Return (message with a TSIG record, MAC).
+
+        request_mac is the MAC of the request when signing a response.
+        """
+        if time_signed is None:
+            time_signed = int(time.time())
+        mac = self.mac(self.signed_data(message, request_mac,
+                                        self.variables(time_signed, FUDGE)))
+        rdata = (encode_name(self.algorithm) +
+                 struct.pack('>Q', time_signed)[2:] +
+                 struct.pack('>HH', FUDGE, len(mac)) + mac +
+                 message[:2] + struct.pack('>HH', 0, 0))
+        record = (encode_name(self.name) +
+                  RR.pack(TYPE_TSIG, CLASS_ANY, 0, len(rdata)) + rdata)
+        arcount = HEADER.unpack_from(message)[5]
+        return (message[:10] + struct.pack('>H', arcount + 1) +
+                message[12:] + record, mac)
+
+    def verify(self, response, request_mac=b''):
+        """Return (message without TSIG, MAC), raise UpdateError unless
+        response is signed with this key."""
+        header = list(HEADER.unpack_from(response))
+        offset = HEADER.size
+        for _ in range(header[2]):  # zone / question
+            offset = skip_name(response, offset) + 4
+        for _ in range(header[3] + header[4] + header[5] - 1):
+            offset = skip_name(response, offset)
+            offset += RR.size + RR.unpack_from(response, offset)[3]
+        tsig_start = offset
+        if header[5] < 1:
+            raise UpdateError('unsigned response')
+        offset = skip_name(response, offset)
+        rtype = RR.unpack_from(response, offset)[0]
+        offset += RR.size
+        if rtype != TYPE_TSIG:
+            raise UpdateError('unsigned response')
+        offset = skip_name(response, offset)  # algorithm
+        time_signed = int.from_bytes(response[offset:offset + 6], 'big')
+        fudge, mac_size = struct.unpack_from('>HH', response, offset + 6)
+        offset += 10
+        mac = response[offset:offset + mac_size]
+        original_id, error, other_size = struct.unpack_from(
+            '>HHH', response, offset + mac_size)
+        other = response[offset + mac_size + 6:
+                         offset + mac_size + 6 + other_size]
+        if error:
+            raise UpdateError(f'TSIG error {error}')
+
+        header[0] = original_id
+        header[5] -= 1
+        message = HEADER.pack(*header) + response[HEADER.size:tsig_start]
+        data = self.signed_data(message, request_mac, self.variables(
+            time_signed, fudge, error, other))
+        if not hmac.compare_digest(mac, self.mac(data)):
+            raise UpdateError('bad TSIG signature')
+        if abs(time.time() - time_signed) > fudge:
+            raise UpdateError('TSIG time outside fudge')
+        return message, mac
+
+
+def build_update(zone, records, ttl=TTL, message_id=None):
+    """Return an UPDATE message replacing the A/AAAA RRset of records.
+
+    records is a list of (name, address).
+    """
+    if message_id is None:
+        message_id = secrets.randbits(16)
+    message = HEADER.pack(message_id, OPCODE_UPDATE << 11, 1, 0,
+                          2 * len(records), 0)
+    message += encode_name(zone) + struct.pack('>HH', TYPE_SOA, CLASS_IN)
+    for name, address in records:
+        address = ipaddress.ip_address(address)
+        rtype = TYPE_A if address.version == 4 else TYPE_AAAA
+        # Delete the RRset, then add the new record
+        message += encode_name(name) + RR.pack(rtype, CLASS_ANY, 0, 0)
+        message += (encode_name(name) +
+                    RR.pack(rtype, CLASS_IN, ttl, len(address.packed)) +
+                    address.packed)
+    return message
+
+
+class Connection:
+    """Persistent DNS over TCP connection, reopened when broken."""
+
+    def __init__(self, host, port=PORT, timeout=TIMEOUT):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.sock = None
+
+    def close(self):
+        """Close the connection."""
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def recv_exactly(self, size):
+        """Return exactly size bytes."""
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError('connection closed by server')
+            data += chunk
+        return data
+
+    def exchange(self, message):
+        """Send message and return the response, retrying once."""
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.address,
+                                                         self.timeout)
+                self.sock.sendall(struct.pack('>H', len(message)) + message)
+                size = struct.unpack('>H', self.recv_exactly(2))[0]
+                return self.recv_exactly(size)
+            except OSError:
+                # The server may have closed an idle connection
+                self.close()
+                if attempt:
+                    raise
+        return None
+
+
+class Updater:
+    """Publishes addresses of names in one zone, only when changed."""
+
+    def __init__(self, server, zone, key, cache_file=CACHE_FILE, ttl=TTL,
+                 port=PORT):
+        self.connection = Connection(server, port)
+        self.zone = zone
+        self.key = key
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.cache = {}
+        if cache_file and os.path.isfile(cache_file):
+            with open(cache_file, encoding='utf-8') as f_in:
+                self.cache = json.load(f_in)
+
+    def close(self):
+        """Close the connection."""
+        self.connection.close()
+
+    @staticmethod
+    def cache_key(name, address):
+        """Return the cache key of the RRset of address."""
+        version = ipaddress.ip_address(address).version
+        return f"{name.lower().rstrip('.')}/{'A' if version == 4 else 'AAAA'}"
+
+    def update(self, records):
+        """Publish {name: address}, return the names actually sent."""
+        changes = [(name, address) for name, address in records.items()
+                   if self.cache.get(self.cache_key(name, address)) !=
+                   address]
+        if not changes:
+            return []
+
+        message = build_update(self.zone, changes, self.ttl)
+        signed, mac = self.key.sign(message)
+        response = self.connection.exchange(signed)
+        if response[:2] != message[:2]:
+            raise UpdateError('response ID mismatch')
+        # Errors such as a bad signature are not signed
+        rcode = HEADER.unpack_from(response)[1] & 0xf
+        if rcode:
+            raise UpdateError(RCODES[rcode] if rcode < len(RCODES) else
+                              f'RCODE {rcode}')
+        self.key.verify(response, mac)
+
+        for name, address in changes:
+            self.cache[self.cache_key(name, address)] = address
+        if self.cache_file:
+            temp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f_out:
+                json.dump(self.cache, f_out)
+            os.replace(temp_file, self.cache_file)
+        return [name for name, _ in changes]
+
+
+if __name__ == '__main__':
+    pass
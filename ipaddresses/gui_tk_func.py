@@ -15,9 +15,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""GUI using tkinter."""
+"""
+GUI using tkinter.
 
+The addresses of every interface are shown in a table, refreshed by a
+background thread. A TableModel diffs each refresh against the rows shown
+and returns the edits (delete, update, insert, move) of the changed rows
+only; the InterfaceTable applies them to the Treeview in batches, between
+which Tk handles events and redraws, so thousands of rows refreshed often
+keep the window responsive.
+"""
+
+import collections
+import ipaddress
+import queue
+import re
 import sys
+import threading
+import time
 import tkinter as tk
 import tkinter.messagebox as tk_msg_box
 import tkinter.ttk as tk_ttk
@@ -26,6 +41,212 @@ import common
 import localization as lcl
 import shared as shrd
 
+REFRESH_INTERVAL = 2.0
+POLL_MS = 100
+# Treeview edits per batch; frame times kept for the percentile
+BATCH_SIZE = 200
+FRAME_SAMPLES = 100
+TABLE_HEIGHT = 20
+
+# Columns of the rows: interface, address, prefix length, kind
+INTERFACE = 0
+ADDRESS = 1
+PREFIX = 2
+KIND = 3
+COLUMNS = ['interface', 'address', 'prefix', 'kind']
+DIGITS = re.compile(r'(\d+)')
+
+
+def interface_rows(interface_ips=None):
+    """Return {row id: (interface, address, prefix length, kind)} of the
+    addresses of every interface."""
+    if interface_ips is None:
+        interface_ips = shrd.get_interface_ips()
+    kinds = {shrd.PRIVATE: lcl.PRIVATE, shrd.PUBLIC: lcl.PUBLIC}
+    return {f'{iface} {ip}': (iface, str(ip.ip), ip.network.prefixlen,
+                              kinds[shrd.classify_ip(ip.ip)])
+            for iface, ips in interface_ips.items() for ip in ips}
+
+
+def sort_keys(values):
+    """Return the sort key of each column of a row: interfaces with their
+    numbers in order (eth2 before eth10), addresses by version and
+    value."""
+    iface, address, prefixlen, kind = values
+    numbers = DIGITS.split(iface)
+    numbers[1::2] = map(int, numbers[1::2])
+    ip = ipaddress.ip_address(address)
+    return (numbers, (ip.version, int(ip)), prefixlen, kind)
+
+
+class TableModel:
+    """The rows of a table, the ones shown and their order.
+
+    Each change returns the edits to bring the table shown up to date:
+    ('delete', id), ('item', id, values), ('insert', id, index, values) or
+    ('move', id, index), to be applied in order.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.keys = {}
+        self.shown = []  # ids, in the order shown
+        self.column = INTERFACE
+        self.descending = False
+        self.kind = None  # shown kind, None for every row
+
+    def visible(self, row_id):
+        """Return True if the row passes the filter."""
+        return self.kind is None or self.rows[row_id][KIND] == self.kind
+
+    def key(self, row_id):
+        """Return the sort key of a row."""
+        return self.keys[row_id][self.column], row_id
+
+    def order(self):
+        """Return the ids of the visible rows in the table order."""
+        return sorted(filter(self.visible, self.rows), key=self.key,
+                      reverse=self.descending)
+
+    def update(self, rows):
+        """Replace the rows, return the edits."""
+        shown = set(self.shown)
+        edits = []
+        inserted = []
+        for row_id in shown.difference(rows):
+            edits.append(('delete', row_id))
+        for row_id, values in rows.items():
+            old = self.rows.get(row_id)
+            if old == values:
+                continue
+            self.rows[row_id] = values
+            keys = sort_keys(values)
+            moved = old is None or \
+                keys[self.column] != self.keys[row_id][self.column]
+            self.keys[row_id] = keys
+            if row_id in shown and not self.visible(row_id):
+                edits.append(('delete', row_id))
+            elif row_id in shown and moved:
+                edits.append(('delete', row_id))
+                inserted.append(row_id)
+            elif row_id in shown:
+                edits.append(('item', row_id, values))
+            elif self.visible(row_id):
+                inserted.append(row_id)
+        for row_id in set(self.rows).difference(rows):
+            del self.rows[row_id]
+            del self.keys[row_id]
+        if inserted:
+            edits += self.insertions(inserted)
+        elif edits:
+            self.shown = [row_id for row_id in self.shown
+                          if row_id in self.rows and self.visible(row_id)]
+        return edits
+
+    def insertions(self, inserted):
+        """Return the insert edits of rows, updating the order shown.
+
+        The rows kept shown are still in order: each row is inserted at
+        its final index, in ascending index order.
+        """
+        self.shown = self.order()
+        index = {row_id: i for i, row_id in enumerate(self.shown)}
+        return [('insert', row_id, index[row_id], self.rows[row_id])
+                for row_id in sorted(inserted, key=index.__getitem__)]
+
+    def sort(self, column):
+        """Sort by a column, descending if already sorted ascending by it,
+        return the edits."""
+        self.descending = column == self.column and not self.descending
+        self.column = column
+        self.shown = self.order()
+        return [('move', row_id, i) for i, row_id in enumerate(self.shown)]
+
+    def filter(self, kind):
+        """Show only the rows of kind (None for all), return the edits."""
+        self.kind = kind
+        shown = set(self.shown)
+        edits = [('delete', row_id) for row_id in self.shown
+                 if not self.visible(row_id)]
+        return edits + self.insertions(
+            [row_id for row_id in self.rows
+             if row_id not in shown and self.visible(row_id)])
+
+
+class InterfaceTable:
+    """Treeview of the interface addresses, edited in batches."""
+
+    def __init__(self, parent, status):
+        self.model = TableModel()
+        self.status = status
+        self.pending = collections.deque()
+        self.flushing = False
+        self.frame_times = collections.deque(maxlen=FRAME_SAMPLES)
+        titles = [lcl.INTERFACE, lcl.ADDRESS, lcl.PREFIX, lcl.KIND]
+        self.tree = tk_ttk.Treeview(parent, columns=COLUMNS, show='headings',
+                                    height=TABLE_HEIGHT, selectmode='browse')
+        for column, title in enumerate(titles):
+            self.tree.heading(column, text=title,
+                              command=lambda c=column: self.sort(c))
+            self.tree.column(column, stretch=column == ADDRESS,
+                             width=300 if column == ADDRESS else 100)
+        scrollbar = tk_ttk.Scrollbar(parent, orient='vertical',
+                                     command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(column=0, row=0, sticky='WNES')
+        scrollbar.grid(column=1, row=0, sticky='NS')
+
+    def edit(self, edits):
+        """Queue edits, applied in batches."""
+        self.pending.extend(edits)
+        if self.pending and not self.flushing:
+            self.flushing = True
+            self.tree.after_idle(self.flush)
+
+    def flush(self):
+        """Apply a batch of edits and redraw, timing it as a frame."""
+        start = time.perf_counter()
+        tree = self.tree
+        for _ in range(min(BATCH_SIZE, len(self.pending))):
+            edit = self.pending.popleft()
+            if edit[0] == 'delete':
+                tree.delete(edit[1])
+            elif edit[0] == 'item':
+                tree.item(edit[1], values=edit[2])
+            elif edit[0] == 'insert':
+                tree.insert('', edit[2], iid=edit[1], values=edit[3])
+            else:
+                tree.move(edit[1], '', edit[2])
+        tree.update_idletasks()
+        self.frame_times.append(time.perf_counter() - start)
+        times = sorted(self.frame_times)
+        self.status.set(f'{lcl.ROWS}{len(self.model.shown)}  {lcl.FRAME_TIME}'
+                        f'{times[int(len(times) * 0.95)] * 1000:.1f} ms')
+        if self.pending:
+            # Let Tk handle the events queued meanwhile first
+            tree.after(1, self.flush)
+        else:
+            self.flushing = False
+
+    def update(self, rows):
+        """Show the rows."""
+        self.edit(self.model.update(rows))
+
+    def sort(self, column):
+        """Sort by a column."""
+        self.edit(self.model.sort(column))
+
+    def filter(self, kind):
+        """Show only the rows of kind, None for all."""
+        self.edit(self.model.filter(kind))
+
+
+def refresh_rows(rows_queue, interval=REFRESH_INTERVAL):
+    """Put the interface rows in a queue every interval, forever."""
+    while True:
+        rows_queue.put(interface_rows())
+        time.sleep(interval)
+
 
 def start():
     """Print banner and start GUI."""
@@ -62,7 +283,6 @@ def start():
     win = tk.Toplevel(root)
     win.protocol('WM_DELETE_WINDOW', exit_gui)
     win.title(lcl.WIN_TITLE)
-    win.resizable(False, False)
     win.bind('<F1>', show_help)
 
     # Menus
@@ -85,16 +305,59 @@ def start():
     # Content Frame
     frame = tk_ttk.Frame(win, padding='3 3 3 3')
     frame.grid(column=0, row=0, sticky='WNES')
+    win.columnconfigure(0, weight=1)
+    win.rowconfigure(0, weight=1)
 
     private_lbl = tk.StringVar(value=lcl.PRIVATE_IP + shrd.get_private_ip())
     public_lbl = tk.StringVar(value=lcl.PUBLIC_IP + shrd.get_public_ip())
+    status_lbl = tk.StringVar()
+
+    tk_ttk.Label(frame, textvariable=private_lbl).grid(column=1, row=1,
+                                                       sticky='W')
+    tk_ttk.Label(frame, textvariable=public_lbl).grid(column=1, row=2,
+                                                      sticky='W')
 
-    tk_ttk.Label(frame, textvariable=private_lbl).grid(column=1, row=1)
-    tk_ttk.Label(frame, textvariable=public_lbl).grid(column=1, row=2)
+    # Filter by kind
+    kind = tk.StringVar(value='')
+    filters = tk_ttk.Frame(frame)
+    filters.grid(column=1, row=3, sticky='W')
+    for column, (text, value) in enumerate([(lcl.ALL, ''),
+                                            (lcl.PRIVATE, lcl.PRIVATE),
+                                            (lcl.PUBLIC, lcl.PUBLIC)]):
+        tk_ttk.Radiobutton(
+            filters, text=text, value=value, variable=kind,
+            command=lambda: table.filter(kind.get() or None)).grid(
+                column=column, row=0, padx=5)
+
+    table_frame = tk_ttk.Frame(frame)
+    table_frame.grid(column=1, row=4, sticky='WNES')
+    table_frame.columnconfigure(0, weight=1)
+    table_frame.rowconfigure(0, weight=1)
+    frame.columnconfigure(1, weight=1)
+    frame.rowconfigure(4, weight=1)
+    table = InterfaceTable(table_frame, status_lbl)
+
+    tk_ttk.Label(frame, textvariable=status_lbl).grid(column=1, row=5,
+                                                      sticky='W')
 
     for widget in frame.winfo_children():
         widget.grid_configure(padx=5, pady=5)
 
+    # Rows fetched in a thread, shown from the Tk thread
+    rows_queue = queue.Queue()
+    threading.Thread(target=refresh_rows, args=(rows_queue,),
+                     daemon=True).start()
+
+    def poll():
+        """Show the latest rows fetched, if any."""
+        rows = None
+        while not rows_queue.empty():
+            rows = rows_queue.get_nowait()
+        if rows is not None:
+            table.update(rows)
+        win.after(POLL_MS, poll)
+
+    poll()
     center(win)
     root.mainloop()
 
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Append-only history of address changes.
+
+Every change appends one fixed-size record with the time and both
+addresses, so the state at any time is the last record before it. Every
+INDEX_EVERY records the time is also appended to a sparse index (PATH.idx).
+Queries binary search the memory-mapped index, then the records of one
+index block.
+
+Opened read-only, neither file is ever written: a partial last record is
+ignored and a missing or stale index is rebuilt in memory.
+"""
+
+import contextlib
+import ipaddress
+import mmap
+import os
+import struct
+import time
+
+import shared as shrd
+
+# Microseconds since the epoch, private and public (version, packed address)
+RECORD = struct.Struct('<qB16sB16s6x')
+# Microseconds since the epoch, record number
+INDEX = struct.Struct('<qq')
+INDEX_EVERY = 4096
+INDEX_SUFFIX = '.idx'
+
+
+def pack_ip(address):
+    """Return (version, 16 bytes) of address or (0, zeros) for None."""
+    if address is None:
+        return 0, bytes(16)
+    address = ipaddress.ip_address(address)
+    return address.version, address.packed.ljust(16, b'\x00')
+
+
+def unpack_ip(version, packed):
+    """Return the address text of (version, packed) or None."""
+    if version == 4:
+        return str(ipaddress.IPv4Address(packed[:4]))
+    if version == 6:
+        return str(ipaddress.IPv6Address(packed))
+    return None
+
+
+def search(get, count, value):
+    """Return the number of items 0..count-1 with get(i) <= value."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if value < get(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class History:
+    """Address change log with a sparse time index."""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.f_log = open(path, 'rb' if readonly else 'ab')
+        # Ignore a partial record left by a crash (or being appended)
+        self.count = os.path.getsize(path) // RECORD.size
+        if not readonly:
+            self.f_log.truncate(self.count * RECORD.size)
+        self.f_index = None if readonly else open(self.index_path, 'ab')
+        self.index = None  # in memory, if the index file is stale
+        self.last_time = 0
+        if self.count:
+            self.last_time = self.record(self.count - 1)[0]
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except OSError:
+            index_size = None
+        if index_size != INDEX.size * (
+                (self.count + INDEX_EVERY - 1) // INDEX_EVERY):
+            if readonly:
+                self.index = self.build_index()
+            else:
+                self.rebuild_index()
+
+    def close(self):
+        """Close the files."""
+        self.f_log.close()
+        if self.f_index:
+            self.f_index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def build_index(self):
+        """Return the index of the records."""
+        return b''.join(INDEX.pack(self.record(number)[0], number)
+                        for number in range(0, self.count, INDEX_EVERY))
+
+    def rebuild_index(self):
+        """Rewrite the index from the records."""
+        self.f_index.truncate(0)
+        self.f_index.write(self.build_index())
+        self.f_index.flush()
+
+    def open_index(self):
+        """Return the index, memory-mapped unless rebuilt in memory, as a
+        context manager."""
+        if self.index is not None:
+            return contextlib.nullcontext(self.index)
+        with open(self.index_path, 'rb') as f_index:
+            return mmap.mmap(f_index.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def append(self, ips, timestamp=None):
+        """Append {PRIVATE: ip, PUBLIC: ip} as the state since timestamp."""
+        if timestamp is None:
+            timestamp = time.time()
+        # Keep the log sorted even if the clock goes back
+        micros = max(int(timestamp * 1e6), self.last_time)
+        self.f_log.write(RECORD.pack(micros, *pack_ip(ips.get(shrd.PRIVATE)),
+                                     *pack_ip(ips.get(shrd.PUBLIC))))
+        self.f_log.flush()
+        if self.count % INDEX_EVERY == 0:
+            self.f_index.write(INDEX.pack(micros, self.count))
+            self.f_index.flush()
+        self.count += 1
+        self.last_time = micros
+
+    def record(self, number, mm=None):
+        """Return record number as (micros, v4/6, packed, v4/6, packed)."""
+        if mm is not None:
+            return RECORD.unpack_from(mm, number * RECORD.size)
+        with open(self.path, 'rb') as f_in:
+            f_in.seek(number * RECORD.size)
+            return RECORD.unpack(f_in.read(RECORD.size))
+
+    def query(self, start=None, end=None):
+        """Return [(timestamp, private, public)] of the changes in
+        [start, end], preceded by the state at start."""
+        if not self.count:
+            return []
+        with open(self.path, 'rb') as f_log, \
+                mmap.mmap(f_log.fileno(), 0, access=mmap.ACCESS_READ) \
+                as log, self.open_index() as index:
+
+            def find(timestamp):
+                """Return the number of records with time <= timestamp."""
+                micros = int(timestamp * 1e6)
+                blocks = search(lambda i: INDEX.unpack_from(
+                    index, i * INDEX.size)[0], len(index) // INDEX.size,
+                                micros)
+                if not blocks:
+                    return 0
+                low = (blocks - 1) * INDEX_EVERY
+                high = min(low + INDEX_EVERY, self.count)
+                return low + search(lambda i: RECORD.unpack_from(
+                    log, (low + i) * RECORD.size)[0], high - low, micros)
+
+            first = 0 if start is None else max(find(start) - 1, 0)
+            last = self.count if end is None else find(end)
+            records = []
+            for number in range(first, last):
+                micros, *addresses = self.record(number, log)
+                records.append((micros / 1e6, unpack_ip(*addresses[:2]),
+                                unpack_ip(*addresses[2:])))
+            return records
+
+    def at(self, timestamp):
+        """Return (timestamp, private, public) in effect at timestamp."""
+        records = self.query(timestamp, timestamp)
+        if records and records[0][0] <= timestamp:
+            return records[0]
+        return None
+
+
+def compact(path, keep_seconds, now=None):
+    """Drop records older than keep_seconds, except the state at the cut.
+
+    The file is replaced, so it must not be open for writing elsewhere.
+    """
+    if now is None:
+        now = time.time()
+    with History(path, readonly=True) as history:
+        records = history.query(now - keep_seconds)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with History(temp_path) as compacted:
+        for timestamp, private, public in records:
+            compacted.append({shrd.PRIVATE: private, shrd.PUBLIC: public},
+                             timestamp)
+    os.replace(temp_path, path)
+    os.replace(temp_path + INDEX_SUFFIX, path + INDEX_SUFFIX)
+    return len(records)
+
+
+if __name__ == '__main__':
+    pass
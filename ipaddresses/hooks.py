@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Address change hooks: scripts and webhooks.
+
+The Dispatcher runs the hooks on an asyncio loop in its own thread, so
+submit never blocks the caller. Each hook has a bounded queue, a worker and
+a timeout, and up to concurrency hooks deliver at once. A worker always
+delivers the latest queued state and drops the older ones (coalescing);
+being one per hook, a hook gets the states in order.
+"""
+
+import abc
+import asyncio
+import collections
+import json
+import os
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+
+import shared as shrd
+
+QUEUE_SIZE = 8
+CONCURRENCY = 4  # hooks delivering at once
+TIMEOUT = 10.0
+CLOSE_TIMEOUT = 5.0
+
+
+def state_env(state):
+    """Return the IPADDRESSES_PRIVATE/PUBLIC environment of state."""
+    return {f'IPADDRESSES_{kind.upper()}': ip for kind, ip in state.items()
+            if kind in (shrd.PRIVATE, shrd.PUBLIC)}
+
+
+class Hook(abc.ABC):
+    """Base hook, subclasses implement run."""
+
+    def __init__(self, name, timeout=TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    async def run(self, state):
+        """Deliver state, raising on failure."""
+
+
+class ScriptHook(Hook):
+    """Shell command, the addresses are in its environment (state_env)."""
+
+    def __init__(self, command, **kwargs):
+        super().__init__(command, **kwargs)
+        self.command = command
+
+    async def run(self, state):
+        """Run the command, killing it if cancelled."""
+        env = dict(os.environ, **state_env(state))
+        process = await asyncio.create_subprocess_shell(
+            self.command, env=env, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL)
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if code:
+            raise RuntimeError(f'exit status {code}')
+
+
+class WebHook(Hook):
+    """HTTP(S) POST of the addresses as JSON."""
+
+    def __init__(self, url, **kwargs):
+        super().__init__(url, **kwargs)
+        self.url = urllib.parse.urlsplit(url)
+
+    async def run(self, state):
+        """Post state and check the response status."""
+        url = self.url
+        https = url.scheme == 'https'
+        body = json.dumps(dict(state, time=time.time())).encode('utf-8')
+        reader, writer = await asyncio.open_connection(
+            url.hostname, url.port or (443 if https else 80),
+            ssl=ssl.create_default_context() if https else None)
+        try:
+            writer.write(
+                f'POST {url.path or "/"}{"?" if url.query else ""}{url.query}'
+                f' HTTP/1.1\r\nHost: {url.netloc}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+            status = (await reader.readline()).split()
+        finally:
+            writer.close()
+        if len(status) < 2 or not status[1].startswith(b'2'):
+            raise RuntimeError(
+                'HTTP ' + b' '.join(status[1:]).decode('latin-1'))
+
+
+class Dispatcher:
+    """Runs hooks in a background asyncio loop."""
+
+    def __init__(self, hooks, queue_size=QUEUE_SIZE,
+                 concurrency=CONCURRENCY):
+        self.hooks = hooks
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.queues = {}
+        self.workers = []
+        self.stats = {hook.name: collections.Counter() for hook in hooks}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    async def start(self):
+        """Create the queues and workers."""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        for hook in self.hooks:
+            queue = self.queues[hook] = asyncio.Queue(self.queue_size)
+            self.workers.append(asyncio.create_task(self.work(hook, queue)))
+
+    def submit(self, state):
+        """Queue state ({PRIVATE: ip, PUBLIC: ip}) for every hook."""
+        self.loop.call_soon_threadsafe(self.put, dict(state))
+
+    def put(self, state):
+        """Queue state, dropping the oldest one of a full queue."""
+        for hook, queue in self.queues.items():
+            if queue.full():
+                queue.get_nowait()
+                queue.task_done()
+                self.stats[hook.name]['coalesced'] += 1
+            queue.put_nowait(state)
+
+    async def work(self, hook, queue):
+        """Deliver the latest queued state, forever."""
+        stats = self.stats[hook.name]
+        while True:
+            state = await queue.get()
+            async with self.semaphore:
+                # Newer states may have come while waiting for a turn
+                while not queue.empty():
+                    queue.task_done()
+                    state = queue.get_nowait()
+                    stats['coalesced'] += 1
+                try:
+                    await asyncio.wait_for(hook.run(state), hook.timeout)
+                    stats['delivered'] += 1
+                except asyncio.TimeoutError:
+                    stats['timeouts'] += 1
+                    print(f'{hook.name}: timeout', file=sys.stderr)
+                except Exception as e:  # hooks must not kill the worker
+                    stats['failed'] += 1
+                    print(f'{hook.name}: {e}', file=sys.stderr)
+                finally:
+                    queue.task_done()
+
+    async def stop(self, timeout):
+        """Wait up to timeout for pending deliveries, then cancel."""
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                *(queue.join() for queue in self.queues.values())), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stop the hooks and the loop thread."""
+        asyncio.run_coroutine_threadsafe(self.stop(timeout),
+                                         self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+if __name__ == '__main__':
+    pass
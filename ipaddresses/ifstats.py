@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per-interface throughput sampler (Linux).
+
+/proc/net/dev is read into a reused buffer and its counters stored in a
+preallocated array ring buffer per interface, of window * rate samples.
+Rates and percentiles are computed from the rings only when reported, so
+a sample costs one read, then one split and two stores per interface.
+"""
+
+import array
+import operator
+import time
+
+PROC_NET_DEV = '/proc/net/dev'
+RATE = 10.0
+WINDOW = 10.0
+REPORT_INTERVAL = 1.0
+READ_SIZE = 64 * 1024
+
+# After 'name:' (no space before large counters on some kernels), 8
+# receive and 8 transmit counters
+FIELDS = 16
+RX_BYTES = 0
+TX_BYTES = 8
+
+
+def percentile(values, fraction):
+    """Return the fraction percentile of sorted values (nearest rank)."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def interval_rates(times, counter):
+    """Return (total increase, sorted rates between consecutive samples).
+
+    Intervals where the counter went back (wrap, reset) count as zero.
+    """
+    increases = list(map(operator.sub, counter[1:], counter))
+    if increases and min(increases) < 0:
+        increases = [max(0.0, increase) for increase in increases]
+    values = sorted(map(operator.truediv, increases,
+                        map(operator.sub, times[1:], times)))
+    return sum(increases), values
+
+
+def rates(times, rx_bytes, tx_bytes):
+    """Return {'rx', 'tx': mean bytes/s over the samples, 'rx_p95',
+    'tx_p95', 'rx_max', 'tx_max': of the rates between consecutive
+    samples}."""
+    result = {}
+    elapsed = times[-1] - times[0] if len(times) > 1 else 0.0
+    for name, counter in [('rx', rx_bytes), ('tx', tx_bytes)]:
+        total, values = interval_rates(times, counter) if elapsed else \
+            (0.0, [])
+        result[name] = total / elapsed if elapsed else 0.0
+        result[name + '_p95'] = percentile(values, 0.95)
+        result[name + '_max'] = values[-1] if values else 0.0
+    return result
+
+
+IDLE = rates([0.0], [0.0], [0.0])
+
+
+class Sampler:
+    """Samples the counters of every interface into its ring.
+
+    The rings advance together: the sampler keeps the sample times and
+    the position, each interface ring holds (rx bytes, tx bytes) pairs, so
+    a sample stores two numbers per interface.
+    """
+
+    def __init__(self, rate=RATE, window=WINDOW, path=PROC_NET_DEV):
+        self.rate = rate
+        self.capacity = max(2, int(rate * window) + 1)
+        self.times = array.array('d', bytes(8 * self.capacity))
+        self.position = 0  # of the next sample
+        self.samples = 0
+        # {name: counters ring}, {name: samples when it appeared}
+        self.rings = {}
+        self.added = {}
+        self.names = []
+        self.buffer = bytearray(READ_SIZE)
+        self.f_in = open(path, 'rb', buffering=0)
+
+    def close(self):
+        """Close the counters file."""
+        self.f_in.close()
+
+    def read(self):
+        """Return the file contents, in the reused buffer."""
+        while True:
+            self.f_in.seek(0)
+            size = self.f_in.readinto(self.buffer)
+            if size < len(self.buffer):
+                return memoryview(self.buffer)[:size]
+            # Grown past the buffer, e.g. new interfaces
+            self.buffer = bytearray(len(self.buffer) * 2)
+
+    def update_names(self, names, rx_bytes, tx_bytes):
+        """Add rings for new interfaces, drop the rings of gone ones."""
+        for name in set(self.rings).difference(names):
+            del self.rings[name]
+            del self.added[name]
+        for name, rx, tx in zip(names, rx_bytes, tx_bytes):
+            if name not in self.rings:
+                self.rings[name] = array.array('d', [rx, tx] * self.capacity)
+                self.added[name] = self.samples
+        self.names = names
+
+    def sample(self, now=None):
+        """Append the current counters to the rings."""
+        data = self.read()
+        # Skip the two header lines
+        start = self.buffer.find(b'\n', self.buffer.find(b'\n') + 1) + 1
+        names = []
+        rx_bytes = []
+        tx_bytes = []
+        for line in bytes(data[start:]).splitlines():
+            name, colon, counters = line.rpartition(b':')
+            counters = counters.split()
+            if not colon or len(counters) < FIELDS:
+                continue
+            names.append(name.strip())
+            rx_bytes.append(int(counters[RX_BYTES]))
+            tx_bytes.append(int(counters[TX_BYTES]))
+        if names != self.names:
+            self.update_names(names, rx_bytes, tx_bytes)
+        position = self.position
+        rx_index = position * 2
+        tx_index = rx_index + 1
+        for ring, rx, tx in zip(map(self.rings.__getitem__, names),
+                                rx_bytes, tx_bytes):
+            ring[rx_index] = rx
+            ring[tx_index] = tx
+        self.times[position] = time.monotonic() if now is None else now
+        self.position = (position + 1) % self.capacity
+        self.samples += 1
+
+    def report(self):
+        """Return {interface: rates()} over the window."""
+        count = min(self.samples, self.capacity)
+        split = self.position if count == self.capacity else 0
+        times = self.times[split:count] + self.times[:split]
+        result = {}
+        for name in sorted(self.rings):
+            ring = self.rings[name]
+            # Most are idle (every pair equal, compared as bytes), their
+            # rates need not be computed
+            data = ring.tobytes()
+            if data[16:] == data[:-16]:
+                result[name.decode('ascii', 'replace')] = dict(IDLE)
+                continue
+            counters = ring[split * 2:count * 2] + ring[:split * 2]
+            # Samples since the interface appeared
+            first = max(0, count - (self.samples - self.added[name]))
+            result[name.decode('ascii', 'replace')] = rates(
+                times[first:], counters[first * 2::2],
+                counters[first * 2 + 1::2])
+        return result
+
+    def run(self, report, report_interval=REPORT_INTERVAL):
+        """Sample at the rate, calling report(self.report()) every
+        report_interval, until interrupted."""
+        period = 1.0 / self.rate
+        next_sample = next_report = time.monotonic()
+        next_report += report_interval
+        while True:
+            self.sample()
+            next_sample += period
+            now = time.monotonic()
+            if now >= next_report:
+                report(self.report())
+                next_report += report_interval
+            if next_sample < now:  # fell behind, do not burst
+                next_sample = now
+            time.sleep(next_sample - now)
+
+
+def format_rate(value):
+    """Return bytes per second with an SI unit."""
+    for unit in ['B/s', 'kB/s', 'MB/s']:
+        if value < 1000:
+            return f'{value:.1f} {unit}'
+        value /= 1000
+    return f'{value:.1f} GB/s'
+
+
+if __name__ == '__main__':
+    pass
@@ -25,18 +25,27 @@ See usage.txt for command line usage.
 
 import sys
 
-import cli
-import gui_tk_func as gui
 
-
-def main():
+def run(args):
     """Start CLI or GUI."""
-    args = sys.argv[1:]
+    # Imported here, after --profile has started
     if args and args[0].lower() in ['-g', '--gui']:
+        import gui_tk_func as gui
         gui.start()
     else:
+        import cli
         cli.start(args)
 
 
+def main():
+    """Start CLI or GUI, profiled with --profile[=cpu|imports|alloc]."""
+    args = sys.argv[1:]
+    if args and args[0].partition('=')[0] == '--profile':
+        import profiling
+        return profiling.profile(args[0].partition('=')[2] or 'cpu', run,
+                                 args[1:])
+    return run(args)
+
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Free address blocks among allocated prefixes (IPAM).
+
+The allocated prefixes are merged into a sorted index of disjoint
+intervals, so the free space is the gaps between them. For a block size,
+the aligned free blocks of every gap are counted once and summed, then
+the n-th free block is found by bisecting the running totals: the next
+free blocks inside a range cost a logarithmic search each, however
+fragmented the allocations.
+
+IPv4 intervals are kept in arrays of 64-bit integers, for millions of
+prefixes in little memory.
+"""
+
+import array
+import bisect
+import ipaddress
+import itertools
+import socket
+
+# RFC 1918
+PRIVATE_RANGES = ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16']
+SIZE = 24
+COUNT = 1
+
+BITS = {4: 32, 6: 128}
+FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+
+
+def parse_prefix(text):
+    """Return (version, first, end) of a prefix or an address, end
+    excluded; host bits are ignored."""
+    address, _, length = text.partition('/')
+    version = 6 if ':' in address else 4
+    bits = BITS[version]
+    try:
+        value = int.from_bytes(socket.inet_pton(FAMILIES[version], address),
+                               'big')
+    except OSError:
+        raise ValueError(f'invalid prefix {text!r}') from None
+    length = length or str(bits)
+    if not length.isdigit() or int(length) > bits:
+        raise ValueError(f'invalid prefix {text!r}')
+    size = 1 << (bits - int(length))
+    first = value & -size
+    return version, first, first + size
+
+
+def read_prefixes(path):
+    """Yield the prefixes of a file, the first word of each line; empty
+    lines and # comments are skipped."""
+    with open(path, encoding='ascii', errors='replace') as f_in:
+        for line in f_in:
+            words = line.split(None, 1)
+            if words and not words[0].startswith('#'):
+                yield words[0]
+
+
+def new_array(version, values=()):
+    """Return an array of IPv4 values, a list of IPv6 ones (128 bits)."""
+    return array.array('Q', values) if version == 4 else list(values)
+
+
+def pack_prefixes(prefixes):
+    """Return {version: [first << (bits + 1) | end]} of prefixes (text),
+    one integer per prefix, ordered like (first, end) tuples but cheaper
+    to sort."""
+    packed = {4: [], 6: []}
+    append = packed[4].append
+    inet_pton = socket.inet_pton
+    for prefix in prefixes:
+        address, _, length = prefix.partition('/')
+        if ':' in address or not length.isdigit() or int(length) > 32:
+            version, first, end = parse_prefix(prefix)
+            packed[version].append(first << (BITS[version] + 1) | end)
+            continue
+        try:
+            value = int.from_bytes(inet_pton(socket.AF_INET, address), 'big')
+        except OSError:
+            raise ValueError(f'invalid prefix {prefix!r}') from None
+        size = 1 << (32 - int(length))
+        first = value & -size
+        append(first << 33 | (first + size))
+    return packed
+
+
+def merge(packed, bits):
+    """Return (starts, ends) of the disjoint intervals covering packed
+    prefixes (sorted in place), in order; overlapping and adjacent ones
+    are joined."""
+    packed.sort()
+    width = bits + 1
+    mask = (1 << width) - 1
+    starts = []
+    ends = []
+    last = -1
+    for value in packed:
+        first = value >> width
+        if first <= last:
+            end = value & mask
+            if end > last:
+                last = ends[-1] = end
+        else:
+            last = value & mask
+            starts.append(first)
+            ends.append(last)
+    return starts, ends
+
+
+class FreeIndex:
+    """Sorted disjoint intervals of the allocated space of an IP version,
+    answering which aligned blocks are free."""
+
+    def __init__(self, version, starts=(), ends=()):
+        """starts, ends: of the allocated intervals, disjoint and in
+        order, ends excluded."""
+        self.version = version
+        self.bits = BITS[version]
+        # Gap k is [gap_firsts[k], gap_ends[k]), before the interval k
+        self.gap_firsts = new_array(version, itertools.chain([0], ends))
+        self.gap_ends = new_array(version, itertools.chain(
+            starts, [1 << self.bits]))
+        self.allocated = len(starts)
+        self.totals = {}  # {prefix length: (first blocks, running totals)}
+
+    def blocks(self, length):
+        """Return (first block number of each gap, running totals of the
+        free blocks) of a prefix length, computed once per length."""
+        if length not in self.totals:
+            shift = self.bits - length
+            rounding = (1 << shift) - 1
+            firsts = new_array(self.version, [
+                (first + rounding) >> shift for first in self.gap_firsts])
+            counts = [max(0, (end >> shift) - first)
+                      for first, end in zip(firsts, self.gap_ends)]
+            self.totals[length] = (firsts, new_array(
+                self.version, itertools.accumulate(counts)))
+        return self.totals[length]
+
+    def free(self, length, within, count=COUNT):
+        """Yield up to count free blocks of a prefix length, the first ones
+        inside the network within, as (first address, length)."""
+        if length < within.prefixlen or length > self.bits:
+            raise ValueError(f'/{length} blocks do not fit in {within}')
+        firsts, totals = self.blocks(length)
+        shift = self.bits - length
+        start = int(within.network_address)
+        stop = int(within.broadcast_address) + 1
+        # Rank of the first free block at or after start
+        gap = bisect.bisect_right(self.gap_ends, start)
+        before = totals[gap - 1] if gap else 0
+        rank = before + min(max(0, (start >> shift) - firsts[gap]),
+                            totals[gap] - before)
+        for rank in range(rank, min(rank + count, totals[-1])):
+            gap = bisect.bisect_right(totals, rank)
+            before = totals[gap - 1] if gap else 0
+            first = (firsts[gap] + rank - before) << shift
+            if first >= stop:
+                return
+            yield first, length
+
+
+def build(prefixes):
+    """Return {version: FreeIndex} of allocated prefixes (text)."""
+    return {version: FreeIndex(version, *merge(packed, BITS[version]))
+            for version, packed in pack_prefixes(prefixes).items()}
+
+
+def find_free(indexes, length, ranges=PRIVATE_RANGES, count=COUNT):
+    """Return up to count free blocks of a prefix length, as ipaddress
+    networks, looking in each range (text prefixes) in turn."""
+    result = []
+    for text in ranges:
+        within = ipaddress.ip_network(text, strict=False)
+        for first, block_length in indexes[within.version].free(
+                length, within, count - len(result)):
+            result.append(ipaddress.ip_network((first, block_length)))
+        if len(result) == count:
+            break
+    return result
+
+
+if __name__ == '__main__':
+    pass
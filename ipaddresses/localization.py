@@ -15,58 +15,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Localization module."""
+"""Localization module.
 
-import locale
+The messages of each language are in a module (messages_LANG), compiled
+to bytecode like any module, and only the catalog of the current language
+is loaded, on the first access to a message (e.g. lcl.PRIVATE_IP).
+Languages missing messages fall back to English.
+"""
+
+import os
 import sys
 
+# Code of a messages_CODE module (see messages_module): LANG value
+LANGUAGES = {'en': 'EN', 'pt': 'PT'}
+DEFAULT_LANGUAGE = 'en'
+# Checked in this order, as gettext does
+LANG_VARS = ['LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG']
+
 
 def sys_lang():
-    """Get system language."""
-    lang = locale.getdefaultlocale()
-    if lang and 'pt_' in lang[0].lower():
-        return 'PT'
-    return 'EN'
+    """Get system language, from the environment first."""
+    for var in LANG_VARS:
+        # LANGUAGE is a list, e.g. pt_PT:en
+        for value in os.environ.get(var, '').split(':'):
+            code = value[:2].lower()
+            if code in LANGUAGES:
+                return LANGUAGES[code]
+            if value and var != 'LANGUAGE':
+                return LANGUAGES[DEFAULT_LANGUAGE]
+    if sys.platform == 'win32':
+        import locale  # not needed elsewhere, slow to import
+        lang = locale.getlocale()[0] or ''
+        code = lang[:2].lower()
+        if lang.lower().startswith('portuguese'):
+            code = 'pt'
+        return LANGUAGES.get(code, LANGUAGES[DEFAULT_LANGUAGE])
+    return LANGUAGES[DEFAULT_LANGUAGE]
 
 
 LANG = sys_lang()
 
 FS_ENC = sys.getfilesystemencoding()
-INPUT_ENC = sys.stdin.encoding
+INPUT_ENC = sys.stdin.encoding if sys.stdin else None
 UTF_ENC = 'utf-8'
 
-if LANG == 'PT':
-    ABOUT = 'Sobre'
-    BANNER = (
-        ' não tem QUALQUER GARANTIA. É software livre e você está '
-        'autorizado a redistribui-lo dentro de certas condições.'
-    )
-    EXIT = 'Sair'
-    FILE = 'Ficheiro'
-    HELP = 'Ajuda'
-    PRESS_ANY_KEY = 'Prima qualquer tecla para continuar...'
-    PRIVATE_IP = 'IP privado: '
-    PUBLIC_IP = 'IP público: '
-    VERSION = 'Versão'
-    VERSION_WITH_SPACES = ' versão '
-    WIN_TITLE = 'Endereços IP'
-    WRONG_ARG = 'Erro: argumento incorreto '
-else:
-    ABOUT = 'About'
-    BANNER = (
-        ' comes with ABSOLUTELY NO WARRANTY. This is free software, '
-        'and you are welcome to redistribute it under certain conditions.'
-    )
-    EXIT = 'Exit'
-    FILE = 'File'
-    HELP = 'Help'
-    PRESS_ANY_KEY = 'Press any key to continue...'
-    PRIVATE_IP = 'Private IP: '
-    PUBLIC_IP = 'Public IP: '
-    VERSION = 'Version'
-    VERSION_WITH_SPACES = ' version '
-    WIN_TITLE = 'IP addresses'
-    WRONG_ARG = 'Err: incorrect argument '
+
+def messages_module(code):
+    """Return the messages module of a language code.
+
+    Each module is imported by name, for py2exe and cx_Freeze to find and
+    bundle it, but only when its language is used.
+    """
+    if code == 'pt':
+        import messages_pt as module
+    else:
+        import messages_en as module
+    return module
+
+
+def catalog(lang=None):
+    """Return {name: message} of lang (default LANG)."""
+    code = (lang or LANG).lower()
+    messages = {}
+    for name in dict.fromkeys([DEFAULT_LANGUAGE, code]):
+        module = messages_module(name)
+        messages.update((key, value) for key, value in vars(module).items()
+                        if key.isupper())
+    return messages
+
+
+def __getattr__(name):
+    """Load the catalog on the first access to a message."""
+    messages = catalog()
+    if name in messages:
+        # Later accesses are plain module attributes
+        globals().update(messages)
+        return messages[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""English messages, loaded by localization."""
+
+ABOUT = 'About'
+ADDRESS = 'Address'
+ALL = 'All'
+BANNER = (
+    ' comes with ABSOLUTELY NO WARRANTY. This is free software, '
+    'and you are welcome to redistribute it under certain conditions.'
+)
+BINDING_LIFETIME = 'Binding lifetime: '
+DISAGREEMENT = 'Disagreement: '
+EXIT = 'Exit'
+FILE = 'File'
+FRAME_TIME = 'Frame time p95: '
+HELP = 'Help'
+INTERFACE = 'Interface'
+KIND = 'Kind'
+MAPPED_ADDRESS = 'Mapped address: '
+MISSING_ARG = 'Err: missing argument for '
+NAT_FILTERING = 'NAT filtering: '
+NAT_MAPPING = 'NAT mapping: '
+PREFIX = 'Prefix'
+PRESS_ANY_KEY = 'Press any key to continue...'
+PRIVATE = 'private'
+PRIVATE_IP = 'Private IP: '
+PROFILE_WRITTEN = 'Profile written to '
+PROXY_PUBLIC_IP = 'Public IP (proxy): '
+PUBLIC = 'public'
+PUBLIC_IP = 'Public IP: '
+PRIVATE_IPS = 'Private IPs:'
+PUBLIC_IPS = 'Public IPs:'
+ROWS = 'Rows: '
+VERSION = 'Version'
+VERSION_WITH_SPACES = ' version '
+WIN_TITLE = 'IP addresses'
+WRONG_ARG = 'Err: incorrect argument '
+WRONG_PROFILE_MODE = 'Err: incorrect profile mode '
+
+
+if __name__ == '__main__':
+    pass
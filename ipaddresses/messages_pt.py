@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Portuguese messages, loaded by localization."""
+
+ABOUT = 'Sobre'
+ADDRESS = 'Endereço'
+ALL = 'Todos'
+BANNER = (
+    ' não tem QUALQUER GARANTIA. É software livre e você está '
+    'autorizado a redistribui-lo dentro de certas condições.'
+)
+BINDING_LIFETIME = 'Duração da associação: '
+DISAGREEMENT = 'Desacordo: '
+EXIT = 'Sair'
+FILE = 'Ficheiro'
+FRAME_TIME = 'Tempo por frame (p95): '
+HELP = 'Ajuda'
+INTERFACE = 'Interface'
+KIND = 'Tipo'
+MAPPED_ADDRESS = 'Endereço mapeado: '
+MISSING_ARG = 'Erro: argumento em falta para '
+NAT_FILTERING = 'Filtragem NAT: '
+NAT_MAPPING = 'Mapeamento NAT: '
+PREFIX = 'Prefixo'
+PRESS_ANY_KEY = 'Prima qualquer tecla para continuar...'
+PRIVATE = 'privado'
+PRIVATE_IP = 'IP privado: '
+PROFILE_WRITTEN = 'Perfil gravado em '
+PROXY_PUBLIC_IP = 'IP público (proxy): '
+PUBLIC = 'público'
+PUBLIC_IP = 'IP público: '
+PRIVATE_IPS = 'IPs privados:'
+PUBLIC_IPS = 'IPs públicos:'
+ROWS = 'Linhas: '
+VERSION = 'Versão'
+VERSION_WITH_SPACES = ' versão '
+WIN_TITLE = 'Endereços IP'
+WRONG_ARG = 'Erro: argumento incorreto '
+WRONG_PROFILE_MODE = 'Erro: modo de perfil incorreto '
+
+
+if __name__ == '__main__':
+    pass
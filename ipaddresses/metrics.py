@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Prometheus metrics of the watched addresses.
+
+Exposed over HTTP (serve) and/or written for the node_exporter textfile
+collector (write_textfile). Metrics are updated by one thread, the watch
+loop, without locks: every update replaces a value in a dict and renders
+only copy the dicts, so a scrape never blocks a refresh.
+"""
+
+import bisect
+import http.server
+import os
+import threading
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = 'ipaddresses'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    """Escape a label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def labels(**kwargs):
+    """Return the {a="b",...} label string."""
+    return '{' + ','.join(f'{key}="{escape(value)}"'
+                          for key, value in kwargs.items()) + '}'
+
+
+class Metrics:
+    """Address state, change counters, fetch latencies and errors."""
+
+    def __init__(self):
+        self.addresses = {}
+        self.changes = {}
+        self.durations = {}
+        self.errors = {}
+
+    def set_address(self, kind, address):
+        """Record the current address of kind, counting changes."""
+        if self.addresses.get(kind) != address:
+            # The first address is not a change
+            self.changes[kind] = self.changes.get(kind, -1) + 1
+            self.addresses[kind] = address
+
+    def observe(self, provider, phase, seconds):
+        """Record a fetch phase duration."""
+        key = (provider, phase)
+        # (bucket counts, sum, count) replaced as a whole
+        counts, total, count = self.durations.get(
+            key, ((0,) * len(BUCKETS), 0.0, 0))
+        index = bisect.bisect_left(BUCKETS, seconds)
+        counts = counts[:index] + tuple(
+            value + 1 for value in counts[index:])
+        self.durations[key] = (counts, total + seconds, count + 1)
+
+    def error(self, provider, exception):
+        """Count a fetch error by exception type."""
+        exception = exception.__cause__ or exception
+        key = (provider, type(exception).__name__)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def render(self):
+        """Return the metrics in Prometheus text format."""
+        lines = [f'# HELP {PREFIX}_address_info Current address.',
+                 f'# TYPE {PREFIX}_address_info gauge']
+        lines += [f'{PREFIX}_address_info' +
+                  labels(kind=kind, address=address) + ' 1'
+                  for kind, address in list(self.addresses.items())]
+
+        lines += [f'# HELP {PREFIX}_address_changes_total Address changes.',
+                  f'# TYPE {PREFIX}_address_changes_total counter']
+        lines += [f'{PREFIX}_address_changes_total{labels(kind=kind)} {count}'
+                  for kind, count in list(self.changes.items())]
+
+        name = f'{PREFIX}_fetch_duration_seconds'
+        lines += [f'# HELP {name} Fetch duration by provider and phase.',
+                  f'# TYPE {name} histogram']
+        for (provider, phase), (counts, total, count) in list(
+                self.durations.items()):
+            for bucket, value in zip(BUCKETS, counts):
+                lines.append(f'{name}_bucket' + labels(
+                    provider=provider, phase=phase, le=bucket) + f' {value}')
+            key = labels(provider=provider, phase=phase)
+            lines += [f'{name}_bucket' + labels(
+                provider=provider, phase=phase, le='+Inf') + f' {count}',
+                      f'{name}_sum{key} {total}',
+                      f'{name}_count{key} {count}']
+
+        name = f'{PREFIX}_fetch_errors_total'
+        lines += [f'# HELP {name} Fetch errors by provider and type.',
+                  f'# TYPE {name} counter']
+        lines += [f'{name}{labels(provider=provider, type=type_)} {count}'
+                  for (provider, type_), count in list(self.errors.items())]
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Write the metrics atomically for the textfile collector."""
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f_out:
+            f_out.write(self.render())
+        os.replace(temp_path, path)
+
+    def serve(self, port, host=''):
+        """Serve /metrics over HTTP from a daemon thread."""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Metrics request handler."""
+
+            def do_GET(self):
+                """Send the metrics."""
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """Do not log requests."""
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAT behaviour discovery with STUN (RFC 5780).
+
+The mapping and the filtering tests run at the same time from two UDP
+sockets, the filtering tests from a socket that only ever talked to the
+primary address of the server, so the mapping tests cannot open its
+filters. After the first binding request, the other transactions of each
+test run concurrently: the diagnostic takes about two round trips, plus
+the timeout of the requests a filtering NAT drops.
+
+The binding lifetime probes, one socket each, also run concurrently: each
+socket gets a binding, waits its probe time, then a second socket asks
+the server to answer to the first one's mapped port (RESPONSE-PORT).
+"""
+
+import asyncio
+import os
+import socket
+import struct
+
+PORT = 3478
+SERVER = 'stun.stunprotocol.org'
+TIMEOUT = 2.0
+RETRANSMIT = 0.25  # first retransmission, then doubling
+LIFETIME_PROBES = (5, 15, 30, 60, 120, 300, 600)
+
+MAGIC_COOKIE = 0x2112a442
+BINDING_REQUEST = 0x0001
+BINDING_RESPONSE = 0x0101
+MAPPED_ADDRESS = 0x0001
+CHANGE_REQUEST = 0x0003
+XOR_MAPPED_ADDRESS = 0x0020
+RESPONSE_PORT = 0x0027
+RESPONSE_ORIGIN = 0x802b
+OTHER_ADDRESS = 0x802c
+CHANGE_IP = 0x4
+CHANGE_PORT = 0x2
+FAMILIES = {1: socket.AF_INET, 2: socket.AF_INET6}
+
+# Type, length, magic cookie, transaction id
+HEADER = struct.Struct('>HHI12s')
+
+# Behaviours (RFC 4787 terms)
+NO_NAT = 'no NAT'
+ENDPOINT_INDEPENDENT = 'endpoint-independent'
+ADDRESS_DEPENDENT = 'address-dependent'
+ADDRESS_PORT_DEPENDENT = 'address and port-dependent'
+UNKNOWN = 'unknown (server without RFC 5780 support)'
+
+
+class NatError(RuntimeError):
+    """The STUN server did not answer."""
+
+
+def encode_message(message_type, transaction, attributes=()):
+    """Return a STUN message with [(type, value)] attributes."""
+    body = b''
+    for attr_type, value in attributes:
+        body += struct.pack('>HH', attr_type, len(value)) + value + \
+            bytes(-len(value) % 4)
+    return HEADER.pack(message_type, len(body), MAGIC_COOKIE,
+                       transaction) + body
+
+
+def encode_request(transaction, change=0, response_port=None):
+    """Return a binding request, asking for a change of source address
+    and/or port or for the answer on response_port."""
+    attributes = []
+    if change:
+        attributes.append((CHANGE_REQUEST, struct.pack('>I', change)))
+    if response_port is not None:
+        attributes.append((RESPONSE_PORT, struct.pack('>HH', response_port,
+                                                      0)))
+    return encode_message(BINDING_REQUEST, transaction, attributes)
+
+
+def xor_mask(transaction):
+    """Return the XOR mask of XOR-MAPPED-ADDRESS addresses."""
+    return struct.pack('>I', MAGIC_COOKIE) + transaction
+
+
+def encode_address(endpoint, transaction=None):
+    """Return an address attribute value, XORed with transaction."""
+    family = socket.AF_INET6 if ':' in endpoint[0] else socket.AF_INET
+    packed = socket.inet_pton(family, endpoint[0])
+    port = endpoint[1]
+    if transaction is not None:
+        port ^= MAGIC_COOKIE >> 16
+        packed = bytes(a ^ b for a, b in zip(packed, xor_mask(transaction)))
+    return struct.pack('>BBH', 0, 1 if family == socket.AF_INET else 2,
+                       port) + packed
+
+
+def decode_address(value, transaction=None):
+    """Return the (ip, port) of an address attribute value."""
+    _, family, port = struct.unpack_from('>BBH', value)
+    packed = value[4:]
+    if transaction is not None:
+        port ^= MAGIC_COOKIE >> 16
+        packed = bytes(a ^ b for a, b in zip(packed, xor_mask(transaction)))
+    return socket.inet_ntop(FAMILIES[family], packed), port
+
+
+def parse_message(data):
+    """Return (type, transaction, {attribute type: value}) of a STUN
+    message, raise ValueError if it is not one."""
+    if len(data) < HEADER.size:
+        raise ValueError('short STUN message')
+    message_type, length, cookie, transaction = HEADER.unpack_from(data)
+    if cookie != MAGIC_COOKIE or HEADER.size + length > len(data):
+        raise ValueError('not a STUN message')
+    attributes = {}
+    offset = HEADER.size
+    end = offset + length
+    while offset + 4 <= end:
+        attr_type, size = struct.unpack_from('>HH', data, offset)
+        attributes.setdefault(attr_type,
+                              data[offset + 4:offset + 4 + size])
+        offset += 4 + size + (-size % 4)
+    return message_type, transaction, attributes
+
+
+def parse_response(data):
+    """Return {'mapped', 'other', 'origin': (ip, port) or None} of a
+    binding response."""
+    _, transaction, attributes = parse_message(data)
+    if XOR_MAPPED_ADDRESS in attributes:
+        mapped = decode_address(attributes[XOR_MAPPED_ADDRESS], transaction)
+    elif MAPPED_ADDRESS in attributes:  # RFC 3489 servers
+        mapped = decode_address(attributes[MAPPED_ADDRESS])
+    else:
+        raise ValueError('binding response without mapped address')
+    return {'mapped': mapped,
+            'other': decode_address(attributes[OTHER_ADDRESS])
+            if OTHER_ADDRESS in attributes else None,
+            'origin': decode_address(attributes[RESPONSE_ORIGIN])
+            if RESPONSE_ORIGIN in attributes else None}
+
+
+class Client(asyncio.DatagramProtocol):
+    """Concurrent STUN transactions from one UDP socket."""
+
+    def __init__(self):
+        self.pending = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            message_type, transaction, _ = parse_message(data)
+        except ValueError:
+            return
+        future = self.pending.get(transaction)
+        if message_type == BINDING_RESPONSE and future is not None and \
+                not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        """Ignore ICMP errors, the transaction times out."""
+
+    @property
+    def local(self):
+        """Return the local (ip, port)."""
+        return self.transport.get_extra_info('sockname')[:2]
+
+    async def request(self, server, change=0, response_port=None, via=None,
+                      timeout=TIMEOUT):
+        """Return the parsed response to a binding request or None if it
+        did not arrive within timeout, retransmitting meanwhile.
+
+        The request is sent from via (a Client) if given, the response is
+        expected here.
+        """
+        loop = asyncio.get_running_loop()
+        transaction = os.urandom(12)
+        message = encode_request(transaction, change, response_port)
+        future = self.pending[transaction] = loop.create_future()
+        sender = (via or self).transport
+        deadline = loop.time() + timeout
+        delay = RETRANSMIT
+        try:
+            while True:
+                sender.sendto(message, server)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    return parse_response(await asyncio.wait_for(
+                        asyncio.shield(future), min(delay, remaining)))
+                except asyncio.TimeoutError:
+                    delay *= 2
+                except ValueError:
+                    return None
+        finally:
+            del self.pending[transaction]
+
+
+async def open_client(server):
+    """Return a Client bound to the local address that reaches server."""
+    family = socket.AF_INET6 if ':' in server[0] else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as probe:
+        probe.connect(server)  # no packet sent, picks the source address
+        local = probe.getsockname()[0]
+    _, client = await asyncio.get_running_loop().create_datagram_endpoint(
+        Client, local_addr=(local, 0))
+    return client
+
+
+def mapping_behaviour(first, second, third):
+    """Return the mapping behaviour from the responses of the primary,
+    the other address with the primary port and the other address."""
+    if second is None:
+        return UNKNOWN
+    if second['mapped'] == first['mapped']:
+        return ENDPOINT_INDEPENDENT
+    if third is None:
+        return UNKNOWN
+    if third['mapped'] == second['mapped']:
+        return ADDRESS_DEPENDENT
+    return ADDRESS_PORT_DEPENDENT
+
+
+def filtering_behaviour(change_both, change_port):
+    """Return the filtering behaviour from the responses (or None) to the
+    change address and port and the change port requests."""
+    if change_both is not None:
+        return ENDPOINT_INDEPENDENT
+    if change_port is not None:
+        return ADDRESS_DEPENDENT
+    return ADDRESS_PORT_DEPENDENT
+
+
+async def binding_lifetime(server, maximum, via):
+    """Return (longest probe time the binding outlived, shortest one it
+    did not or None), probing up to maximum seconds concurrently."""
+    waits = sorted({wait for wait in LIFETIME_PROBES if wait < maximum} |
+                   {maximum})
+
+    async def probe(wait):
+        client = await open_client(server)
+        try:
+            response = await client.request(server)
+            if response is None:
+                return None
+            await asyncio.sleep(wait)
+            return await client.request(
+                server, response_port=response['mapped'][1], via=via)
+        finally:
+            client.transport.close()
+
+    results = await asyncio.gather(*(probe(wait) for wait in waits))
+    alive = [wait for wait, result in zip(waits, results)
+             if result is not None]
+    dead = [wait for wait, result in zip(waits, results) if result is None]
+    return max(alive, default=0), min(dead, default=None)
+
+
+async def diagnose(host=SERVER, port=PORT, lifetime=None):
+    """Return {'local', 'mapped': (ip, port), 'nat': bool, 'mapping',
+    'filtering': behaviour, 'lifetime': (outlived, expired) or None}.
+
+    lifetime, the longest binding lifetime to probe in seconds, makes it
+    take that long.
+    """
+    loop = asyncio.get_running_loop()
+    info = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    server = info[0][4][:2]
+    mapping, filtering = await asyncio.gather(open_client(server),
+                                              open_client(server))
+    try:
+        first, filter_first = await asyncio.gather(
+            mapping.request(server), filtering.request(server))
+        if first is None or filter_first is None:
+            raise NatError(f'No answer from STUN server {host}:{port}')
+        result = {'local': mapping.local, 'mapped': first['mapped'],
+                  'nat': first['mapped'] != mapping.local,
+                  'mapping': UNKNOWN, 'filtering': UNKNOWN,
+                  'lifetime': None}
+        other = first['other']
+        tests = []
+        if other is not None:
+            tests = [mapping.request((other[0], server[1])),
+                     mapping.request(other),
+                     filtering.request(server, CHANGE_IP | CHANGE_PORT),
+                     filtering.request(server, CHANGE_PORT)]
+        if lifetime:
+            tests.append(binding_lifetime(server, lifetime, mapping))
+        responses = await asyncio.gather(*tests)
+        if other is not None:
+            result['mapping'] = mapping_behaviour(first, *responses[:2]) \
+                if result['nat'] else NO_NAT
+            result['filtering'] = filtering_behaviour(*responses[2:4])
+        if lifetime:
+            result['lifetime'] = responses[-1]
+        return result
+    finally:
+        mapping.transport.close()
+        filtering.transport.close()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Address inventory of every network namespace (Linux).
+
+Entering a namespace (setns) changes the calling thread only, so each
+namespace is visited by a process pool worker. Needs CAP_SYS_ADMIN.
+"""
+
+import concurrent.futures as cf
+import ctypes
+import glob
+import os
+
+import shared as shrd
+
+CLONE_NEWNET = 0x40000000
+NETNS_DIR = '/var/run/netns'
+PROC_DIR = '/proc'
+
+
+def setns(fd, nstype):
+    """Move the calling thread into the namespace of fd."""
+    if hasattr(os, 'setns'):  # Python 3.12+
+        os.setns(fd, nstype)
+        return
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setns(fd, nstype) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def find_namespaces(netns_dir=NETNS_DIR, proc_dir=PROC_DIR):
+    """Return {inode: {'path', 'names', 'pids'}} of network namespaces."""
+    namespaces = {}
+
+    def add(path, name=None, pid=None):
+        """Add path to its namespace, deduplicated by inode."""
+        try:
+            stat = os.stat(path)
+        except OSError:  # process gone or no permission
+            return
+        namespace = namespaces.setdefault(
+            stat.st_ino, {'path': path, 'names': [], 'pids': []})
+        if name is not None:
+            namespace['names'].append(name)
+        if pid is not None:
+            namespace['pids'].append(pid)
+
+    for path in sorted(glob.glob(os.path.join(netns_dir, '*'))):
+        add(path, name=os.path.basename(path))
+    for path in glob.glob(os.path.join(proc_dir, '[0-9]*', 'ns', 'net')):
+        add(path, pid=int(path.split(os.sep)[-3]))
+    for namespace in namespaces.values():
+        namespace['pids'].sort()
+    return namespaces
+
+
+def namespace_ips(path):
+    """Return (interfaces, error) of the namespace at path."""
+    try:
+        with open(path, 'rb') as f_in:
+            setns(f_in.fileno(), CLONE_NEWNET)
+        return ({iface: [str(ip) for ip in ips]
+                 for iface, ips in shrd.get_interface_ips().items()}, None)
+    except OSError as e:
+        return {}, f'{type(e).__name__}: {e}'
+
+
+def inventory(namespaces=None, workers=None):
+    """Return [{'inode', 'names', 'pids', 'interfaces', 'error'}]."""
+    if namespaces is None:
+        namespaces = find_namespaces()
+    inodes = sorted(namespaces)
+    paths = [namespaces[inode]['path'] for inode in inodes]
+    with cf.ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(namespace_ips, paths,
+                               chunksize=max(1, len(paths) // 64))
+        return [{'inode': inode,
+                 'names': namespaces[inode]['names'],
+                 'pids': namespaces[inode]['pids'],
+                 'interfaces': interfaces,
+                 'error': error}
+                for inode, (interfaces, error) in zip(inodes, results)]
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Remote peers of the current TCP and UDP sockets (Linux)."""
+
+import collections
+import ipaddress
+
+import shared as shrd
+
+PROC_FILES = ['/proc/net/tcp', '/proc/net/tcp6',
+              '/proc/net/udp', '/proc/net/udp6']
+
+READ_SIZE = 1024 * 1024
+MAX_CACHE = 1 << 20
+
+
+def parse_address(field):
+    """Return the address of a /proc/net hex address field or None."""
+    raw = bytes.fromhex(field.decode('ascii'))
+    if not any(raw):
+        return None  # listening or unconnected
+    # Host byte order 32 bit words
+    packed = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    address = ipaddress.ip_address(packed)
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return str(address)
+
+
+class PeerReader:
+    """Reads remote addresses, memoizing the parsed address fields."""
+
+    def __init__(self, paths=None):
+        self.paths = PROC_FILES if paths is None else paths
+        self.cache = {}
+
+    def read(self):
+        """Return a Counter of remote addresses."""
+        if len(self.cache) > MAX_CACHE:
+            self.cache.clear()
+        cache = self.cache
+        counter = collections.Counter()
+        for path in self.paths:
+            try:
+                f_in = open(path, 'rb', buffering=READ_SIZE)
+            except OSError:  # no IPv6
+                continue
+            with f_in:
+                next(f_in, None)  # header
+                # sl local_address rem_address st ..., only the address of
+                # rem_address (ADDRESS:PORT, port always 4 hex digits) is used
+                remotes = collections.Counter(
+                    line.split(None, 3)[2][:-5] for line in f_in)
+            for remote, count in remotes.items():
+                if remote not in cache:
+                    cache[remote] = parse_address(remote)
+                address = cache[remote]
+                if address is not None:
+                    counter[address] += count
+        return counter
+
+
+def classify(counter):
+    """Split a Counter of addresses by classification (PRIVATE, PUBLIC)."""
+    result = {shrd.PRIVATE: collections.Counter(),
+              shrd.PUBLIC: collections.Counter()}
+    for address, count in counter.items():
+        result[shrd.classify_ip(address)][address] = count
+    return result
+
+
+def diff(old, new):
+    """Return [(address, old count, new count)] of changed addresses."""
+    changes = [(address, count, new.get(address, 0))
+               for address, count in old.items()
+               if new.get(address, 0) != count]
+    changes += [(address, 0, count) for address, count in new.items()
+                if address not in old]
+    return changes
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Profile a run (--profile[=cpu|imports|alloc]) and write a report file.
+
+Imported only when profiling, before the modules of the commands, so their
+imports are profiled too.
+"""
+
+import cProfile
+import pstats
+import sys
+import time
+import tracemalloc
+
+REPORT_FILE = 'ipaddresses-profile-{mode}.txt'
+TOP = 40
+TRACE_FRAMES = 10
+
+
+class CpuProfiler:
+    """cProfile stats, by cumulative time."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        """Start profiling."""
+        self.profiler.enable()
+
+    def stop(self):
+        """Stop profiling."""
+        self.profiler.disable()
+
+    def report(self, f_out):
+        """Write the top functions."""
+        stats = pstats.Stats(self.profiler, stream=f_out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP)
+
+
+class ImportProfiler:
+    """Import times in the format of python -X importtime.
+
+    A meta path finder times the execution of every module found by the
+    other finders (modules of built-in loaders are not timed).
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.lines = []
+        self.finding = set()
+
+    def start(self):
+        """Install the finder."""
+        sys.meta_path.insert(0, self)
+
+    def stop(self):
+        """Remove the finder."""
+        sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        """Find the spec with the other finders, timing its loader."""
+        if name in self.finding:
+            return None
+        self.finding.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.finding.discard(name)
+        loader = spec.loader
+        # Class loaders (built-in, frozen) are shared, not patched
+        if loader is not None and not isinstance(loader, type) and \
+                hasattr(loader, 'exec_module'):
+            loader.exec_module = self.timed(name, loader.exec_module)
+        return spec
+
+    def timed(self, name, exec_module):
+        """Return exec_module recording its self and cumulative time."""
+        def wrapper(module):
+            # Each entry: [children time]
+            self.stack.append([0])
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                cumulative = time.perf_counter() - start
+                children = self.stack.pop()[0]
+                if self.stack:
+                    self.stack[-1][0] += cumulative
+                self.lines.append((cumulative - children, cumulative,
+                                   len(self.stack), name))
+        return wrapper
+
+    def report(self, f_out):
+        """Write the import tree, innermost first as -X importtime."""
+        f_out.write('import time: self [us] | cumulative | imported package\n')
+        for own, cumulative, depth, name in self.lines:
+            f_out.write(f'import time: {own * 1e6:9.0f} | '
+                        f'{cumulative * 1e6:10.0f} | {"  " * depth}{name}\n')
+        f_out.write('\nslowest:\n')
+        for own, cumulative, _, name in sorted(self.lines, reverse=True)[
+                :TOP]:
+            f_out.write(f'{own * 1e6:9.0f} {cumulative * 1e6:10.0f} '
+                        f'{name}\n')
+
+
+class AllocProfiler:
+    """tracemalloc top allocations and peak."""
+
+    def __init__(self):
+        self.snapshot = None
+        self.peak = 0
+
+    def start(self):
+        """Start tracing."""
+        tracemalloc.start(TRACE_FRAMES)
+
+    def stop(self):
+        """Take the snapshot and stop tracing."""
+        self.snapshot = tracemalloc.take_snapshot()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def report(self, f_out):
+        """Write the peak and the top allocation sites."""
+        f_out.write(f'peak: {self.peak / 1024:.1f} KiB\n\n')
+        for stat in self.snapshot.statistics('lineno')[:TOP]:
+            f_out.write(f'{stat}\n')
+        f_out.write('\nlargest tracebacks:\n')
+        for stat in self.snapshot.statistics('traceback')[:5]:
+            f_out.write(f'\n{stat}\n')
+            f_out.write('\n'.join(stat.traceback.format()) + '\n')
+
+
+PROFILERS = {'cpu': CpuProfiler, 'imports': ImportProfiler,
+             'alloc': AllocProfiler}
+
+
+def profile(mode, func, *args):
+    """Return func(*args) profiled by mode, writing the report file."""
+    if mode not in PROFILERS:
+        import localization as lcl
+        print(lcl.WRONG_PROFILE_MODE + f"{mode} ({'|'.join(PROFILERS)})",
+              file=sys.stderr)
+        return 2
+    profiler = PROFILERS[mode]()
+    profiler.start()
+    try:
+        return func(*args)
+    finally:
+        profiler.stop()
+        path = REPORT_FILE.format(mode=mode)
+        with open(path, 'w', encoding='utf-8') as f_out:
+            profiler.report(f_out)
+        # Imported by the profiled run already, it is not profiled here
+        import localization as lcl
+        print(lcl.PROFILE_WRITTEN + path, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    pass
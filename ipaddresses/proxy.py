@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+HTTP proxy support for the public IP providers, with pooled connections.
+
+The proxy of a provider is its entry in PROVIDER_PROXIES, else PROXY,
+else the one of the environment (https_proxy, http_proxy, no_proxy).
+HTTPS requests go through a CONNECT tunnel, HTTP ones are sent to the
+proxy with the absolute URI. The connection is kept in a pool after the
+response: the next request to the provider reuses it, without a new
+proxy connection, CONNECT round trip or TLS handshake.
+"""
+
+import base64
+import collections
+import contextlib
+import http.client
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Proxy URL of every provider, '' for none, None for the environment's
+PROXY = None
+# {provider URL or host: proxy URL, '' for none}
+PROVIDER_PROXIES = {}
+PROXY_PORT = 8080
+POOL_SIZE = 4  # idle tunnels kept per proxy and provider
+IDLE_TIMEOUT = 30.0
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def proxy_for(url):
+    """Return the proxy URL for url, or None to connect directly."""
+    parts = urllib.parse.urlsplit(url)
+    for key in [url, parts.netloc, parts.hostname]:
+        if key in PROVIDER_PROXIES:
+            return PROVIDER_PROXIES[key] or None
+    if PROXY is not None:
+        return PROXY or None
+    proxy = urllib.request.getproxies().get(parts.scheme)
+    if proxy and urllib.request.proxy_bypass(parts.hostname):
+        return None
+    return proxy or None
+
+
+def authorization(proxy):
+    """Return the Proxy-Authorization headers of the credentials in a
+    proxy URL."""
+    parts = urllib.parse.urlsplit(proxy)
+    if parts.username is None:
+        return {}
+    credentials = (urllib.parse.unquote(parts.username) + ':' +
+                   urllib.parse.unquote(parts.password or ''))
+    return {'Proxy-Authorization': 'Basic ' + base64.b64encode(
+        credentials.encode('utf-8')).decode('ascii')}
+
+
+class TunnelPool:
+    """Idle CONNECT tunnels and HTTP proxy connections, per (proxy, scheme,
+    host, port)."""
+
+    def __init__(self, size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = collections.defaultdict(list)  # of (connection, since)
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def get(self, key, timeout):
+        """Return (connection, reused) to the provider of key, an idle
+        one if there is one; a new HTTPS one is tunneled."""
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle[key]
+            while idle:
+                connection, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    self.stats['reused'] += 1
+                    connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+            self.stats['opened'] += 1
+        proxy, scheme, host, port = key
+        parts = urllib.parse.urlsplit(proxy)
+        if parts.scheme != 'http':
+            raise ValueError(f'unsupported proxy {proxy}')
+        connection = (http.client.HTTPSConnection if scheme == 'https' else
+                      http.client.HTTPConnection)(
+                          parts.hostname, parts.port or PROXY_PORT,
+                          timeout=timeout)
+        if scheme == 'https':
+            connection.set_tunnel(host, port, authorization(proxy))
+        return connection, False
+
+    def put(self, key, connection):
+        """Keep a tunnel for reuse, or close it if the pool is full."""
+        with self.lock:
+            idle = self.idle[key]
+            if len(idle) < self.size:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def close(self):
+        """Close the idle tunnels."""
+        with self.lock:
+            for idle in self.idle.values():
+                for connection, _ in idle:
+                    connection.close()
+            self.idle.clear()
+
+
+POOL = TunnelPool()
+
+
+@contextlib.contextmanager
+def urlopen(url, proxy, timeout, pool=None):
+    """Return the response to a GET of url through proxy, like
+    urllib.request.urlopen (HTTPError for error statuses).
+
+    The connection goes back to the pool if the response was read to its
+    end and the provider (or the proxy, for HTTP) keeps it open. A pooled
+    connection closed meanwhile is replaced once.
+    """
+    pool = POOL if pool is None else pool
+    parts = urllib.parse.urlsplit(url)
+    key = (proxy, parts.scheme, parts.hostname,
+           parts.port or DEFAULT_PORTS[parts.scheme])
+    headers = {'User-Agent': 'Python-urllib/' + urllib.request.__version__}
+    if parts.scheme == 'https':
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/',
+                                          parts.query, ''))
+    else:  # absolute URI, the proxy makes the request
+        target = urllib.parse.urlunsplit((parts.scheme, parts.netloc,
+                                          parts.path or '/', parts.query,
+                                          ''))
+        headers.update(authorization(proxy))
+    while True:
+        connection, reused = pool.get(key, timeout)
+        try:
+            connection.request('GET', target, headers=headers)
+            response = connection.getresponse()
+            break
+        except ConnectionError:
+            connection.close()
+            if not reused:
+                raise
+        except BaseException:
+            connection.close()
+            raise
+    keep = False
+    try:
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status,
+                                         response.reason, response.headers,
+                                         None)
+        yield response
+        if response.length == 0:  # read to its end, the tunnel is idle
+            response.close()
+        keep = response.isclosed() and not response.will_close
+    finally:
+        if keep:
+            pool.put(key, connection)
+        else:
+            connection.close()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client-side rate limiting of public IP providers.
+
+Each provider (URL host) has a token bucket shared by the threads of the
+process. Throttled requests (429, 5xx) are retried after a decorrelated
+jitter backoff, or after Retry-After if the provider sent one, which also
+pauses the provider's bucket. start_offset spreads scheduled runs of a fleet
+over a window with a fixed delay per host.
+"""
+
+import email.utils
+import hashlib
+import random
+import socket
+import threading
+import time
+import urllib.parse
+
+RATE = 1.0  # requests per second per provider
+BURST = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+BUCKETS = {}
+BUCKETS_LOCK = threading.Lock()
+
+
+class TokenBucket:
+    """Allows rate requests per second, with bursts of up to burst."""
+
+    def __init__(self, rate=RATE, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        """Add the tokens earned since the last update (lock held)."""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, return the seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.tokens -= 1
+            # A negative balance is the queue of waiting requests
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def take(self):
+        """Take a token if there is one, without waiting."""
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            if self.tokens < 1 or now < self.paused_until:
+                return False
+            self.tokens -= 1
+            return True
+
+    def acquire(self, stop=None):
+        """Wait for a token, or until the stop event is set."""
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait, stop)
+
+    def pause(self, seconds):
+        """Send no request for seconds (Retry-After)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until,
+                                    time.monotonic() + seconds)
+
+
+class Backoff:
+    """Decorrelated jitter: each delay is random in [base, 3 * previous],
+    capped."""
+
+    def __init__(self, base=BACKOFF_BASE, cap=BACKOFF_CAP, rnd=random):
+        self.base = base
+        self.cap = cap
+        self.rnd = rnd
+        self.delay = base
+
+    def next(self):
+        """Return the next delay."""
+        self.delay = min(self.cap, self.rnd.uniform(self.base,
+                                                    self.delay * 3))
+        return self.delay
+
+
+def sleep(seconds, stop=None):
+    """Sleep for seconds, or until the stop event is set."""
+    if stop is None:
+        time.sleep(seconds)
+    else:
+        stop.wait(seconds)
+
+
+def bucket(url, rate=RATE, burst=BURST):
+    """Return the token bucket of the provider (host) of url."""
+    host = urllib.parse.urlsplit(url).netloc
+    with BUCKETS_LOCK:
+        if host not in BUCKETS:
+            BUCKETS[host] = TokenBucket(rate, burst)
+        return BUCKETS[host]
+
+
+def retry_after(value, now=None):
+    """Return the seconds of a Retry-After header (seconds or HTTP date),
+    0 if missing or invalid."""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, date.timestamp() - (time.time() if now is None else now))
+
+
+def start_offset(window, host=None):
+    """Return a delay in [0, window) that is fixed for host."""
+    if host is None:
+        host = socket.gethostname()
+    digest = hashlib.blake2b(host.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64 * window
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Background refresh of the addresses, for services.
+
+A Refresher thread fetches the private and public IP every interval, or
+sooner when triggered, and publishes them as an immutable Snapshot.
+Readers get the latest one with a single attribute load, never blocking
+on the network or on a lock:
+
+    refresher = Refresher().start()
+    address = refresher.snapshot.public
+"""
+
+import collections
+import threading
+import time
+
+import shared as shrd
+
+INTERVAL = 60.0
+STOP_TIMEOUT = 10.0
+
+
+class Snapshot(collections.namedtuple(
+        'Snapshot', 'private public private_time public_time error')):
+    """Addresses, the time each one was fetched (None if never) and the
+    last fetch error (None if the last refresh succeeded)."""
+
+    __slots__ = ()
+
+    def age(self, kind=shrd.PUBLIC, now=None):
+        """Return the seconds since the address of kind was fetched."""
+        fetched = self.public_time if kind == shrd.PUBLIC else \
+            self.private_time
+        if fetched is None:
+            return float('inf')
+        return (time.time() if now is None else now) - fetched
+
+    def stale(self, max_age, kind=shrd.PUBLIC, now=None):
+        """Return True if the address of kind is older than max_age."""
+        return self.age(kind, now) > max_age
+
+
+EMPTY = Snapshot(None, None, None, None, None)
+
+
+class Refresher:
+    """Refreshes the addresses in a daemon thread."""
+
+    def __init__(self, interval=INTERVAL, url=None):
+        self.interval = interval
+        self.url = url
+        self.snapshot = EMPTY
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.refreshed = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Start the thread, return self."""
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stop the thread, waiting up to timeout for a fetch in progress;
+        waits for the provider's rate limit or backoff end at once."""
+        self.stopping.set()
+        self.wake.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def trigger(self):
+        """Refresh now, e.g. on a network change event."""
+        self.wake.set()
+
+    def wait(self, timeout=None):
+        """Wait for the first refresh, return the snapshot."""
+        with self.refreshed:
+            self.refreshed.wait_for(
+                lambda: self.snapshot is not EMPTY, timeout)
+        return self.snapshot
+
+    def refresh(self):
+        """Fetch the addresses and publish a new snapshot."""
+        old = self.snapshot
+        private, private_time = old.private, old.private_time
+        public, public_time = old.public, old.public_time
+        error = None
+        try:
+            private = shrd.get_private_ip()
+            private_time = time.time()
+        except OSError as e:
+            error = str(e)
+        try:
+            public = shrd.get_public_ip(self.url, stop=self.stopping)
+            public_time = time.time()
+        except RuntimeError as e:
+            if self.stopping.is_set():
+                return
+            error = str(e)
+        # One reference assignment, readers see the old or the new one
+        self.snapshot = Snapshot(private, public, private_time, public_time,
+                                 error)
+        with self.refreshed:
+            self.refreshed.notify_all()
+
+    def run(self):
+        """Refresh every interval or when triggered, until stopped."""
+        while not self.stopping.is_set():
+            # Cleared first, a trigger during the refresh is kept
+            self.wake.clear()
+            self.refresh()
+            self.wake.wait(self.interval)
+
+
+if __name__ == '__main__':
+    pass
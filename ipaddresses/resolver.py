@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Concurrent DNS resolution of many names.
+
+An asyncio stub resolver sends the A and AAAA queries of many names (or
+the PTR queries of many addresses) at once over one UDP socket per name
+server (from resolv.conf), retrying truncated answers over TCP. Answers,
+including NXDOMAIN and empty ones, are kept in an LRU cache until their
+TTL expires. Names are treated as absolute: neither the search list of
+resolv.conf nor /etc/hosts is used.
+"""
+
+import asyncio
+import collections
+import concurrent.futures as cf
+import ipaddress
+import itertools
+import random
+import socket
+import struct
+import threading
+import time
+
+import ddns
+
+RESOLV_CONF = '/etc/resolv.conf'
+PORT = 53
+# glibc defaults
+TIMEOUT = 5.0
+ATTEMPTS = 2
+CONCURRENCY = 512
+CHUNK_SIZE = 1024
+CACHE_SIZE = 100000
+NEGATIVE_TTL = 60
+# Unanswered PTR lookups
+FAILURE_TTL = 30
+REVERSE_TIMEOUT = 2.0
+UDP_BUFFER = 4 * 1024 * 1024
+MAX_UDP = 65535
+SWEEP_INTERVAL = 0.1
+MAX_TTL = 86400
+
+TYPE_PTR = 12
+RCODE_NXDOMAIN = 3
+FLAG_RD = 0x0100
+FLAG_TC = 0x0200
+
+
+class ResolveError(RuntimeError):
+    """No name server answered."""
+
+
+def read_resolv_conf(path=RESOLV_CONF):
+    """Return (name servers, timeout, attempts) of resolv.conf."""
+    nameservers = []
+    timeout, attempts = TIMEOUT, ATTEMPTS
+    try:
+        with open(path, encoding='ascii', errors='replace') as f_in:
+            for line in f_in:
+                fields = line.split('#')[0].split(';')[0].split()
+                if fields[:1] == ['nameserver'] and len(fields) > 1:
+                    nameservers.append(fields[1].split('%')[0])
+                elif fields[:1] == ['options']:
+                    for option in fields[1:]:
+                        name, _, value = option.partition(':')
+                        if name == 'timeout' and value.isdigit():
+                            timeout = float(value)
+                        elif name == 'attempts' and value.isdigit():
+                            attempts = int(value)
+    except OSError:  # no resolv.conf, use a local server as glibc does
+        pass
+    return nameservers or ['127.0.0.1'], timeout, attempts
+
+
+def build_query(message_id, name, qtype):
+    """Return a recursive query message."""
+    return (ddns.HEADER.pack(message_id, FLAG_RD, 1, 0, 0, 0) +
+            ddns.encode_name(name) + struct.pack('>HH', qtype, ddns.CLASS_IN))
+
+
+def read_name(message, offset):
+    """Return the text of the (possibly compressed) name at offset."""
+    labels = []
+    for _ in range(128):  # bound pointer loops
+        length = message[offset]
+        if length >= 0xc0:
+            offset = (length & 0x3f) << 8 | message[offset + 1]
+            continue
+        if not length:
+            break
+        labels.append(message[offset + 1:offset + 1 + length].decode(
+            'ascii', 'replace'))
+        offset += 1 + length
+    return '.'.join(labels)
+
+
+def same_question(response, question):
+    """Return True if response has the one question of a query (its
+    question section, the name lowercase), the name in any case."""
+    end = ddns.HEADER.size + len(question)
+    return (response[4:6] == b'\x00\x01' and
+            response[ddns.HEADER.size:end - 4].lower() == question[:-4] and
+            response[end - 4:end] == question[-4:])
+
+
+def parse_response(message):
+    """Return (rcode, truncated, [(type, ttl, value)], negative TTL).
+
+    Values are the addresses of A/AAAA records and the names of PTR ones.
+    """
+    _, flags, questions, answers, authorities, _ = \
+        ddns.HEADER.unpack_from(message)
+    offset = ddns.HEADER.size
+    for _ in range(questions):
+        offset = ddns.skip_name(message, offset) + 4
+    records = []
+    for _ in range(answers):
+        offset = ddns.skip_name(message, offset)
+        rtype, _, ttl, size = ddns.RR.unpack_from(message, offset)
+        offset += ddns.RR.size
+        if rtype == ddns.TYPE_A and size == 4:
+            records.append((rtype, ttl, socket.inet_ntop(
+                socket.AF_INET, message[offset:offset + 4])))
+        elif rtype == ddns.TYPE_AAAA and size == 16:
+            records.append((rtype, ttl, socket.inet_ntop(
+                socket.AF_INET6, message[offset:offset + 16])))
+        elif rtype == TYPE_PTR:
+            records.append((rtype, ttl, read_name(message, offset)))
+        offset += size
+    negative_ttl = NEGATIVE_TTL
+    for _ in range(authorities):
+        offset = ddns.skip_name(message, offset)
+        rtype, _, ttl, size = ddns.RR.unpack_from(message, offset)
+        offset += ddns.RR.size + size
+        if rtype == ddns.TYPE_SOA:
+            # SOA minimum, the last field (RFC 2308)
+            minimum = struct.unpack_from('>I', message, offset - 4)[0]
+            negative_ttl = min(ttl, minimum)
+    return flags & 0xf, bool(flags & FLAG_TC), records, negative_ttl
+
+
+class Resolver:
+    """Asyncio DNS stub resolver with a TTL-respecting LRU cache.
+
+    Each name server gets a connected non-blocking UDP socket, drained of
+    all the answers waiting at each wakeup. Queries time out in a periodic
+    sweep, not with one timer each.
+    """
+
+    def __init__(self, nameservers=None, port=PORT, timeout=None,
+                 attempts=None, cache_size=CACHE_SIZE):
+        conf_servers, conf_timeout, conf_attempts = read_resolv_conf()
+        self.nameservers = nameservers or conf_servers
+        self.port = port
+        self.timeout = timeout or conf_timeout
+        self.attempts = attempts or conf_attempts
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        # {message id: (question, future)}, [(deadline, future)] in
+        # sending order
+        self.pending = {}
+        self.deadlines = collections.deque()
+        self.sockets = []
+        self.sweeper = None
+        self.stats = collections.Counter()
+
+    async def open(self):
+        """Open one UDP socket per name server."""
+        loop = asyncio.get_running_loop()
+        for server in self.nameservers:
+            family = socket.AF_INET6 if ':' in server else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            # Answers to a burst of queries arrive together
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_BUFFER)
+            sock.connect((server, self.port))
+            loop.add_reader(sock, self.receive, sock)
+            self.sockets.append(sock)
+        self.sweeper = asyncio.create_task(self.sweep())
+
+    def close(self):
+        """Close the sockets."""
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+        loop = asyncio.get_running_loop()
+        for sock in self.sockets:
+            loop.remove_reader(sock)
+            sock.close()
+        self.sockets = []
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def receive(self, sock):
+        """Hand every waiting answer to its query."""
+        while True:
+            try:
+                data = sock.recv(MAX_UDP)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:  # ICMP errors, the query times out
+                continue
+            entry = self.pending.get(int.from_bytes(data[:2], 'big'))
+            if entry is None:
+                continue
+            question, future = entry
+            # A late answer to a timed out query of the same id asks
+            # another question
+            if not same_question(data, question):
+                self.stats['mismatched'] += 1
+                continue
+            if not future.done():
+                future.set_result(data)
+
+    async def sweep(self):
+        """Time out the queries past their deadline: their answer is
+        None."""
+        while True:
+            await asyncio.sleep(min(self.timeout / 4, SWEEP_INTERVAL))
+            now = time.monotonic()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                future = self.deadlines.popleft()[1]
+                if not future.done():
+                    future.set_result(None)
+
+    def cached(self, key):
+        """Return the cached values of key or None."""
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        self.stats['cached'] += 1
+        return entry[1]
+
+    def store(self, key, values, ttl):
+        """Cache values for ttl seconds."""
+        self.cache[key] = (time.monotonic() + min(ttl, MAX_TTL), values)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def query_tcp(self, server, query):
+        """Return the answer to query over TCP."""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(server, self.port), self.timeout)
+        try:
+            writer.write(struct.pack('>H', len(query)) + query)
+            size = struct.unpack('>H', await asyncio.wait_for(
+                reader.readexactly(2), self.timeout))[0]
+            return await asyncio.wait_for(reader.readexactly(size),
+                                          self.timeout)
+        finally:
+            writer.close()
+
+    async def query(self, name, qtype):
+        """Return the values of the qtype records of name."""
+        key = (name.lower().rstrip('.'), qtype)
+        values = self.cached(key)
+        if values is not None:
+            return values
+
+        loop = asyncio.get_running_loop()
+        for _ in range(self.attempts):
+            for server, sock in zip(self.nameservers, self.sockets):
+                message_id = random.getrandbits(16)
+                while message_id in self.pending:
+                    message_id = random.getrandbits(16)
+                query = build_query(message_id, key[0], qtype)
+                future = loop.create_future()
+                # The name is lowercase, like key
+                self.pending[message_id] = (query[ddns.HEADER.size:], future)
+                self.deadlines.append((time.monotonic() + self.timeout,
+                                       future))
+                try:
+                    sock.send(query)
+                    self.stats['queries'] += 1
+                    response = await future
+                except OSError:  # buffer full, unreachable...
+                    response = None
+                finally:
+                    del self.pending[message_id]
+                if response is None:
+                    self.stats['timeouts'] += 1
+                    continue
+                try:
+                    rcode, truncated, records, negative_ttl = \
+                        parse_response(response)
+                    if truncated:
+                        self.stats['tcp'] += 1
+                        rcode, _, records, negative_ttl = parse_response(
+                            await self.query_tcp(server, query))
+                except (OSError, asyncio.TimeoutError, IndexError,
+                        struct.error, asyncio.IncompleteReadError):
+                    self.stats['errors'] += 1
+                    continue
+                if rcode in (0, RCODE_NXDOMAIN):
+                    values = [value for rtype, _, value in records
+                              if rtype == qtype]
+                    ttl = min((record[1] for record in records
+                               if record[0] == qtype), default=negative_ttl)
+                    self.store(key, values, ttl)
+                    return values
+                self.stats['errors'] += 1  # SERVFAIL, REFUSED...: next one
+        raise ResolveError(f'{name}: no answer from the name servers')
+
+    async def resolve(self, name):
+        """Return the IPv4 and IPv6 addresses of name."""
+        try:
+            key = name.encode('idna').decode('ascii').lower().rstrip('.')
+        except UnicodeError:
+            raise ResolveError(f'{name}: invalid name') from None
+        ipv4 = self.cached((key, ddns.TYPE_A))
+        ipv6 = self.cached((key, ddns.TYPE_AAAA))
+        if ipv4 is not None and ipv6 is not None:
+            return ipv4 + ipv6
+        results = await asyncio.gather(self.query(key, ddns.TYPE_A),
+                                       self.query(key, ddns.TYPE_AAAA),
+                                       return_exceptions=True)
+        addresses = [address for result in results
+                     if not isinstance(result, Exception)
+                     for address in result]
+        if not addresses and all(isinstance(result, Exception)
+                                 for result in results):
+            raise results[0]
+        return addresses
+
+    async def reverse(self, address):
+        """Return the host name of address (PTR) or None."""
+        name = ipaddress.ip_address(address).reverse_pointer
+        try:
+            names = await self.query(name, TYPE_PTR)
+        except ResolveError:
+            # Unanswered, do not wait for it again for a while
+            self.store((name, TYPE_PTR), [], FAILURE_TTL)
+            return None
+        return names[0] if names else None
+
+    async def resolve_stream(self, names, emit, concurrency=CONCURRENCY):
+        """Resolve the names of an iterable, calling emit(name, addresses,
+        error) as answers arrive.
+
+        The names are read in chunks in a thread, reading stdin may block.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(concurrency * 2)
+        names = iter(names)
+
+        async def worker():
+            while True:
+                name = await queue.get()
+                if name is None:
+                    return
+                try:
+                    emit(name, await self.resolve(name), None)
+                except (ResolveError, ValueError) as e:
+                    emit(name, [], e)
+
+        workers = [asyncio.create_task(worker())
+                   for _ in range(concurrency)]
+        while True:
+            chunk = await loop.run_in_executor(
+                None, list, itertools.islice(names, CHUNK_SIZE))
+            if not chunk:
+                break
+            for name in chunk:
+                name = name.strip()
+                if name:
+                    await queue.put(name)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+
+class ReverseLookup:
+    """Host names of addresses, looked up in the background.
+
+    Lookups run concurrently in the event loop of a daemon thread. Output
+    never waits for them longer than asked: names not yet known are None.
+    """
+
+    def __init__(self, nameservers=None, port=PORT, timeout=REVERSE_TIMEOUT,
+                 concurrency=CONCURRENCY):
+        self.resolver = Resolver(nameservers, port, timeout, attempts=1)
+        self.semaphore = None
+        self.concurrency = concurrency
+        self.names = {}
+        self.submitted = set()
+        self.batches = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+
+    async def open(self):
+        """Open the resolver in the loop."""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        await self.resolver.open()
+
+    async def lookup(self, address):
+        """Record the name of address."""
+        async with self.semaphore:
+            try:
+                self.names[address] = await self.resolver.reverse(address)
+            except ValueError:  # not an address
+                self.names[address] = None
+
+    async def lookup_all(self, addresses):
+        """Look up addresses concurrently."""
+        await asyncio.gather(*(self.lookup(address)
+                               for address in addresses))
+
+    def submit(self, addresses):
+        """Start looking up the addresses not submitted yet."""
+        new = [address for address in addresses
+               if address not in self.submitted]
+        if new:
+            self.submitted.update(new)
+            self.batches.append(asyncio.run_coroutine_threadsafe(
+                self.lookup_all(new), self.loop))
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for the submitted lookups."""
+        deadline = time.monotonic() + timeout
+        for batch in self.batches:
+            try:
+                batch.result(max(0.0, deadline - time.monotonic()))
+            except cf.TimeoutError:
+                return
+        self.batches = []
+
+    def name(self, address):
+        """Return the name of address if already known, else None."""
+        return self.names.get(address)
+
+    async def cancel(self):
+        """Cancel the lookups in progress, close the resolver."""
+        self.resolver.close()
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Stop the lookups and the loop."""
+        asyncio.run_coroutine_threadsafe(self.cancel(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+if __name__ == '__main__':
+    pass
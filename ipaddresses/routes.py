@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Routing table snapshot for bulk source address selection (Linux).
+
+The main routing tables and the interface addresses are loaded once into
+longest prefix match tables, then any number of destinations are answered
+in memory, without a syscall per destination. Policy routing (ip rule) is
+not taken into account.
+"""
+
+import collections
+import ipaddress
+import socket
+import sys
+
+import shared as shrd
+
+ROUTE_FILE = '/proc/net/route'
+IPV6_ROUTE_FILE = '/proc/net/ipv6_route'
+
+RTF_UP = 0x0001
+RTF_GATEWAY = 0x0002
+RTF_REJECT = 0x0200
+
+Route = collections.namedtuple('Route', 'network gateway iface metric')
+
+
+class PrefixTable:
+    """Longest prefix match table, one dict per prefix length."""
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.tables = {}
+        self.lengths = []
+
+    def add(self, network, route):
+        """Add route to network, the lowest metric wins."""
+        if network.prefixlen not in self.tables:
+            self.tables[network.prefixlen] = {}
+            self.lengths = sorted(self.tables, reverse=True)
+        table = self.tables[network.prefixlen]
+        key = int(network.network_address)
+        if key not in table or route.metric < table[key].metric:
+            table[key] = route
+
+    def lookup(self, value):
+        """Return the longest prefix match of integer address value."""
+        for length in self.lengths:
+            route = self.tables[length].get(
+                value >> (self.bits - length) << (self.bits - length))
+            if route is not None:
+                return route
+        return None
+
+
+def read_routes(path=ROUTE_FILE):
+    """Yield IPv4 routes from a /proc/net/route file."""
+    with open(path, encoding='ascii') as f_in:
+        next(f_in)  # header
+        for line in f_in:
+            fields = line.split()
+            flags = int(fields[3], 16)
+            if not flags & RTF_UP or flags & RTF_REJECT:
+                continue
+            # Little endian hex
+            destination = socket.inet_ntoa(bytes.fromhex(fields[1])[::-1])
+            mask = socket.inet_ntoa(bytes.fromhex(fields[7])[::-1])
+            gateway = None
+            if flags & RTF_GATEWAY:
+                gateway = ipaddress.IPv4Address(bytes.fromhex(fields[2])[::-1])
+            yield Route(ipaddress.ip_network(f'{destination}/{mask}'),
+                        gateway, fields[0], int(fields[6]))
+
+
+def read_ipv6_routes(path=IPV6_ROUTE_FILE):
+    """Yield IPv6 routes from a /proc/net/ipv6_route file."""
+    with open(path, encoding='ascii') as f_in:
+        for line in f_in:
+            fields = line.split()
+            flags = int(fields[8], 16)
+            if not flags & RTF_UP or flags & RTF_REJECT:
+                continue
+            gateway = None
+            if flags & RTF_GATEWAY:
+                gateway = ipaddress.IPv6Address(int(fields[4], 16))
+            yield Route(ipaddress.IPv6Network((int(fields[0], 16),
+                                               int(fields[1], 16))),
+                        gateway, fields[9], int(fields[5], 16))
+
+
+def common_prefix(address, other):
+    """Return the number of leading bits address and other share."""
+    return address.max_prefixlen - (int(address) ^ int(other)).bit_length()
+
+
+class RoutingSnapshot:
+    """Routes and interface addresses, loaded once."""
+
+    def __init__(self, routes, interface_ips):
+        self.tables = {4: PrefixTable(32), 6: PrefixTable(128)}
+        for route in routes:
+            self.tables[route.network.version].add(route.network, route)
+        # Local routes (kernel local table) win over everything else
+        for iface, ips in interface_ips.items():
+            for ip in ips:
+                network = ip.network if ip.is_loopback else ip.ip
+                self.tables[ip.version].add(ipaddress.ip_network(network),
+                                            Route(network, None, iface, -1))
+        self.interface_ips = interface_ips
+        self.route_sources = {}
+
+    @classmethod
+    def load(cls):
+        """Snapshot of the running kernel."""
+        routes = []
+        for reader in [read_routes, read_ipv6_routes]:
+            try:
+                routes += reader()
+            except OSError:  # no /proc or no IPv6
+                pass
+        return cls(routes, shrd.get_interface_ips())
+
+    def select_source(self, destination, route):
+        """Return the preferred address of route's interface."""
+        if route in self.route_sources:
+            return self.route_sources[route]
+        candidates = [ip for ip in self.interface_ips.get(route.iface, [])
+                      if ip.version == destination.version]
+        on_link = route.gateway or destination
+
+        def preference(ip):
+            """IPv4 address on the next hop's subnet, IPv6 (RFC 6724) same
+            scope then longest matching prefix."""
+            return (on_link in ip.network,
+                    ip.is_link_local == destination.is_link_local,
+                    common_prefix(ip.ip, destination))
+
+        source = max(candidates, key=preference).ip if candidates else None
+        if len(candidates) < 2 or route.gateway and destination.version == 4:
+            # Same answer for every destination of this route
+            self.route_sources[route] = source
+        return source
+
+    def source(self, destination):
+        """Return (source address, interface) for destination or None."""
+        destination = ipaddress.ip_address(destination)
+        route = self.tables[destination.version].lookup(int(destination))
+        if route is None:
+            return None
+        return self.select_source(destination, route), route.iface
+
+    def sources(self, destinations):
+        """Return source() of each destination."""
+        return [self.source(destination) for destination in destinations]
+
+
+def kernel_source(destination):
+    """Return the source address the kernel selects, using a UDP socket."""
+    destination = ipaddress.ip_address(destination)
+    family = socket.AF_INET if destination.version == 4 else socket.AF_INET6
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((str(destination), 9))
+        except OSError:  # unreachable
+            return None
+        return ipaddress.ip_address(sock.getsockname()[0].split('%')[0])
+
+
+def check(destinations):
+    """Return destinations where the snapshot and the kernel disagree."""
+    snapshot = RoutingSnapshot.load()
+    mismatches = []
+    for destination in destinations:
+        answer = snapshot.source(destination)
+        expected = kernel_source(destination)
+        if (answer and answer[0]) != expected:
+            mismatches.append((destination, answer, expected))
+    return mismatches
+
+
+if __name__ == '__main__':
+    for mismatch in check(sys.argv[1:]):
+        print(*mismatch)
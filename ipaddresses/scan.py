@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Extract and classify IP addresses found in (large) text files."""
+
+import collections
+import concurrent.futures as cf
+import ipaddress
+import mmap
+import os
+import re
+
+import shared as shrd
+
+CHUNK_SIZE = 64 * 1024 * 1024
+MIN_CHUNK_SIZE = 1024 * 1024
+
+# Candidate tokens only: runs of characters that may form an address. They
+# are counted first and only the distinct ones are validated, which keeps
+# the per byte work inside the regex engine.
+TOKEN_RE = re.compile(rb'[0-9A-Fa-f:.]{3,}')
+
+
+def chunk_bounds(mm, size, chunk_size=CHUNK_SIZE):
+    """Return (start, end) offsets of line aligned chunks."""
+    bounds = []
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = mm.find(b'\n', end)
+            end = size if newline == -1 else newline + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def token_span(token):
+    """Return (start, end) of the address inside a candidate token or None."""
+    end = len(token.rstrip('.'))
+    start = 0
+    if '.' in token:
+        # IPv4 possibly with a leading : from key:value or a trailing :port
+        if token.startswith(':') and not token.startswith('::'):
+            start = 1
+        if token.count(':', start, end) == 1:
+            end = token.index(':', start, end)
+    elif ':' not in token:
+        return None
+    return start, end
+
+
+def parse_token(token):
+    """Return the address in a candidate token or None."""
+    text = token.decode('ascii')
+    span = token_span(text)
+    if span is None:
+        return None
+    try:
+        return ipaddress.ip_address(text[span[0]:span[1]])
+    except ValueError:
+        return None
+
+
+def scan_bytes(data, start=0, end=None):
+    """Return {PRIVATE: Counter, PUBLIC: Counter} of addresses in data."""
+    result = {shrd.PRIVATE: collections.Counter(),
+              shrd.PUBLIC: collections.Counter()}
+    if end is None:
+        end = len(data)
+    tokens = collections.Counter(TOKEN_RE.findall(data, start, end))
+    for token, count in tokens.items():
+        address = parse_token(token)
+        if address is not None:
+            result[shrd.classify_ip(address)][str(address)] += count
+    return result
+
+
+def scan_chunk(path, start, end):
+    """Scan bytes [start, end) of path."""
+    with open(path, 'rb') as f_in:
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return scan_bytes(mm, start, end)
+
+
+def merge(total, partial):
+    """Merge a partial scan result into total."""
+    for kind, counter in partial.items():
+        total[kind].update(counter)
+    return total
+
+
+def scan_files(paths, workers=None, chunk_size=CHUNK_SIZE):
+    """Scan files and return counted, deduplicated addresses per class."""
+    total = {shrd.PRIVATE: collections.Counter(),
+             shrd.PUBLIC: collections.Counter()}
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jobs = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if not size:
+            continue
+        # Small files still get one chunk per worker
+        size_per_chunk = max(MIN_CHUNK_SIZE, min(chunk_size, size // workers))
+        with open(path, 'rb') as f_in:
+            with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                jobs += [(path, start, end) for start, end
+                         in chunk_bounds(mm, size, size_per_chunk)]
+
+    if len(jobs) < 2 or workers < 2:
+        for job in jobs:
+            merge(total, scan_chunk(*job))
+        return total
+
+    with cf.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(scan_chunk, *job) for job in jobs]
+        for future in cf.as_completed(futures):
+            merge(total, future.result())
+    return total
+
+
+if __name__ == '__main__':
+    pass
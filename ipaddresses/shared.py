@@ -17,22 +17,244 @@
 
 """Shared constants and functions between CLI and GUI modules."""
 
+import collections
+import ipaddress
+import queue
 import socket
+import struct
+import threading
+import time
+import urllib.error
 import urllib.request
 
+import proxy as prx
+import ratelimit as rl
 
-def get_private_ip():
-    """Get the machine's private IP address."""
-    return socket.gethostbyname(socket.gethostname())
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
+PRIVATE = 'private'
+PUBLIC = 'public'
+
+PUBLIC_IP_URL = 'https://ip.app/'
+PUBLIC_IP_TIMEOUT = 5
+PUBLIC_IP_ATTEMPTS = 3
+PUBLIC_IP_MAX_BYTES = 64
+# Providers asked for a quorum, answering the address alone
+PUBLIC_IP_URLS = [PUBLIC_IP_URL, 'https://api.ipify.org/',
+                  'https://icanhazip.com/', 'https://checkip.amazonaws.com/',
+                  'https://ifconfig.me/ip']
+QUORUM = 2
+# Ignores the proxies of the environment
+DIRECT_OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+IF_INET6_FILE = '/proc/net/if_inet6'
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+
+
+def get_private_ip(timings=None):
+    """Get the machine's private IP address.
+
+    timings, if given, receives the seconds of the 'resolve' phase.
+    """
+    start = time.perf_counter()
+    address = socket.gethostbyname(socket.gethostname())
+    if timings is not None:
+        timings['resolve'] = time.perf_counter() - start
+    return address
+
+
+def get_interface_ips():
+    """Return {interface: [ipaddress interfaces]} of the machine (Linux)."""
+    result = {}
+    if fcntl is None or not hasattr(socket, 'if_nameindex'):
+        return result
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            request = struct.pack('256s', name.encode()[:15])
+            try:
+                address = fcntl.ioctl(sock, SIOCGIFADDR, request)[20:24]
+                netmask = fcntl.ioctl(sock, SIOCGIFNETMASK, request)[20:24]
+            except OSError:  # no IPv4 address
+                continue
+            result.setdefault(name, []).append(ipaddress.ip_interface(
+                f'{socket.inet_ntoa(address)}/{socket.inet_ntoa(netmask)}'))
 
-def get_public_ip():
-    """Fetch the machine's public IP address."""
     try:
-        with urllib.request.urlopen("https://ip.app/", timeout=5) as response:
-            return response.read().strip().decode("utf-8")
-    except Exception as e:
-        raise RuntimeError(f"Failed to fetch public IP: {e}")
+        with open(IF_INET6_FILE, encoding='ascii') as f_in:
+            for line in f_in:
+                address, _, prefixlen, _, _, name = line.split()
+                result.setdefault(name, []).append(ipaddress.ip_interface(
+                    (int(address, 16), int(prefixlen, 16))))
+    except OSError:  # no IPv6
+        pass
+    return result
+
+
+def read_address(response, deadline):
+    """Read the address in the body of response, which must end before
+    deadline (perf_counter) and be at most PUBLIC_IP_MAX_BYTES."""
+    # The socket timeout is per read, a provider sending a byte at a time
+    # would never reach it: each read may only last the time left
+    sock = getattr(getattr(response.fp, 'raw', None), '_sock', None)
+    body = b''
+    while len(body) <= PUBLIC_IP_MAX_BYTES:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError('body not received in time')
+        if sock is not None:
+            sock.settimeout(remaining)
+        chunk = response.read1(PUBLIC_IP_MAX_BYTES + 1)
+        if not chunk:
+            break
+        body += chunk
+    return str(ipaddress.ip_address(body.strip().decode('ascii')))
+
+
+def get_public_ip(url=None, timings=None, attempts=PUBLIC_IP_ATTEMPTS,
+                  bucket=None, proxy=None, stop=None):
+    """Fetch the machine's public IP address.
+
+    The request goes through proxy, by default proxy.proxy_for(url), over a
+    pooled connection, or directly if proxy is '' or there is none.
+
+    Requests are rate limited by the provider's token bucket (bucket
+    defaults to ratelimit.bucket(url)) and throttled ones (429, 5xx) are
+    retried up to attempts times with backoff, or after Retry-After unless
+    it is longer than ratelimit.BACKOFF_CAP. A body that is not an IP
+    address, or is received slower than PUBLIC_IP_TIMEOUT, is an error.
+
+    timings, if given, receives the seconds of the 'connect' (up to the
+    response headers) and 'read' (body) phases. Setting the stop event, if
+    given, ends the waits for the bucket and the backoff early, with a
+    RuntimeError.
+    """
+    url = url or PUBLIC_IP_URL
+    if proxy is None:
+        proxy = prx.proxy_for(url)
+    if bucket is None:
+        bucket = rl.bucket(url)
+    backoff = rl.Backoff()
+    for attempt in range(1, attempts + 1):
+        bucket.acquire(stop)
+        if stop is not None and stop.is_set():
+            raise RuntimeError('Failed to fetch public IP: stopped')
+        try:
+            start = time.perf_counter()
+            with (prx.urlopen(url, proxy, PUBLIC_IP_TIMEOUT) if proxy else
+                  DIRECT_OPENER.open(url, timeout=PUBLIC_IP_TIMEOUT)) \
+                    as response:
+                connected = time.perf_counter()
+                address = read_address(response,
+                                       connected + PUBLIC_IP_TIMEOUT)
+            if timings is not None:
+                timings['connect'] = connected - start
+                timings['read'] = time.perf_counter() - connected
+            return address
+        except urllib.error.HTTPError as e:
+            delay = rl.retry_after(e.headers.get('Retry-After'))
+            if (e.code not in rl.RETRY_STATUSES or attempt == attempts or
+                    delay > backoff.cap):
+                raise RuntimeError(f"Failed to fetch public IP: {e}") from e
+            if delay:
+                bucket.pause(delay)
+            rl.sleep(max(delay, backoff.next()), stop)
+        except Exception as e:
+            raise RuntimeError(f"Failed to fetch public IP: {e}") from e
+    return None
+
+
+def get_public_ip_paths(url=None, direct=False):
+    """Return {'proxy': address, 'direct': address} of the paths to the
+    provider of url: through its proxy, if it has one, else directly.
+
+    With direct, the direct path is fetched too, at the same time, and
+    waited for (it may only time out behind a proxy). A path that fails
+    is missing; RuntimeError if every path fails.
+    """
+    url = url or PUBLIC_IP_URL
+    proxy = prx.proxy_for(url)
+    result = {}
+    errors = []
+
+    def fetch(path, value):
+        try:
+            result[path] = get_public_ip(url, proxy=value)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=('direct', ''))] \
+        if proxy and direct else []
+    for thread in threads:
+        thread.start()
+    if proxy:
+        fetch('proxy', proxy)
+    else:
+        fetch('direct', '')
+    for thread in threads:
+        thread.join()
+    if not result:
+        raise errors[0]
+    return result
+
+
+def get_public_ip_quorum(urls=None, quorum=QUORUM, disagreements=None,
+                         fetch=None):
+    """Fetch the public IP from every provider of urls (default
+    PUBLIC_IP_URLS) at the same time, return it as soon as quorum of them
+    agree, without waiting for the others.
+
+    disagreements, if given, receives {url: address or error} of the
+    providers that answered another address or failed (an answer that is
+    not an IP address is an error) up to then. fetch(url) defaults to
+    get_public_ip. RuntimeError if quorum providers cannot agree.
+    """
+    urls = urls or PUBLIC_IP_URLS
+    fetch = fetch or get_public_ip
+    answers = queue.Queue()
+
+    def ask(url):
+        try:
+            answers.put((url, fetch(url)))
+        except RuntimeError as e:
+            answers.put((url, e))
+
+    for url in urls:
+        threading.Thread(target=ask, args=(url,), daemon=True).start()
+    votes = collections.Counter()
+    received = {}
+    winner = None
+    for remaining in range(len(urls) - 1, -1, -1):
+        url, answer = answers.get()
+        received[url] = answer
+        if isinstance(answer, str):
+            votes[answer] += 1
+            if votes[answer] >= quorum:
+                winner = answer
+                break
+        # Even if every remaining provider agreed with the leader
+        if max(votes.values(), default=0) + remaining < quorum:
+            break
+    others = {url: str(answer) for url, answer in received.items()
+              if answer != winner}
+    if disagreements is not None:
+        disagreements.update(others)
+    if winner is None:
+        raise RuntimeError(f'No {quorum} public IP providers agree: ' +
+                           '; '.join(f'{url} {answer}'
+                                     for url, answer in others.items()))
+    return winner
+
+
+def classify_ip(address):
+    """Classify an IP address as PRIVATE or PUBLIC (globally routable)."""
+    if ipaddress.ip_address(address).is_global:
+        return PUBLIC
+    return PRIVATE
 
 
 if __name__ == '__main__':
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Snapshots of the network state of a host and their differences (Linux).
+
+A snapshot is a sorted list of 'section<TAB>key<TAB>value' lines: the
+interface addresses, the routes (IPv4 of the main table, which is all
+/proc/net/route shows, and IPv6 of every table), the IPv4 neighbours and
+the public IP. The /proc files are converted to text without ipaddress
+objects, so a snapshot is cheap enough to take every few seconds. It is
+stored zlib compressed after a versioned header.
+
+Two snapshots are compared by merging their sorted lines, in linear time:
+equal lines, most of them, are skipped with one string comparison.
+"""
+
+import socket
+import struct
+import time
+import zlib
+
+import routes
+import shared as shrd
+
+ARP_FILE = '/proc/net/arp'
+SNAPSHOT_FILE = 'ipaddresses-%Y%m%d-%H%M%S.snap'
+COMPRESS_LEVEL = 1
+
+MAGIC = b'IPSN'
+VERSION = 1
+# Magic, version, time, host name length
+HEADER = struct.Struct('<4sBdH')
+
+ADDRESS = 'address'
+NEIGHBOUR = 'neighbour'
+PUBLIC = 'public'
+ROUTE = 'route'
+# Neighbour entry flags: complete
+ATF_COM = 0x2
+
+
+class SnapshotError(ValueError):
+    """Not a snapshot file, a corrupt one or an unsupported version."""
+
+
+def read_routes(path=routes.ROUTE_FILE):
+    """Yield (key, value) of the IPv4 routes of a /proc/net/route file,
+    those of the main table."""
+    with open(path, encoding='ascii') as f_in:
+        next(f_in)  # header
+        for line in f_in:
+            fields = line.split()
+            # Little endian hex
+            destination = socket.inet_ntoa(bytes.fromhex(fields[1])[::-1])
+            length = bin(int(fields[7], 16)).count('1')
+            gateway = socket.inet_ntoa(bytes.fromhex(fields[2])[::-1])
+            yield (f'{destination}/{length} {fields[0]} {int(fields[6])}',
+                   f'via {gateway} flags {fields[3]}')
+
+
+def read_ipv6_routes(path=routes.IPV6_ROUTE_FILE):
+    """Yield (key, value) of the IPv6 routes of a /proc/net/ipv6_route
+    file."""
+    with open(path, encoding='ascii') as f_in:
+        for line in f_in:
+            fields = line.split()
+            destination = socket.inet_ntop(socket.AF_INET6,
+                                           bytes.fromhex(fields[0]))
+            gateway = socket.inet_ntop(socket.AF_INET6,
+                                       bytes.fromhex(fields[4]))
+            yield (f'{destination}/{int(fields[1], 16)} {fields[9]} '
+                   f'{int(fields[5], 16)}',
+                   f'via {gateway} flags {fields[8]}')
+
+
+def read_neighbours(path=ARP_FILE):
+    """Yield (key, value) of the complete entries of a /proc/net/arp
+    file."""
+    with open(path, encoding='ascii') as f_in:
+        next(f_in)  # header
+        for line in f_in:
+            fields = line.split()
+            if int(fields[2], 16) & ATF_COM:
+                yield f'{fields[0]} {fields[5]}', fields[3]
+
+
+def capture(public=True, route_file=routes.ROUTE_FILE,
+            ipv6_route_file=routes.IPV6_ROUTE_FILE, arp_file=ARP_FILE):
+    """Return the sorted lines of the current network state."""
+    lines = [f'{ADDRESS}\t{iface} {ip}\t'
+             for iface, ips in shrd.get_interface_ips().items()
+             for ip in ips]
+    for section, reader, path in [(ROUTE, read_routes, route_file),
+                                  (ROUTE, read_ipv6_routes, ipv6_route_file),
+                                  (NEIGHBOUR, read_neighbours, arp_file)]:
+        try:
+            lines += [f'{section}\t{key}\t{value}'
+                      for key, value in reader(path)]
+        except OSError:  # no /proc or no IPv6
+            pass
+    if public:
+        try:
+            lines.append(f'{PUBLIC}\tip\t{shrd.get_public_ip()}')
+        except RuntimeError:
+            pass
+    lines.sort()
+    return lines
+
+
+def dumps(lines, timestamp=None, host=None):
+    """Return the serialized snapshot of lines."""
+    host = (socket.gethostname() if host is None else host).encode('utf-8')
+    return HEADER.pack(MAGIC, VERSION,
+                       time.time() if timestamp is None else timestamp,
+                       len(host)) + host + zlib.compress(
+                           '\n'.join(lines).encode('utf-8'), COMPRESS_LEVEL)
+
+
+def loads(data):
+    """Return (time, host, lines) of a serialized snapshot."""
+    if len(data) < HEADER.size:
+        raise SnapshotError('not a snapshot')
+    magic, version, timestamp, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError('not a snapshot')
+    if version != VERSION:
+        raise SnapshotError(f'unsupported snapshot version {version}')
+    start = HEADER.size + length
+    host = data[HEADER.size:start].decode('utf-8', 'replace')
+    try:
+        text = zlib.decompress(data[start:]).decode('utf-8')
+    except (zlib.error, UnicodeDecodeError) as e:
+        raise SnapshotError(f'corrupt snapshot: {e}') from None
+    return timestamp, host, text.split('\n') if text else []
+
+
+def save(path=None, public=True):
+    """Capture a snapshot to path (default SNAPSHOT_FILE), return path."""
+    path = time.strftime(SNAPSHOT_FILE) if path is None else path
+    data = dumps(capture(public))
+    with open(path, 'wb') as f_out:
+        f_out.write(data)
+    return path
+
+
+def load(path):
+    """Return (time, host, lines) of a snapshot file."""
+    with open(path, 'rb') as f_in:
+        return loads(f_in.read())
+
+
+def split(line):
+    """Return (section<TAB>key, value) of a line."""
+    key, _, value = line.rpartition('\t')
+    return key, value
+
+
+def diff(old, new):
+    """Return [(sign, section, key, old value, new value)] from the sorted
+    lines old to new, sign '+' added, '-' removed or '~' changed."""
+    changes = []
+    i = j = 0
+    old_size, new_size = len(old), len(new)
+    while i < old_size and j < new_size:
+        if old[i] == new[j]:
+            i += 1
+            j += 1
+            continue
+        old_key, old_value = split(old[i])
+        new_key, new_value = split(new[j])
+        if old_key == new_key:
+            changes.append(('~', old_key, old_value, new_value))
+            i += 1
+            j += 1
+        elif old_key < new_key:
+            changes.append(('-', old_key, old_value, None))
+            i += 1
+        else:
+            changes.append(('+', new_key, None, new_value))
+            j += 1
+    for line in old[i:]:
+        key, value = split(line)
+        changes.append(('-', key, value, None))
+    for line in new[j:]:
+        key, value = split(line)
+        changes.append(('+', key, None, value))
+    return [(sign, *key.split('\t'), old_value, new_value)
+            for sign, key, old_value, new_value in changes]
+
+
+if __name__ == '__main__':
+    pass
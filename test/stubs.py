@@ -0,0 +1,506 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stub servers of the tests, also run by benchmarks/bench.py."""
+
+import collections
+import hashlib
+import http.client
+import http.server
+import os
+import select
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import threading
+import time
+import urllib.parse
+
+import ddns
+import nat
+import ratelimit
+import resolver
+import shared
+
+RELAY_SIZE = 64 * 1024
+# Of one connection, not forwarded by the proxy
+HOP_HEADERS = ['connection', 'content-length', 'keep-alive',
+               'transfer-encoding']
+
+
+def dns_answer(query, tcp=False):
+    """Return the answer of the stub name server to query.
+
+    Names starting with 'nx' do not exist, 'big' ones are truncated over
+    UDP, 'lan' ones are private, other names get public addresses derived
+    from their hash. IPv4 addresses have PTR names, IPv6 ones do not.
+    """
+    message_id, flags = struct.unpack_from('>HH', query)
+    end = ddns.skip_name(query, ddns.HEADER.size)
+    name = ddns.decode_name(query[ddns.HEADER.size:end])
+    qtype = struct.unpack_from('>H', query, end)[0]
+    question = query[ddns.HEADER.size:end + 4]
+    flags = 0x8180 | flags & resolver.FLAG_RD  # response, recursion available
+    digest = hashlib.blake2b(name.encode('ascii'), digest_size=16).digest()
+    answers = []
+    if name.startswith('nx') or name.endswith('.ip6.arpa'):
+        flags |= resolver.RCODE_NXDOMAIN
+    elif qtype == resolver.TYPE_PTR:
+        octets = name.split('.')[3::-1]
+        answers.append((resolver.TYPE_PTR, ddns.encode_name(
+            'ip-' + '-'.join(octets) + '.example.net')))
+    elif name.startswith('big') and not tcp:
+        flags |= resolver.FLAG_TC
+    elif qtype == ddns.TYPE_A:
+        prefix = b'\x0a' if name.startswith('lan') else b'\x22'
+        answers.append((ddns.TYPE_A, prefix + digest[:3]))
+    elif qtype == ddns.TYPE_AAAA:
+        prefix = bytes.fromhex('fd00' if name.startswith('lan') else '2a00')
+        answers.append((ddns.TYPE_AAAA, prefix + digest[:14]))
+    return (ddns.HEADER.pack(message_id, flags, 1, len(answers), 0, 0) +
+            question + b''.join(
+                b'\xc0\x0c' + ddns.RR.pack(rtype, ddns.CLASS_IN, 300,
+                                           len(rdata)) + rdata
+                for rtype, rdata in answers))
+
+
+def serve_dns(port=0, ready=None, latency=0.0):
+    """Run the stub name server on 127.0.0.1 (UDP and TCP) forever,
+    answering UDP queries after latency seconds.
+
+    ready, a multiprocessing connection, receives the port.
+    """
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, resolver.UDP_BUFFER)
+    udp.bind(('127.0.0.1', port))
+    port = udp.getsockname()[1]
+    tcp = socket.create_server(('127.0.0.1', port))
+
+    def serve_tcp():
+        while True:
+            conn, _ = tcp.accept()
+            with conn, conn.makefile('rb') as f_in:
+                size = f_in.read(2)
+                if len(size) == 2:
+                    answer = dns_answer(
+                        f_in.read(struct.unpack('>H', size)[0]), tcp=True)
+                    conn.sendall(struct.pack('>H', len(answer)) + answer)
+
+    threading.Thread(target=serve_tcp, daemon=True).start()
+    if ready is not None:
+        ready.send(port)
+    # [(due time, answer, address)], due in arrival order
+    delayed = collections.deque()
+    while True:
+        udp.settimeout(max(0.0, delayed[0][0] - time.monotonic())
+                       if delayed else None)
+        try:
+            query, addr = udp.recvfrom(512)
+            delayed.append((time.monotonic() + latency, dns_answer(query),
+                            addr))
+        except (socket.timeout, BlockingIOError, IndexError, struct.error,
+                UnicodeDecodeError):
+            pass
+        now = time.monotonic()
+        while delayed and delayed[0][0] <= now:
+            _, answer, addr = delayed.popleft()
+            udp.sendto(answer, addr)
+
+
+class StunServer:
+    """Local RFC 5780 STUN server on two addresses and two ports, that can
+    emulate a NAT in front of its clients.
+
+    nat is None (no NAT) or (mapping, filtering, binding lifetime):
+    responses report the NAT's mapped address and are dropped when the
+    NAT would filter them or the binding expired.
+    """
+
+    EXTERNAL_IP = '198.51.100.1'
+    FIRST_PORT = 40000
+
+    def __init__(self, addresses=('127.0.0.1', '127.0.0.2'), nat=None,
+                 latency=0.0):
+        self.nat = nat
+        self.latency = latency
+        self.sockets = {}
+        ports = []
+        for _ in range(2):
+            # A port free on both addresses
+            while True:
+                first = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                first.bind((addresses[0], 0))
+                port = first.getsockname()[1]
+                second = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                try:
+                    second.bind((addresses[1], port))
+                    break
+                except OSError:
+                    first.close()
+                    second.close()
+            self.sockets[(addresses[0], port)] = first
+            self.sockets[(addresses[1], port)] = second
+            ports.append(port)
+        self.addresses = addresses
+        self.ports = ports
+        # NAT state: {key: external port}, {external port: [internal
+        # endpoint, last outbound time, {destinations}]}
+        self.mappings = {}
+        self.bindings = {}
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @property
+    def address(self):
+        """Return the primary (ip, port)."""
+        return self.addresses[0], self.ports[0]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop.set()
+        self.thread.join()
+        for sock in self.sockets.values():
+            sock.close()
+
+    def translate(self, source, destination):
+        """Return the external endpoint of source sending to destination,
+        recording the binding."""
+        if self.nat is None:
+            return source
+        behaviour = self.nat[0]
+        key = source if behaviour == nat.ENDPOINT_INDEPENDENT else \
+            (source, destination[0]) if behaviour == nat.ADDRESS_DEPENDENT \
+            else (source, destination)
+        external = self.mappings.get(key)
+        if external is None or not self.alive(external):
+            external = self.FIRST_PORT + len(self.bindings)
+            self.mappings[key] = external
+            self.bindings[external] = [source, 0, set()]
+        binding = self.bindings[external]
+        binding[1] = time.monotonic()
+        binding[2].add(destination)
+        return self.EXTERNAL_IP, external
+
+    def alive(self, external):
+        """Return True if the binding of the external port is alive."""
+        binding = self.bindings.get(external)
+        return binding is not None and \
+            time.monotonic() - binding[1] <= self.nat[2]
+
+    def deliver(self, origin, external):
+        """Return the internal endpoint a response from origin to the
+        external endpoint reaches, or None if the NAT drops it."""
+        if self.nat is None:
+            return external
+        if external[0] != self.EXTERNAL_IP or not self.alive(external[1]):
+            return None
+        internal, _, destinations = self.bindings[external[1]]
+        filtering = self.nat[1]
+        if filtering == nat.ENDPOINT_INDEPENDENT or \
+                filtering == nat.ADDRESS_DEPENDENT and any(
+                    destination[0] == origin[0]
+                    for destination in destinations) or \
+                origin in destinations:
+            return internal
+        return None
+
+    def answer(self, local, data, source):
+        """Return (origin, destination, response) of a request received
+        on local from source, or None."""
+        try:
+            message_type, transaction, attributes = nat.parse_message(data)
+        except ValueError:
+            return None
+        if message_type != nat.BINDING_REQUEST:
+            return None
+        mapped = self.translate(source, local)
+        change = struct.unpack('>I', attributes[nat.CHANGE_REQUEST])[0] \
+            if nat.CHANGE_REQUEST in attributes else 0
+        ip = self.addresses[self.addresses[0] == local[0]] \
+            if change & nat.CHANGE_IP else local[0]
+        port = self.ports[self.ports[0] == local[1]] \
+            if change & nat.CHANGE_PORT else local[1]
+        origin = (ip, port)
+        destination = mapped
+        if nat.RESPONSE_PORT in attributes:
+            destination = (mapped[0], struct.unpack_from(
+                '>H', attributes[nat.RESPONSE_PORT])[0])
+        other = (self.addresses[self.addresses[0] == local[0]],
+                 self.ports[self.ports[0] == local[1]])
+        response = nat.encode_message(nat.BINDING_RESPONSE, transaction, [
+            (nat.XOR_MAPPED_ADDRESS, nat.encode_address(mapped, transaction)),
+            (nat.RESPONSE_ORIGIN, nat.encode_address(origin)),
+            (nat.OTHER_ADDRESS, nat.encode_address(other))])
+        return origin, destination, response
+
+    def run(self):
+        """Answer requests until stopped."""
+        by_socket = {sock: local for local, sock in self.sockets.items()}
+        while not self.stop.is_set():
+            readable, _, _ = select.select(list(by_socket), [], [], 0.1)
+            for sock in readable:
+                data, source = sock.recvfrom(2048)
+                answer = self.answer(by_socket[sock], data, source)
+                if answer is None:
+                    continue
+                origin, destination, response = answer
+                internal = self.deliver(origin, destination)
+                if internal is None:
+                    continue
+                send = self.sockets[origin].sendto
+                if self.latency:
+                    threading.Timer(self.latency, send,
+                                    (response, internal)).start()
+                else:
+                    send(response, internal)
+
+
+class StubProxy(socketserver.ThreadingTCPServer):
+    """Local HTTP proxy, connecting from the source address (to tell its
+    egress from the direct path) after latency seconds.
+
+    requests receives the (method, target) of every request, stats the
+    count of 'tunnels' and 'forwarded' requests.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, source='127.0.0.2', latency=0.0):
+        self.source = source
+        self.latency = latency
+        self.requests = []
+        self.stats = collections.Counter()
+        super().__init__(('127.0.0.1', 0), StubProxyHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        """Return the proxy URL."""
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __exit__(self, *args):
+        self.shutdown()
+        super().__exit__(*args)
+
+
+class StubProxyHandler(socketserver.StreamRequestHandler):
+    """Tunnels CONNECT requests, forwards absolute-URI ones."""
+
+    # Relayed as received, like proxies do
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        """Serve the requests of the connection until either side closes
+        or it becomes a tunnel."""
+        upstreams = {}
+        try:
+            while True:
+                request = self.rfile.readline().decode('latin-1').split()
+                if not request:
+                    return
+                headers = http.client.parse_headers(self.rfile)
+                if len(request) != 3:
+                    self.wfile.write(b'HTTP/1.1 400 Bad Request\r\n\r\n')
+                    return
+                self.server.requests.append(tuple(request[:2]))
+                if request[0] == 'CONNECT':
+                    self.tunnel(request[1])
+                    return
+                if not self.forward(request[0], request[1], headers,
+                                    upstreams):
+                    return
+        finally:
+            for upstream in upstreams.values():
+                upstream.close()
+
+    def connect(self, host, port):
+        """Return a socket to the target after the latency, None if the
+        connection failed (502 sent)."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            return socket.create_connection(
+                (host, port), source_address=(self.server.source, 0))
+        except OSError:
+            self.wfile.write(b'HTTP/1.1 502 Bad Gateway\r\n\r\n')
+            return None
+
+    def tunnel(self, authority):
+        """Connect to the target and relay until either side closes."""
+        host, _, port = authority.rpartition(':')
+        upstream = self.connect(host, int(port))
+        if upstream is None:
+            return
+        upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stats['tunnels'] += 1
+        self.wfile.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        with upstream:
+            sockets = [self.connection, upstream]
+            while True:
+                readable, _, _ = select.select(sockets, [], [])
+                for sock in readable:
+                    data = sock.recv(RELAY_SIZE)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection else
+                     self.connection).sendall(data)
+
+    def forward(self, method, url, headers, upstreams):
+        """Make the request of an absolute URI, over a kept connection to
+        the target, and send back the response; return whether the client
+        keeps the connection open."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != 'http':
+            self.wfile.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+            return False
+        key = (parts.hostname, parts.port or 80)
+        if key not in upstreams:
+            sock = self.connect(*key)
+            if sock is None:
+                return False
+            upstreams[key] = http.client.HTTPConnection(*key)
+            upstreams[key].sock = sock
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/',
+                                        parts.query, ''))
+        try:
+            upstreams[key].request(method, path, headers={
+                name: value for name, value in headers.items()
+                if not name.lower().startswith('proxy-')})
+            response = upstreams[key].getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.wfile.write(b'HTTP/1.1 502 Bad Gateway\r\n\r\n')
+            return False
+        if response.will_close:
+            upstreams.pop(key).close()
+        self.server.stats['forwarded'] += 1
+        close = headers.get('Connection', '').lower() == 'close'
+        lines = [f'HTTP/1.1 {response.status} {response.reason}']
+        lines += [f'{name}: {value}' for name, value in response.getheaders()
+                  if name.lower() not in HOP_HEADERS]
+        lines.append(f'Content-Length: {len(body)}')
+        if close:
+            lines.append('Connection: close')
+        self.wfile.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') +
+                         body)
+        return not close
+
+
+def make_certificate(directory):
+    """Write a self-signed key and certificate for 127.0.0.1 in one PEM
+    file, return its path."""
+    key, cert = (os.path.join(directory, name)
+                 for name in ['key.pem', 'cert.pem'])
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                    '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+                    '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', key, '-out', cert],
+                   check=True, capture_output=True)
+    path = os.path.join(directory, 'stub.pem')
+    with open(path, 'wb') as f_out:
+        for name in [key, cert]:
+            with open(name, 'rb') as f_in:
+                f_out.write(f_in.read())
+    return path
+
+
+class StubProvider(http.server.ThreadingHTTPServer):
+    """Local public IP provider, answering after latency seconds, over TLS
+    with certfile, and 429 above rate requests/s if rate is given."""
+
+    daemon_threads = True
+
+    def __init__(self, rate=None, burst=1, latency=0.0, certfile=None):
+        self.bucket = ratelimit.TokenBucket(rate, burst) if rate else None
+        self.latency = latency
+        self.stats = collections.Counter()
+        super().__init__(('127.0.0.1', 0), StubProviderHandler)
+        self.scheme = 'http'
+        if certfile:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            self.scheme = 'https'
+
+    @property
+    def url(self):
+        """Return the provider URL."""
+        return f'{self.scheme}://127.0.0.1:{self.server_address[1]}/'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class StubProviderHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the client address or 429 with Retry-After."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are two writes, a keep-alive client would wait for
+    # its delayed ACK between them
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Send the address if the rate allows it."""
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.bucket is None or self.server.bucket.take():
+            self.server.stats['served'] += 1
+            body = self.client_address[0].encode('ascii')
+            self.send_response(200)
+        else:
+            self.server.stats['throttled'] += 1
+            body = b''
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+
+def run_fleet(url, hosts, window):
+    """Fetch the public IP from hosts threads, each started after its
+    start offset in window, return (hosts that failed, seconds)."""
+    failures = []
+
+    def host(name):
+        time.sleep(ratelimit.start_offset(window, name))
+        try:
+            shared.get_public_ip(url, attempts=5, proxy='',
+                                 bucket=ratelimit.TokenBucket())
+        except RuntimeError:
+            failures.append(name)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=host, args=(f'host{i}',))
+               for i in range(hosts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failures, time.perf_counter() - start
@@ -0,0 +1,62 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the prefix-preserving anonymization."""
+
+import io
+import ipaddress
+
+import pytest
+
+import anonymize
+
+# Test vectors for KEY, they must never change
+KEY = bytes(range(32))
+TEST_VECTORS = [
+    ('8.8.8.8', '9.202.112.114'),
+    ('8.8.4.4', '9.202.123.126'),
+    ('1.1.1.1', '1.143.57.149'),
+    ('10.0.0.1', '10.191.116.245'),
+    ('10.0.0.2', '10.191.116.246'),
+    ('192.168.1.10', '192.168.228.169'),
+    ('172.16.5.4', '172.30.149.140'),
+    ('2001:4860:4860::8888', '2001:4032:53fa:3e4c:95ff:86e8:cec4:a852'),
+    ('fe80::1', 'fea6:f2cc:38f8:acf5:34d6:dbb7:9b4:167e'),
+    ('::1', '::1'),
+]
+
+
+@pytest.mark.parametrize('address, expected', TEST_VECTORS)
+def test_vectors(address, expected):
+    anonymizer = anonymize.Anonymizer(KEY)
+    assert str(anonymizer.anonymize(ipaddress.ip_address(address))) == \
+        expected
+
+
+def test_prefix_preserved():
+    anonymizer = anonymize.Anonymizer(KEY)
+    first, second = [int(anonymizer.anonymize(ipaddress.ip_address(
+        address))) for address in ['8.8.8.8', '8.8.4.4']]
+    # 8.8.8.8 and 8.8.4.4 share their first 20 bits, not 21
+    assert (first ^ second) >> 12 == 0
+    assert (first ^ second) >> 11 != 0
+
+
+def test_stream():
+    f_out = io.BytesIO()
+    anonymize.anonymize_stream(
+        KEY, io.BytesIO(b'from 8.8.8.8 to 10.0.0.1, 999.1.1.1\n'), f_out)
+    assert f_out.getvalue() == \
+        b'from 9.202.112.114 to 10.191.116.245, 999.1.1.1\n'
@@ -0,0 +1,100 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the collector: parsing, aggregation and queries."""
+
+import asyncio
+import contextlib
+import socket
+import threading
+
+import pytest
+
+import collector as clt
+
+
+def test_parse():
+    data = (clt.encode_binary('a', '10.0.0.1', '192.0.2.1', 1.0) +
+            clt.encode_json('b', '10.0.0.2', '2001:db8::1', 2.0) +
+            b'?192.0.2.1\n?not-an-ip\n{"private": "x"}\n' +
+            clt.encode_json('c', None, None, 3.0)[:-5])
+    reports, queries, offset, invalid = clt.parse(data)
+    assert reports == [(1.0, 'a', '10.0.0.1', '192.0.2.1'),
+                       (2.0, 'b', '10.0.0.2', '2001:db8::1')]
+    assert queries == ['192.0.2.1', None]
+    assert invalid == 2
+    assert data[offset:] == clt.encode_json('c', None, None, 3.0)[:-5]
+
+
+@pytest.fixture
+def collector(tmp_path):
+    server = clt.Collector(clt.Store(str(tmp_path / 'reports.db')))
+    yield server
+    server.close()
+
+
+def test_aggregate(collector):
+    collector.add([(2.0, 'a', '10.0.0.1', '192.0.2.1'),
+                   (1.0, 'a', '10.0.0.9', '192.0.2.9'),  # older, ignored
+                   (2.0, 'b', '10.0.0.2', '192.0.2.1'),
+                   (3.0, 'b', '10.0.0.2', '192.0.2.2')])
+    assert collector.hosts_behind('192.0.2.1') == [('a', 2.0, '10.0.0.1')]
+    assert collector.hosts_behind('192.0.2.2') == [('b', 3.0, '10.0.0.2')]
+    assert collector.hosts_behind('192.0.2.9') == []
+    assert collector.stats['reports'] == 4
+    assert collector.stats['changes'] == 3
+    collector.flush()
+    collector.writer.submit(lambda: None).result()
+    # The store keeps the changes, a new collector starts from them
+    restarted = clt.Collector(collector.store)
+    assert restarted.latest == collector.latest
+
+
+@pytest.fixture
+def serving(collector):
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(collector.serve('127.0.0.1', 0))
+
+    def run():
+        with contextlib.suppress(asyncio.CancelledError):
+            loop.run_until_complete(task)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    collector.ready.wait()
+    yield collector
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join()
+    loop.close()
+
+
+def test_query(serving):
+    clt.send_report('127.0.0.1', serving.port, tcp=True,
+                    ips={'private': '10.0.0.1', 'public': '192.0.2.1'})
+    hosts = clt.query('127.0.0.1', '192.0.2.1', serving.port)
+    assert [host['host'] for host in hosts] == [socket.gethostname()]
+    assert clt.query('127.0.0.1', '192.0.2.2', serving.port) == []
+
+
+def test_invalid_query(serving):
+    with pytest.raises(ValueError):
+        clt.query('127.0.0.1', 'not-an-ip', serving.port)
+
+
+def test_query_timeout():
+    with socket.create_server(('127.0.0.1', 0)) as silent:
+        with pytest.raises(OSError):
+            clt.query('127.0.0.1', '192.0.2.1', silent.getsockname()[1],
+                      timeout=0.2)
@@ -0,0 +1,171 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the RFC 2136 updates, against a stub authoritative server."""
+
+import base64
+import ipaddress
+import socketserver
+import struct
+import threading
+
+import pytest
+
+import ddns
+
+KEY = ddns.TsigKey('ipaddresses.', b'0123456789abcdef0123456789abcdef')
+ZONE = 'example.com'
+NAMES = ['a.example.com', 'b.example.com']
+
+
+class StubServer(socketserver.ThreadingTCPServer):
+    """Minimal authoritative server: checks the TSIG of UPDATE messages
+    and applies them to records {(name, type): address}.
+
+    Only RRset deletions and A/AAAA additions are supported.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, key, address=('127.0.0.1', 0)):
+        self.key = key
+        self.records = {}
+        self.messages = 0
+        super().__init__(address, StubHandler)
+
+    def apply(self, message):
+        """Apply the update section of message, return the RCODE."""
+        header = ddns.HEADER.unpack_from(message)
+        if header[1] >> 11 != ddns.OPCODE_UPDATE or header[2] != 1:
+            return ddns.RCODES.index('FORMERR')
+        offset = ddns.skip_name(message, ddns.HEADER.size) + 4
+        for _ in range(header[4]):
+            end = ddns.skip_name(message, offset)
+            name = ddns.decode_name(message[offset:end])
+            rtype, rclass, _, size = ddns.RR.unpack_from(message, end)
+            rdata = message[end + ddns.RR.size:end + ddns.RR.size + size]
+            offset = end + ddns.RR.size + size
+            if rclass == ddns.CLASS_ANY:
+                self.records.pop((name, rtype), None)
+            elif rclass == ddns.CLASS_IN:
+                self.records[(name, rtype)] = str(ipaddress.ip_address(
+                    rdata))
+        self.messages += 1
+        return 0
+
+
+class StubHandler(socketserver.BaseRequestHandler):
+    """Answers the length-prefixed messages of one connection."""
+
+    def handle(self):
+        """Verify, apply and answer every message."""
+        stream = self.request.makefile('rb')
+        while True:
+            size = stream.read(2)
+            if len(size) < 2:
+                return
+            request = stream.read(struct.unpack('>H', size)[0])
+            try:
+                message, mac = self.server.key.verify(request)
+                rcode = self.server.apply(message)
+            except (ddns.UpdateError, IndexError, struct.error):
+                # Unsigned header-only answer
+                message, mac = request[:ddns.HEADER.size], b''
+                rcode = ddns.RCODES.index('NOTAUTH')
+            header = list(ddns.HEADER.unpack_from(message))
+            # Response: QR bit, same opcode, zone section only
+            header[1] = 0x8000 | header[1] & 0x7800 | rcode
+            end = ddns.HEADER.size
+            if mac:
+                end = ddns.skip_name(message, end) + 4
+            else:
+                header[2] = 0
+            header[3:] = 0, 0, 0
+            response = ddns.HEADER.pack(*header) + message[
+                ddns.HEADER.size:end]
+            if mac:
+                response = self.server.key.sign(response, mac)[0]
+            self.request.sendall(struct.pack('>H', len(response)) +
+                                 response)
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(KEY)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+
+def updater(server, cache_file, key=KEY):
+    """Return an Updater of ZONE on the stub server."""
+    return ddns.Updater('127.0.0.1', ZONE, key, cache_file=str(cache_file),
+                        port=server.server_address[1])
+
+
+def test_only_changes_sent_batched(server, tmp_path):
+    cache_file = tmp_path / 'cache.json'
+    publisher = updater(server, cache_file)
+    try:
+        assert publisher.update(dict.fromkeys(NAMES, '192.0.2.1')) == NAMES
+        assert server.messages == 1  # both names in one UPDATE
+        assert publisher.update(dict.fromkeys(NAMES, '192.0.2.1')) == []
+        assert publisher.update({NAMES[0]: '192.0.2.1',
+                                 NAMES[1]: '192.0.2.2'}) == [NAMES[1]]
+        assert publisher.update({NAMES[0]: '2001:db8::1'}) == [NAMES[0]]
+        assert server.messages == 3
+    finally:
+        publisher.close()
+    assert server.records == {(NAMES[0], ddns.TYPE_A): '192.0.2.1',
+                              (NAMES[1], ddns.TYPE_A): '192.0.2.2',
+                              (NAMES[0], ddns.TYPE_AAAA): '2001:db8::1'}
+
+    # The cache outlives the updater
+    again = updater(server, cache_file)
+    try:
+        assert again.update({NAMES[1]: '192.0.2.2'}) == []
+    finally:
+        again.close()
+    assert server.messages == 3
+
+
+def test_bad_key_notauth(server, tmp_path):
+    wrong = updater(server, tmp_path / 'cache.json',
+                    ddns.TsigKey(KEY.name, b'wrong secret'))
+    try:
+        with pytest.raises(ddns.UpdateError, match='NOTAUTH'):
+            wrong.update({NAMES[0]: '192.0.2.1'})
+    finally:
+        wrong.close()
+    assert server.records == {}
+    assert not (tmp_path / 'cache.json').exists()
+
+
+def test_parse_key():
+    secret = base64.b64encode(b'secret').decode('ascii')
+    key = ddns.TsigKey.parse('hmac-sha512:ipaddresses.:' + secret)
+    assert (key.algorithm, key.name, key.secret) == \
+        ('hmac-sha512', 'ipaddresses.', b'secret')
+    assert ddns.TsigKey.parse('name:' + secret).algorithm == \
+        ddns.DEFAULT_ALGORITHM
+
+
+@pytest.mark.parametrize('text', ['name', 'a:b:c:d', ':c2VjcmV0',
+                                  'name:not base64!', 'hmac-md5:n:c2VjcmV0'])
+def test_parse_malformed_key(text):
+    with pytest.raises(ValueError):
+        ddns.TsigKey.parse(text)
@@ -0,0 +1,69 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the address history."""
+
+import os
+
+import history as hst
+import shared as shrd
+
+
+def write_history(path, count):
+    """Write count changes, one per second from 1000 s."""
+    with hst.History(path) as history:
+        for number in range(count):
+            history.append({shrd.PRIVATE: f'10.0.{number // 256}.'
+                            f'{number % 256}', shrd.PUBLIC: '192.0.2.1'},
+                           1000 + number)
+
+
+def test_query(tmp_path):
+    path = str(tmp_path / 'history')
+    write_history(path, 3 * hst.INDEX_EVERY)
+    with hst.History(path) as history:
+        assert history.at(999) is None
+        assert history.at(1000.5) == (1000, '10.0.0.0', '192.0.2.1')
+        assert history.query(5000.5, 5002) == [
+            (5000, '10.0.15.160', '192.0.2.1'),
+            (5001, '10.0.15.161', '192.0.2.1'),
+            (5002, '10.0.15.162', '192.0.2.1')]
+
+
+def test_readonly_writes_nothing(tmp_path):
+    path = str(tmp_path / 'notes.txt')
+    with open(path, 'w') as f_out:
+        f_out.write('not a history\n' * 10)
+    with hst.History(path, readonly=True) as history:
+        assert history.count == 140 // hst.RECORD.size
+        history.query()
+    with open(path) as f_in:
+        assert f_in.read() == 'not a history\n' * 10
+    assert not os.path.exists(path + hst.INDEX_SUFFIX)
+
+
+def test_readonly_partial_record_and_stale_index(tmp_path):
+    path = str(tmp_path / 'history')
+    write_history(path, hst.INDEX_EVERY + 10)
+    os.remove(path + hst.INDEX_SUFFIX)
+    with open(path, 'ab') as f_out:
+        f_out.write(b'partial')  # being appended
+    size = os.path.getsize(path)
+    with hst.History(path, readonly=True) as history:
+        assert history.count == hst.INDEX_EVERY + 10
+        assert history.at(1000 + hst.INDEX_EVERY + 9.5)[0] == \
+            1000 + hst.INDEX_EVERY + 9
+    assert os.path.getsize(path) == size
+    assert not os.path.exists(path + hst.INDEX_SUFFIX)
@@ -0,0 +1,144 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the change hooks, against a local HTTP sink."""
+
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import hooks
+import shared as shrd
+
+STATES = [{shrd.PRIVATE: '10.0.0.2', shrd.PUBLIC: f'192.0.2.{number}'}
+          for number in range(1, 4)]
+
+
+class SinkHandler(http.server.BaseHTTPRequestHandler):
+    """Records the JSON posted, answers the status of the server."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers[
+            'Content-Length'])))
+        self.server.posts.append((self.path, body))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sink():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SinkHandler)
+    server.posts = []
+    server.status = 204
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/hook?id=1'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class SlowHook(hooks.Hook):
+    """Records the deliveries, each lasting delay seconds."""
+
+    running = 0
+    most_running = 0
+
+    def __init__(self, name, delay, **kwargs):
+        super().__init__(name, **kwargs)
+        self.delay = delay
+        self.delivered = []
+
+    async def run(self, state):
+        SlowHook.running += 1
+        SlowHook.most_running = max(SlowHook.most_running, SlowHook.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            SlowHook.running -= 1
+        self.delivered.append(state)
+
+
+def test_hook_is_abstract():
+    with pytest.raises(TypeError):
+        hooks.Hook('base')
+
+
+def test_webhook(sink):
+    dispatcher = hooks.Dispatcher([hooks.WebHook(sink.url)])
+    dispatcher.submit(STATES[0])
+    dispatcher.close()
+    [(path, body)] = sink.posts
+    assert path == '/hook?id=1'
+    assert body[shrd.PRIVATE] == '10.0.0.2'
+    assert body[shrd.PUBLIC] == '192.0.2.1'
+    assert dispatcher.stats[sink.url]['delivered'] == 1
+
+
+def test_webhook_error_status(sink, capsys):
+    sink.status = 500
+    dispatcher = hooks.Dispatcher([hooks.WebHook(sink.url)])
+    dispatcher.submit(STATES[0])
+    dispatcher.close()
+    assert dispatcher.stats[sink.url]['failed'] == 1
+    assert 'HTTP 500' in capsys.readouterr().err
+
+
+def test_coalesced_in_order():
+    hook = SlowHook('slow', 0.2)
+    dispatcher = hooks.Dispatcher([hook], concurrency=4)
+    dispatcher.submit(STATES[0])
+    time.sleep(0.05)  # delivering the first state
+    dispatcher.submit(STATES[1])
+    dispatcher.submit(STATES[2])
+    dispatcher.close()
+    assert hook.delivered == [STATES[0], STATES[2]]
+    assert dispatcher.stats['slow']['coalesced'] == 1
+
+
+def test_concurrency():
+    SlowHook.most_running = 0
+    slow_hooks = [SlowHook(str(number), 0.1) for number in range(4)]
+    dispatcher = hooks.Dispatcher(slow_hooks, concurrency=2)
+    dispatcher.submit(STATES[0])
+    dispatcher.close()
+    assert SlowHook.most_running == 2
+    assert all(hook.delivered == [STATES[0]] for hook in slow_hooks)
+
+
+def test_timeout(capsys):
+    hook = SlowHook('slow', 10, timeout=0.05)
+    dispatcher = hooks.Dispatcher([hook])
+    dispatcher.submit(STATES[0])
+    dispatcher.close()
+    assert dispatcher.stats['slow']['timeouts'] == 1
+    assert hook.delivered == []
+    assert 'slow: timeout' in capsys.readouterr().err
+
+
+def test_script_hook(tmp_path):
+    path = tmp_path / 'out'
+    command = f'echo "$IPADDRESSES_PRIVATE $IPADDRESSES_PUBLIC" > {path}'
+    dispatcher = hooks.Dispatcher([hooks.ScriptHook(command)])
+    dispatcher.submit(STATES[0])
+    dispatcher.close()
+    assert path.read_text() == '10.0.0.2 192.0.2.1\n'
@@ -0,0 +1,51 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the interface sampler."""
+
+import ifstats
+
+HEADER = ('Inter-|   Receive                                                '
+          '|  Transmit\n'
+          ' face |bytes    packets errs drop fifo frame compressed multicast'
+          '|bytes    packets errs drop fifo colls carrier compressed\n')
+
+
+def write(path, counters):
+    """Write a /proc/net/dev of {name: (rx bytes, tx bytes)}, the counters
+    of the first interface joined to its name like large ones are."""
+    lines = [HEADER]
+    for number, (name, (rx, tx)) in enumerate(counters.items()):
+        separator = ':' if number == 0 else ': '
+        lines.append(f'{name:>6}{separator}{rx} 10 0 0 0 0 0 0 '
+                     f'{tx} 10 0 0 0 0 0 0\n')
+    path.write_text(''.join(lines), encoding='ascii')
+
+
+def test_rates(tmp_path):
+    path = tmp_path / 'dev'
+    write(path, {'eth0': (123456789, 1000), 'lo': (0, 0)})
+    sampler = ifstats.Sampler(rate=1.0, window=10.0, path=str(path))
+    try:
+        sampler.sample(0.0)
+        write(path, {'eth0': (123457789, 3000), 'lo': (0, 0)})
+        sampler.sample(1.0)
+        report = sampler.report()
+    finally:
+        sampler.close()
+    assert sorted(report) == ['eth0', 'lo']
+    assert report['eth0']['rx'] == 1000.0
+    assert report['eth0']['tx'] == 2000.0
+    assert report['lo'] == ifstats.IDLE
@@ -0,0 +1,57 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the message catalogs."""
+
+import modulefinder
+import os
+
+import pytest
+
+import localization as lcl
+import messages_en
+import messages_pt
+
+MODULE_DIR = os.path.dirname(lcl.__file__)
+
+
+def messages(module):
+    """Return the message names a catalog module defines itself."""
+    return {name for name in vars(module) if name.isupper()}
+
+
+def test_catalogs_complete():
+    english = messages(messages_en)
+    assert english
+    assert messages(messages_pt) == english
+
+
+def test_catalogs_found_by_freezers():
+    finder = modulefinder.ModuleFinder(path=[MODULE_DIR])
+    finder.run_script(os.path.join(MODULE_DIR, 'localization.py'))
+    assert {f'messages_{code}' for code in lcl.LANGUAGES} <= \
+        finder.modules.keys()
+
+
+@pytest.mark.parametrize('environment, lang', [
+    ({'LANG': 'pt_PT.UTF-8'}, 'PT'),
+    ({'LANGUAGE': 'fr:pt', 'LANG': 'en_US.UTF-8'}, 'PT'),
+    ({'LC_ALL': 'de_DE.UTF-8', 'LANG': 'pt_PT.UTF-8'}, 'EN')])
+def test_sys_lang(monkeypatch, environment, lang):
+    for var in lcl.LANG_VARS:
+        monkeypatch.delenv(var, raising=False)
+    for var, value in environment.items():
+        monkeypatch.setenv(var, value)
+    assert lcl.sys_lang() == lang
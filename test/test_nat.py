@@ -0,0 +1,83 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the NAT diagnosis, against the stub STUN server."""
+
+import asyncio
+import contextlib
+import itertools
+
+import pytest
+
+import nat
+import stubs
+
+BEHAVIOURS = [nat.ENDPOINT_INDEPENDENT, nat.ADDRESS_DEPENDENT,
+              nat.ADDRESS_PORT_DEPENDENT]
+
+
+def diagnose(behaviour):
+    """Return the diagnosis behind a NAT of one mapping and filtering
+    behaviour, or without a NAT for None."""
+    emulated = None if behaviour is None else (behaviour, behaviour, 60)
+    with stubs.StunServer(nat=emulated) as server:
+        return asyncio.run(nat.diagnose(*server.address))
+
+
+def test_no_nat():
+    result = diagnose(None)
+    assert not result['nat']
+    assert result['mapped'] == result['local']
+    assert result['mapping'] == nat.NO_NAT
+
+
+def test_open():
+    result = diagnose(nat.ENDPOINT_INDEPENDENT)
+    assert result['nat']
+    assert result['mapped'][0] == stubs.StunServer.EXTERNAL_IP
+    assert result['mapping'] == nat.ENDPOINT_INDEPENDENT
+    assert result['filtering'] == nat.ENDPOINT_INDEPENDENT
+
+
+def test_every_behaviour():
+    # Every mapping and filtering pair, diagnosed at the same time (the
+    # filtered requests take the whole timeout)
+    pairs = list(itertools.product(BEHAVIOURS, repeat=2))
+    with contextlib.ExitStack() as stack:
+        servers = [stack.enter_context(stubs.StunServer(nat=(*pair, 60)))
+                   for pair in pairs]
+
+        async def diagnose_all():
+            return await asyncio.gather(*(nat.diagnose(*server.address)
+                                          for server in servers))
+
+        results = asyncio.run(diagnose_all())
+    assert [(result['mapping'], result['filtering'])
+            for result in results] == pairs
+
+
+def test_binding_lifetime(monkeypatch):
+    monkeypatch.setattr(nat, 'LIFETIME_PROBES', (0.2, 0.6))
+    with stubs.StunServer(nat=(nat.ENDPOINT_INDEPENDENT,
+                               nat.ENDPOINT_INDEPENDENT, 0.4)) as server:
+        result = asyncio.run(nat.diagnose(*server.address, lifetime=1.0))
+    assert result['lifetime'] == (0.2, 0.6)
+
+
+def test_no_answer():
+    with stubs.StunServer() as server:
+        address = server.address
+    with pytest.raises(nat.NatError):
+        asyncio.run(nat.diagnose(*address))
@@ -0,0 +1,111 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the network namespace inventory."""
+
+import ipaddress
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import netns
+import shared as shrd
+
+
+def make_proc(tmp_path):
+    """Return (netns_dir, proc_dir) of a fake /proc with two namespaces:
+    pids 1 and 7 plus the name blue in one, pid 42 and red in the other."""
+    netns_dir = tmp_path / 'netns'
+    netns_dir.mkdir()
+    for pid in ['1', '7', '42']:
+        (tmp_path / 'proc' / pid / 'ns').mkdir(parents=True)
+    (tmp_path / 'proc' / 'self').mkdir()  # not a pid
+    (tmp_path / 'proc' / '7' / 'ns' / 'net').touch()
+    os.link(tmp_path / 'proc' / '7' / 'ns' / 'net',
+            tmp_path / 'proc' / '1' / 'ns' / 'net')
+    os.link(tmp_path / 'proc' / '7' / 'ns' / 'net', netns_dir / 'blue')
+    (netns_dir / 'red').touch()
+    os.link(netns_dir / 'red', tmp_path / 'proc' / '42' / 'ns' / 'net')
+    return str(netns_dir), str(tmp_path / 'proc')
+
+
+def test_find_namespaces(tmp_path):
+    netns_dir, proc_dir = make_proc(tmp_path)
+    namespaces = netns.find_namespaces(netns_dir, proc_dir)
+    blue = os.stat(os.path.join(netns_dir, 'blue')).st_ino
+    red = os.stat(os.path.join(netns_dir, 'red')).st_ino
+    assert namespaces == {
+        blue: {'path': os.path.join(netns_dir, 'blue'), 'names': ['blue'],
+               'pids': [1, 7]},
+        red: {'path': os.path.join(netns_dir, 'red'), 'names': ['red'],
+              'pids': [42]}}
+
+
+def test_namespace_ips(tmp_path, monkeypatch):
+    entered = []
+    monkeypatch.setattr(netns, 'setns', lambda fd, nstype: entered.append(
+        (os.readlink(f'/proc/self/fd/{fd}'), nstype)))
+    monkeypatch.setattr(shrd, 'get_interface_ips', lambda: {
+        'eth0': [ipaddress.ip_interface('10.0.0.2/24')]})
+    path = tmp_path / 'net'
+    path.touch()
+    assert netns.namespace_ips(str(path)) == ({'eth0': ['10.0.0.2/24']},
+                                              None)
+    assert entered == [(str(path), netns.CLONE_NEWNET)]
+
+
+def test_namespace_ips_error(tmp_path, monkeypatch):
+    def setns(fd, nstype):
+        raise PermissionError(1, 'Operation not permitted')
+
+    monkeypatch.setattr(netns, 'setns', setns)
+    path = tmp_path / 'net'
+    path.touch()
+    assert netns.namespace_ips(str(path)) == (
+        {}, 'PermissionError: [Errno 1] Operation not permitted')
+    assert netns.namespace_ips(str(tmp_path / 'gone'))[1].startswith(
+        'FileNotFoundError')
+
+
+def can_unshare():
+    """Return True if a network namespace can be created here."""
+    if shutil.which('unshare') is None or shutil.which('ip') is None:
+        return False
+    return subprocess.run(['unshare', '--net', 'true'],
+                          capture_output=True).returncode == 0
+
+
+@pytest.mark.skipif(not can_unshare(),
+                    reason='cannot create network namespaces')
+def test_inventory_unshare():
+    # A process alone in a new namespace, with only lo up
+    with subprocess.Popen(['unshare', '--net', 'sh', '-c',
+                           'ip link set lo up && echo up && sleep 30'],
+                          stdout=subprocess.PIPE, text=True) as process:
+        try:
+            assert process.stdout.readline() == 'up\n'
+            # unshare execs sh, same pid, inside the namespace
+            path = f'/proc/{process.pid}/ns/net'
+            inode = os.stat(path).st_ino
+            assert inode != os.stat('/proc/self/ns/net').st_ino
+            [namespace] = netns.inventory(
+                {inode: {'path': path, 'names': [], 'pids': [process.pid]}},
+                workers=1)
+        finally:
+            process.kill()
+    assert namespace['error'] is None
+    assert namespace['interfaces'] == {'lo': ['127.0.0.1/8', '::1/128']}
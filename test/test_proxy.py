@@ -0,0 +1,112 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the proxy support, against the stub proxy."""
+
+import http.server
+import shutil
+import threading
+
+import pytest
+
+import proxy as prx
+import ratelimit
+import shared as shrd
+import stubs
+
+
+class EchoHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the client address, keeping the connection open."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.client_address[0].encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def provider():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_proxy(monkeypatch):
+    monkeypatch.setattr(prx, 'POOL', prx.TunnelPool())
+    with stubs.StubProxy() as server:
+        yield server
+    prx.POOL.close()
+
+
+def fetch(url, proxy=None):
+    return shrd.get_public_ip(url, proxy=proxy,
+                              bucket=ratelimit.TokenBucket())
+
+
+def test_absolute_uri(provider, stub_proxy):
+    assert fetch(provider.url, stub_proxy.url) == '127.0.0.2'
+    assert stub_proxy.requests == [('GET', provider.url)]
+    assert stub_proxy.stats['tunnels'] == 0
+
+
+def test_pooled_connection(provider, stub_proxy):
+    for _ in range(3):
+        assert fetch(provider.url, stub_proxy.url) == '127.0.0.2'
+    assert stub_proxy.stats['forwarded'] == 3
+    assert prx.POOL.stats == {'opened': 1, 'reused': 2}
+
+
+@pytest.fixture(scope='module')
+def certfile(tmp_path_factory):
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl not found')
+    return stubs.make_certificate(str(tmp_path_factory.mktemp('tls')))
+
+
+def test_pooled_tunnel(certfile, stub_proxy, monkeypatch):
+    # Trusted by the default context of the tunneled connections
+    monkeypatch.setenv('SSL_CERT_FILE', certfile)
+    with stubs.StubProvider(certfile=certfile) as provider:
+        for _ in range(2):
+            assert fetch(provider.url, stub_proxy.url) == '127.0.0.2'
+    assert stub_proxy.requests == [
+        ('CONNECT', f'127.0.0.1:{provider.server_address[1]}')]
+    assert stub_proxy.stats['tunnels'] == 1
+    assert prx.POOL.stats == {'opened': 1, 'reused': 1}
+
+
+def test_proxy_path_only(provider, stub_proxy, monkeypatch):
+    monkeypatch.setattr(prx, 'PROXY', stub_proxy.url)
+    assert shrd.get_public_ip_paths(provider.url) == {'proxy': '127.0.0.2'}
+    assert shrd.get_public_ip_paths(provider.url, direct=True) == {
+        'proxy': '127.0.0.2', 'direct': '127.0.0.1'}
+
+
+def test_no_proxy(provider, monkeypatch):
+    monkeypatch.setattr(prx, 'PROXY', '')
+    assert shrd.get_public_ip_paths(provider.url, direct=True) == {
+        'direct': '127.0.0.1'}
@@ -0,0 +1,71 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the provider rate limiting, with a fleet against a stub."""
+
+import email.utils
+import random
+
+import pytest
+
+import ratelimit
+import stubs
+
+FLEET_HOSTS = 20
+FLEET_RATE = 20
+FLEET_BURST = 5
+FLEET_WINDOW = 2.0
+
+
+def test_fleet_splay():
+    throttled = {}
+    for window in [0.0, FLEET_WINDOW]:
+        with stubs.StubProvider(FLEET_RATE, FLEET_BURST) as provider:
+            failures, _ = stubs.run_fleet(provider.url, FLEET_HOSTS, window)
+        assert failures == []
+        assert provider.stats['served'] == FLEET_HOSTS
+        throttled[window] = provider.stats['throttled']
+    assert throttled[FLEET_WINDOW] < throttled[0.0]
+
+
+def test_start_offset():
+    offsets = [ratelimit.start_offset(60, f'host{number}')
+               for number in range(100)]
+    assert all(0 <= offset < 60 for offset in offsets)
+    assert offsets == [ratelimit.start_offset(60, f'host{number}')
+                       for number in range(100)]
+    assert len(set(offsets)) == 100
+
+
+def test_token_bucket():
+    bucket = ratelimit.TokenBucket(rate=10, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5, abs=0.1)
+
+
+def test_backoff():
+    backoff = ratelimit.Backoff(base=1, cap=30, rnd=random.Random(0))
+    delays = [backoff.next() for _ in range(20)]
+    assert all(1 <= delay <= 30 for delay in delays)
+    assert max(delays) == 30
+
+
+@pytest.mark.parametrize('value, seconds', [
+    (None, 0), ('', 0), ('7', 7), ('-3', 0), ('soon', 0),
+    (email.utils.formatdate(1000 + 42, usegmt=True), 42)])
+def test_retry_after(value, seconds):
+    assert ratelimit.retry_after(value, now=1000) == seconds
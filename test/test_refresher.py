@@ -0,0 +1,99 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the background refresh of the addresses."""
+
+import http.server
+import threading
+import time
+
+import pytest
+
+import ratelimit
+import refresher
+import shared as shrd
+
+
+class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+    """Answers 503 with a long Retry-After."""
+
+    def do_GET(self):
+        self.send_response(503)
+        self.send_header('Retry-After', '20')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def private_ip(monkeypatch):
+    monkeypatch.setattr(shrd, 'get_private_ip', lambda: '10.0.0.2')
+
+
+def test_stop_during_backoff(private_ip):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    ratelimit.BUCKETS.pop(f'127.0.0.1:{server.server_address[1]}', None)
+    try:
+        service = refresher.Refresher(url=url).start()
+        time.sleep(0.2)  # retrying after 20 s
+        start = time.monotonic()
+        service.stop()
+        assert time.monotonic() - start < 1
+        assert not service.thread.is_alive()
+        assert service.snapshot is refresher.EMPTY
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_trigger_during_refresh_kept(private_ip, monkeypatch):
+    fetched = []
+    in_refresh = threading.Event()
+    resume = threading.Event()
+
+    def get_public_ip(url=None, stop=None):
+        fetched.append(time.monotonic())
+        if len(fetched) == 1:
+            in_refresh.set()
+            resume.wait(5)
+        return '192.0.2.1'
+
+    monkeypatch.setattr(shrd, 'get_public_ip', get_public_ip)
+    with refresher.Refresher(interval=60) as service:
+        assert in_refresh.wait(5)
+        service.trigger()  # while the first refresh runs
+        resume.set()
+        deadline = time.monotonic() + 5
+        while len(fetched) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(fetched) == 2
+    assert service.snapshot.public == '192.0.2.1'
+    assert service.snapshot.error is None
+
+
+def test_wait_and_age(private_ip, monkeypatch):
+    monkeypatch.setattr(shrd, 'get_public_ip',
+                        lambda url=None, stop=None: '192.0.2.1')
+    with refresher.Refresher() as service:
+        snapshot = service.wait(5)
+    assert (snapshot.private, snapshot.public) == ('10.0.0.2', '192.0.2.1')
+    assert snapshot.age(now=snapshot.public_time + 30) == 30
+    assert snapshot.stale(10, now=snapshot.public_time + 30)
+    assert refresher.EMPTY.age() == float('inf')
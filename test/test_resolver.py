@@ -0,0 +1,166 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the asyncio resolver, against the stub name server."""
+
+import asyncio
+import ipaddress
+import multiprocessing
+import socket
+import threading
+import time
+
+import pytest
+
+import resolver
+import stubs
+
+
+@pytest.fixture(scope='module')
+def port():
+    receiver, sender = multiprocessing.Pipe()
+    threading.Thread(target=stubs.serve_dns, args=(0, sender),
+                     daemon=True).start()
+    return receiver.recv()
+
+
+def run(port, coroutine_function, **kwargs):
+    """Return coroutine_function(res) of a Resolver of the stub, and the
+    resolver's stats."""
+    async def main():
+        async with resolver.Resolver(['127.0.0.1'], port, **kwargs) as res:
+            return await coroutine_function(res), res.stats
+    return asyncio.run(main())
+
+
+def test_resolve(port):
+    addresses, stats = run(port, lambda res: res.resolve('www.example.com'))
+    assert [ipaddress.ip_address(address).version
+            for address in addresses] == [4, 6]
+    assert all(ipaddress.ip_address(address).is_global
+               for address in addresses)
+    assert stats['queries'] == 2
+    addresses, _ = run(port, lambda res: res.resolve('lan.example.com'))
+    assert all(ipaddress.ip_address(address).is_private
+               for address in addresses)
+
+
+def test_nxdomain_cached(port):
+    async def twice(res):
+        first = await res.resolve('nx.example.com')
+        queries = res.stats['queries']
+        second = await res.resolve('NX.example.com.')
+        return first, second, queries
+
+    (first, second, queries), stats = run(port, twice)
+    assert first == second == []
+    assert queries == stats['queries'] == 2
+    assert stats['cached'] == 2
+
+
+def test_cache_hits(port):
+    async def twice(res):
+        return (await res.resolve('www.example.org'),
+                await res.resolve('www.example.org'))
+
+    (first, second), stats = run(port, twice)
+    assert first == second
+    assert stats['queries'] == 2
+    assert stats['cached'] == 2
+
+
+def test_truncated_over_tcp(port):
+    addresses, stats = run(port, lambda res: res.resolve('big.example.com'))
+    assert len(addresses) == 2
+    assert stats['tcp'] == 2
+
+
+def test_timeout():
+    # A name server that never answers
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind(('127.0.0.1', 0))
+        start = time.monotonic()
+        with pytest.raises(resolver.ResolveError):
+            run(silent.getsockname()[1],
+                lambda res: res.resolve('www.example.com'),
+                timeout=0.2, attempts=2)
+        seconds = time.monotonic() - start
+    # A and AAAA at once, each timing out twice
+    assert 0.4 <= seconds < 1.0
+
+
+def test_late_answer_dropped():
+    # A name server answering first for another name with the query's id,
+    # like a late answer to a timed out query that had the same id
+    def serve(sock):
+        query, client = sock.recvfrom(512)
+        other = resolver.build_query(int.from_bytes(query[:2], 'big'),
+                                     'nx.example.com', 1)
+        sock.sendto(stubs.dns_answer(other), client)
+        sock.sendto(stubs.dns_answer(query), client)
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+        server.bind(('127.0.0.1', 0))
+        threading.Thread(target=serve, args=(server,), daemon=True).start()
+        addresses, stats = run(server.getsockname()[1],
+                               lambda res: res.query('WWW.example.com', 1),
+                               timeout=2, attempts=1)
+    assert len(addresses) == 1
+    assert stats['mismatched'] == 1
+
+
+def test_reverse(port):
+    async def names(res):
+        return [await res.reverse(address)
+                for address in ['198.51.100.7', '2001:db8::1']]
+
+    result, _ = run(port, names)
+    assert result == ['ip-198-51-100-7.example.net', None]
+
+
+def test_resolve_stream(port):
+    emitted = {}
+
+    def emit(name, addresses, error):
+        emitted[name] = (len(addresses), error)
+
+    names = [f'host{number}.example.com\n' for number in range(100)]
+    run(port, lambda res: res.resolve_stream(names + ['\n', 'nx.example\n'],
+                                             emit, concurrency=8))
+    assert emitted == dict({name.strip(): (2, None) for name in names},
+                           **{'nx.example': (0, None)})
+
+
+def test_reverse_lookup(port):
+    lookup = resolver.ReverseLookup(['127.0.0.1'], port)
+    try:
+        lookup.submit(['192.0.2.1', 'not an address'])
+        lookup.wait(5)
+        assert lookup.name('192.0.2.1') == 'ip-192-0-2-1.example.net'
+        assert lookup.name('not an address') is None
+    finally:
+        lookup.close()
+    assert not lookup.thread.is_alive()
+
+
+def test_read_resolv_conf(tmp_path):
+    path = tmp_path / 'resolv.conf'
+    path.write_text('# comment\nsearch example.com\n'
+                    'nameserver 192.0.2.53\nnameserver fe80::1%eth0\n'
+                    'options timeout:1 attempts:3 rotate\n')
+    assert resolver.read_resolv_conf(str(path)) == (
+        ['192.0.2.53', 'fe80::1'], 1.0, 3)
+    assert resolver.read_resolv_conf(str(tmp_path / 'none')) == (
+        ['127.0.0.1'], resolver.TIMEOUT, resolver.ATTEMPTS)
@@ -0,0 +1,68 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the routing table snapshot against the kernel."""
+
+import ipaddress
+import shutil
+import subprocess
+
+import pytest
+
+import routes
+
+pytestmark = pytest.mark.skipif(shutil.which('ip') is None,
+                                reason='ip (iproute2) is missing')
+
+
+def host_routes():
+    """Return the routes of this host, without multicast ones."""
+    found = []
+    for reader in [routes.read_routes, routes.read_ipv6_routes]:
+        try:
+            found += reader()
+        except OSError:
+            pass
+    return [route for route in found if not route.network.is_multicast]
+
+
+def destination_of(network):
+    """Return an address inside network, not its network address."""
+    if network.num_addresses == 1:
+        return network.network_address
+    return network.network_address + 1
+
+
+def ip_route_get(destination):
+    """Return (source, interface) of `ip route get`, None for local or
+    unreachable destinations."""
+    result = subprocess.run(['ip', '-o', 'route', 'get', str(destination)],
+                            capture_output=True, text=True)
+    words = result.stdout.split()
+    if result.returncode or not words or words[0] != str(destination):
+        return None
+    fields = dict(zip(words[1::], words[2::]))
+    return (ipaddress.ip_address(fields['src'].split('%')[0]),
+            fields['dev'])
+
+
+@pytest.mark.parametrize('route', host_routes(), ids=lambda route: str(
+    route.network))
+def test_lookup_like_ip_route_get(route):
+    destination = destination_of(route.network)
+    expected = ip_route_get(destination)
+    if expected is None:
+        pytest.skip(f'{destination} is local or unreachable')
+    assert routes.RoutingSnapshot.load().source(destination) == expected
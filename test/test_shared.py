@@ -0,0 +1,83 @@
+# Copyright 2009-2015 Joao Carlos Roseta Matos
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the public IP fetch."""
+
+import http.server
+import threading
+import time
+
+import pytest
+
+import ratelimit
+import shared as shrd
+
+TIMEOUT = 0.5
+
+
+class TrickleHandler(http.server.BaseHTTPRequestHandler):
+    """Sends the headers, part of the body just before the timeout, then
+    nothing (server.body_delay seconds) or the rest."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '9')
+        self.end_headers()
+        self.wfile.flush()
+        time.sleep(TIMEOUT * 0.8)
+        self.wfile.write(b'192.0')
+        self.wfile.flush()
+        time.sleep(self.server.body_delay)
+        self.wfile.write(b'.2.1')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(shrd, 'PUBLIC_IP_TIMEOUT', TIMEOUT)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             TrickleHandler)
+    server.daemon_threads = True
+    server.body_delay = 0.0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(url):
+    """Return (address or error, seconds) of one attempt."""
+    start = time.perf_counter()
+    try:
+        result = shrd.get_public_ip(url, attempts=1, proxy='',
+                                    bucket=ratelimit.TokenBucket())
+    except RuntimeError as e:
+        result = e
+    return result, time.perf_counter() - start
+
+
+def test_slow_body(provider):
+    assert fetch(provider.url)[0] == '192.0.2.1'
+
+
+def test_body_deadline(provider):
+    provider.body_delay = 2 * TIMEOUT
+    error, seconds = fetch(provider.url)
+    assert isinstance(error, RuntimeError)
+    # The read after the first bytes only gets the time left
+    assert seconds < TIMEOUT * 1.4